@@ -0,0 +1,46 @@
+import sqlite3
+import os
+
+db_file = 'realmguardian.db'
+
+COLUMNS = {
+    "user_access_tokens": [("account_id", "INTEGER"), ("battletag", "VARCHAR"), ("last_synced_at", "DATETIME"), ("sync_requested_at", "DATETIME")],
+    "characters": [("owner", "INTEGER"), ("last_login", "BIGINT"), ("profile_modified_at", "INTEGER")],
+    "account_gold_history": [("owner", "INTEGER")]
+}
+
+def run_migration():
+    """
+    Adds the columns for several Battle.net accounts. Existing tokens, characters and gold
+    snapshots keep NULL: the token gets its account id on its next sync, the characters their owner.
+    """
+    if not os.path.exists(db_file):
+        print("Database not found.")
+        return
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    try:
+        for table, columns in COLUMNS.items():
+            cursor.execute(f"PRAGMA table_info({table})")
+            existing = [info[1] for info in cursor.fetchall()]
+            for name, kind in columns:
+                if name not in existing:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {kind}")
+                    print(f"Added {name} column to {table}")
+                else:
+                    print(f"{table}.{name} column already exists.")
+        # SQLite cannot add a UNIQUE column; the index enforces one token per account
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_user_access_tokens_account_id ON user_access_tokens (account_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_characters_owner ON characters (owner)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_account_gold_history_owner ON account_gold_history (owner)")
+        conn.commit()
+    except Exception as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,26 @@
+import sqlite3
+import os
+
+db_file = 'realmguardian.db'
+
+def run_migration():
+    """ Adds the (item_id, timestamp) index used by the batched analytics queries to existing databases. """
+    if not os.path.exists(db_file):
+        print("Database not found.")
+        return
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_item_price_history_item_time ON item_price_history (item_id, timestamp)")
+        conn.commit()
+        print("Ensured ix_item_price_history_item_time exists")
+    except Exception as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,31 @@
+import sqlite3
+import os
+
+db_file = 'realmguardian.db'
+
+def run_migration():
+    """ Adds the realm_id column to item_price_history. Older rows keep NULL and count as region-wide. """
+    if not os.path.exists(db_file):
+        print("Database not found.")
+        return
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute("PRAGMA table_info(item_price_history)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if 'realm_id' not in columns:
+            cursor.execute("ALTER TABLE item_price_history ADD COLUMN realm_id INTEGER")
+            conn.commit()
+            print("Added realm_id column to item_price_history")
+        else:
+            print("realm_id column already exists.")
+    except Exception as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,264 @@
+"""
+alerts.py
+Rule-based price alerts, evaluated after every ingestion run.
+Rules are compiled into an index of sorted threshold arrays per item and rule kind, so an
+ingestion run costs one binary search per (item, kind, window) instead of one check per rule:
+every rule on the far side of the observed value fires as one slice of the array.
+
+Rule kinds (threshold in copper for price rules, in percent otherwise):
+- price_below / price_above: current minimum buyout crosses the threshold
+- pct_change: price change over `window_hours`; positive thresholds fire on rises of at least
+  the threshold, negative thresholds on drops of at least its absolute value
+- quantity_drop: listed quantity shrank by at least threshold percent over `window_hours`
+- margin_above: crafting margin of the recipe producing item_id exceeds threshold percent
+
+Firings are deduplicated per rule with a cooldown and handed to a sink ("log", "webhook",
+"stream"); further sinks can be added with register_sink().
+"""
+import threading
+import time
+from collections import namedtuple
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+import requests
+from sqlalchemy import func
+import models
+from config import config
+from analytics import realm_filter
+from liquidity_tracker import liquidity_tracker
+
+RULES_TTL = 60 # Seconds; rules edited through the API reach the worker process after at most this long
+RULE_KINDS = ("price_below", "price_above", "pct_change", "quantity_drop", "margin_above")
+
+# Detached copy of an AlertRule, so the compiled index outlives the session that loaded it
+Rule = namedtuple("Rule", "id item_id kind threshold window_hours cooldown_minutes sink")
+
+
+# --- Sinks ---
+
+class LogSink:
+    def deliver(self, event):
+        print(f"ALERT [{event['kind']}] {event['message']}")
+
+
+class WebhookSink:
+    """ POSTs every event as JSON to ALERT_WEBHOOK_URL (e.g. a local relay or notification bridge). """
+
+    def __init__(self, url=None, timeout=5):
+        self.url = url
+        self.timeout = timeout
+
+    def deliver(self, event):
+        url = self.url or config.alert_webhook_url
+        if not url:
+            print("Alert webhook sink selected but ALERT_WEBHOOK_URL is not set.")
+            return
+        try:
+            requests.post(url, json=event, timeout=self.timeout)
+        except requests.RequestException as e:
+            print(f"Error delivering alert to webhook: {e}")
+
+
+class StreamSink:
+    """
+    Events are evaluated in the worker process, so they cannot be pushed to the API's clients
+    directly; /api/alerts/stream polls the stored events of "stream" rules instead.
+    """
+
+    def deliver(self, event):
+        pass
+
+
+SINKS = {"log": LogSink(), "webhook": WebhookSink(), "stream": StreamSink()}
+
+
+def register_sink(name, sink):
+    """ Adds a delivery target; `sink` needs a deliver(event_dict) method. """
+    SINKS[name] = sink
+
+
+# --- Rule index ---
+
+class ThresholdArray:
+    """ Thresholds of one (item, kind[, window]) group, sorted ascending, with the rule ids alongside. """
+    __slots__ = ("thresholds", "rule_ids")
+
+    def __init__(self, pairs):
+        pairs.sort()
+        self.thresholds = [t for t, _ in pairs]
+        self.rule_ids = [r for _, r in pairs]
+
+    # Rule ids whose threshold is <, <=, > or >= the observed value
+    def lt(self, value):
+        return self.rule_ids[:bisect_left(self.thresholds, value)]
+
+    def le(self, value):
+        return self.rule_ids[:bisect_right(self.thresholds, value)]
+
+    def gt(self, value):
+        return self.rule_ids[bisect_right(self.thresholds, value):]
+
+    def ge(self, value):
+        return self.rule_ids[bisect_left(self.thresholds, value):]
+
+
+class RuleIndex:
+    def __init__(self, rules):
+        self.rules = {r.id: r for r in rules}
+        groups = {}
+        for r in rules:
+            if r.kind in ("pct_change", "quantity_drop"):
+                # Rises and drops are separate arrays so each is a single slice
+                direction = "drop" if r.kind == "pct_change" and r.threshold < 0 else "rise"
+                key = (r.kind, r.item_id, r.window_hours or 24, direction)
+            else:
+                key = (r.kind, r.item_id)
+            groups.setdefault(key, []).append((r.threshold, r.id))
+        self.arrays = {key: ThresholdArray(pairs) for key, pairs in groups.items()}
+        self.windows = {}
+        for key in self.arrays:
+            if key[0] in ("pct_change", "quantity_drop"):
+                self.windows.setdefault(key[2], set()).add(key[1])
+
+
+def _samples_before(db, item_ids, at):
+    """ Latest (buyout, quantity) per Blizzard item id recorded at or before `at`. """
+    tracked = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id)
+                   .filter(models.TrackedItem.item_id.in_(item_ids)).all())
+    if not tracked:
+        return {}
+    latest = db.query(
+        models.ItemPriceHistory.item_id,
+        func.max(models.ItemPriceHistory.timestamp).label("timestamp")
+    ).filter(models.ItemPriceHistory.item_id.in_(tracked))\
+     .filter(models.ItemPriceHistory.timestamp <= at, realm_filter())\
+     .group_by(models.ItemPriceHistory.item_id).subquery()
+    rows = db.query(models.ItemPriceHistory.item_id, models.ItemPriceHistory.buyout, models.ItemPriceHistory.quantity)\
+        .join(latest, (latest.c.item_id == models.ItemPriceHistory.item_id) & (latest.c.timestamp == models.ItemPriceHistory.timestamp))\
+        .filter(realm_filter()).all()
+    return {tracked[pk]: (buyout, quantity) for pk, buyout, quantity in rows}
+
+
+class AlertEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.index = None
+        self.loaded_at = 0
+        self.last_fired = {} # rule id -> datetime
+
+    def invalidate(self):
+        """ Called when rules change; the index is recompiled on the next evaluation. """
+        self.index = None
+
+    def _load(self, db):
+        rows = db.query(models.AlertRule).filter(models.AlertRule.enabled == True).all()
+        self.index = RuleIndex([
+            Rule(r.id, r.item_id, r.kind, r.threshold, r.window_hours, r.cooldown_minutes, r.sink) for r in rows
+        ])
+        self.last_fired = {r.id: r.last_fired_at for r in rows if r.last_fired_at}
+        self.loaded_at = time.monotonic()
+
+    def evaluate(self, db, timestamp, samples):
+        """
+        Checks all enabled rules against one ingestion run and delivers the firings.
+        `samples` maps Blizzard item ids to (price, quantity). Returns the new AlertEvent rows.
+        """
+        with self._lock:
+            if self.index is None or time.monotonic() - self.loaded_at > RULES_TTL:
+                self._load(db)
+            index = self.index
+            if not index.rules:
+                return []
+
+            hits = [] # (rule id, observed value)
+            for item_id, (price, quantity) in samples.items():
+                below = index.arrays.get(("price_below", item_id))
+                if below:
+                    hits.extend((rule_id, price) for rule_id in below.gt(price))
+                above = index.arrays.get(("price_above", item_id))
+                if above:
+                    hits.extend((rule_id, price) for rule_id in above.lt(price))
+
+            # Change rules need the state at the start of their window: one query per distinct window
+            for window, item_ids in index.windows.items():
+                reference = _samples_before(db, item_ids & samples.keys(), timestamp - timedelta(hours=window))
+                for item_id, (old_price, old_quantity) in reference.items():
+                    price, quantity = samples[item_id]
+                    if old_price:
+                        change = (price - old_price) / old_price * 100
+                        rises = index.arrays.get(("pct_change", item_id, window, "rise"))
+                        if rises and change > 0:
+                            hits.extend((rule_id, change) for rule_id in rises.le(change))
+                        drops = index.arrays.get(("pct_change", item_id, window, "drop"))
+                        if drops and change < 0:
+                            hits.extend((rule_id, change) for rule_id in drops.ge(change))
+                    collapses = index.arrays.get(("quantity_drop", item_id, window, "rise"))
+                    if collapses and old_quantity and quantity < old_quantity:
+                        drop = (old_quantity - quantity) / old_quantity * 100
+                        hits.extend((rule_id, drop) for rule_id in collapses.le(drop))
+
+            margin_items = {key[1] for key in index.arrays if key[0] == "margin_above"}
+            if margin_items:
+                costs = liquidity_tracker.crafting_costs(db)
+                for item_id in margin_items:
+                    price = samples[item_id][0] if item_id in samples else liquidity_tracker.prices.get(item_id)
+                    cost = costs.get(item_id)
+                    if not price or not cost:
+                        continue
+                    margin = (price - cost) / cost * 100
+                    hits.extend((rule_id, margin) for rule_id in index.arrays[("margin_above", item_id)].lt(margin))
+
+            events = []
+            for rule_id, value in hits:
+                rule = index.rules[rule_id]
+                last = self.last_fired.get(rule_id)
+                if last and timestamp - last < timedelta(minutes=rule.cooldown_minutes or 0):
+                    continue
+                self.last_fired[rule_id] = timestamp
+                events.append((rule, models.AlertEvent(
+                    rule_id=rule.id, item_id=rule.item_id, kind=rule.kind, threshold=rule.threshold,
+                    value=value, fired_at=timestamp, message=describe(rule, value)
+                )))
+
+        if not events:
+            return []
+        db.add_all([event for _, event in events])
+        db.query(models.AlertRule).filter(models.AlertRule.id.in_([rule.id for rule, _ in events]))\
+            .update({models.AlertRule.last_fired_at: timestamp}, synchronize_session=False)
+        db.commit()
+
+        for rule, event in events:
+            sink = SINKS.get(rule.sink) or SINKS["log"]
+            try:
+                sink.deliver(event_dict(event))
+            except Exception as e:
+                print(f"Error delivering alert {event.id}: {e}")
+        return [event for _, event in events]
+
+
+def describe(rule, value):
+    if rule.kind == "price_below":
+        return f"Item {rule.item_id} is listed at {value / 10000:.2f}g, below {rule.threshold / 10000:.2f}g"
+    if rule.kind == "price_above":
+        return f"Item {rule.item_id} is listed at {value / 10000:.2f}g, above {rule.threshold / 10000:.2f}g"
+    if rule.kind == "pct_change":
+        return f"Item {rule.item_id} price changed {value:+.1f}% over {rule.window_hours}h (threshold {rule.threshold:+.1f}%)"
+    if rule.kind == "quantity_drop":
+        return f"Item {rule.item_id} listed quantity fell {value:.1f}% over {rule.window_hours}h (threshold {rule.threshold:.1f}%)"
+    return f"Crafting margin of item {rule.item_id} is {value:.1f}%, above {rule.threshold:.1f}%"
+
+
+def event_dict(event):
+    return {
+        "id": event.id,
+        "rule_id": event.rule_id,
+        "item_id": event.item_id,
+        "kind": event.kind,
+        "threshold": event.threshold,
+        "value": event.value,
+        "fired_at": event.fired_at.isoformat() if event.fired_at else None,
+        "message": event.message
+    }
+
+
+alert_engine = AlertEngine()
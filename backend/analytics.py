@@ -1,94 +1,229 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from datetime import datetime, timedelta
+from itertools import chain
+import numpy as np
 import models
-from sqlalchemy import func
-
-def get_latest_price(db: Session, item_id: int) -> int:
+from sqlalchemy import func, or_, and_
+from config import config
+from market_index import market_index
+
+def realm_filter(realm_id=None, variant_key=None, region=None):
+    """
+    Price history rows as seen from a connected realm (default: the home realm): its own rows
+    and the region-wide commodity rows, which have no realm. Only the item-level rows (across
+    all variants) unless `variant_key` selects the rows of one variant. A further `region` only
+    has commodity rows.
+    """
+    variant = models.ItemPriceHistory.variant_key.is_(None) if variant_key is None else models.ItemPriceHistory.variant_key == variant_key
+    if region is not None:
+        return and_(models.ItemPriceHistory.region == region, variant)
+    realm_id = realm_id or config.home_realm()
+    return and_(models.ItemPriceHistory.region.is_(None),
+                or_(models.ItemPriceHistory.realm_id.is_(None), models.ItemPriceHistory.realm_id == realm_id), variant)
+
+def get_latest_price(db: Session, item_id: int, realm_id=None, region=None) -> int:
     tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == item_id).first()
     if not tracked:
         return 0
-    latest = db.query(models.ItemPriceHistory).filter(models.ItemPriceHistory.item_id == tracked.id).order_by(models.ItemPriceHistory.timestamp.desc()).first()
+    latest = db.query(models.ItemPriceHistory).filter(models.ItemPriceHistory.item_id == tracked.id, realm_filter(realm_id, region=region))\
+        .order_by(models.ItemPriceHistory.timestamp.desc()).first()
     return latest.buyout if latest else 0
 
-def calculate_liquidity_score(db: Session):
+PRICE_SOURCES = ("min", "market")
+PRICINGS = ("min", "market", "depth") # How reagents are bought, see get_reagent_costs
+
+def price_column(source: str = "min"):
+    """ Price column for a price source: the raw minimum buyout or the robust market value (NULL on old rows). """
+    if source == "market":
+        return func.coalesce(models.ItemPriceHistory.market_value, models.ItemPriceHistory.buyout)
+    return models.ItemPriceHistory.buyout
+
+def get_latest_prices(db: Session, item_ids, source: str = "min", realm_id=None, region=None) -> dict:
+    """
+    Batch version of get_latest_price: maps every Blizzard item id to its latest recorded price (0 if unknown).
+    `source` selects the minimum buyout ("min") or the market value ("market").
+    """
+    if source not in PRICE_SOURCES:
+        raise ValueError(f"Unknown price source {source!r}")
+    item_ids = set(item_ids)
+    if not item_ids:
+        return {}
+    tracked = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id)
+                   .filter(models.TrackedItem.item_id.in_(item_ids)).all())
+
+    rows = []
+    if tracked:
+        latest = db.query(
+            models.ItemPriceHistory.item_id,
+            func.max(models.ItemPriceHistory.timestamp).label("timestamp")
+        ).filter(models.ItemPriceHistory.item_id.in_(tracked), realm_filter(realm_id, region=region))\
+         .group_by(models.ItemPriceHistory.item_id).subquery()
+
+        rows = db.query(models.ItemPriceHistory.item_id, price_column(source))\
+            .join(latest, (latest.c.item_id == models.ItemPriceHistory.item_id) & (latest.c.timestamp == models.ItemPriceHistory.timestamp))\
+            .filter(realm_filter(realm_id, region=region)).all()
+
+    prices = {item_id: 0 for item_id in item_ids}
+    prices.update({tracked[pk]: buyout for pk, buyout in rows})
+    return prices
+
+def get_measured_sell_through(db: Session, tracked_ids, start_time: datetime) -> dict:
+    """
+    Daily sell-through rates from the auction-level diffs (see auction_diff.py) since `start_time`,
+    keyed by the tracked item's internal id. Items without enough recorded intervals are left out.
+    """
+    rows = db.query(
+        models.ItemSellThrough.item_id,
+        func.sum(models.ItemSellThrough.sold_units),
+        func.min(models.ItemSellThrough.interval_start),
+        func.max(models.ItemSellThrough.interval_end)
+    ).filter(models.ItemSellThrough.item_id.in_(tracked_ids))\
+     .filter(models.ItemSellThrough.interval_start >= start_time)\
+     .group_by(models.ItemSellThrough.item_id).all()
+
+    rates = {}
+    for tracked_id, sold, first_start, last_end in rows:
+        if sold is None or not first_start or not last_end:
+            continue
+        # A few intervals are too little to extrapolate a daily rate from
+        covered_days = (last_end - first_start).total_seconds() / 86400
+        if covered_days < 0.25:
+            continue
+        rates[tracked_id] = sold / covered_days
+    return rates
+
+def get_reagent_costs(db: Session, requests, pricing: str = "min", realm_id=None, region=None):
+    """
+    Prices a list of (item_id, quantity) purchases in one go.
+    - "min": every unit at the latest recorded minimum price of the item.
+    - "market": every unit at the latest recorded market value of the item.
+    - "depth": walks the price levels of the current market snapshot, so large batches pay
+      for the more expensive auctions once the cheapest ones are used up. Items missing
+      from the snapshot fall back to the "min" price.
+    Returns a list of (total_cost, filled_quantity) aligned with `requests`; prices are those of
+    `realm_id` (default: the home realm) or of the commodities of a further `region`.
+    """
+    if pricing not in PRICINGS:
+        raise ValueError(f"Unknown pricing {pricing!r}")
+    if not requests:
+        return []
+
+    if pricing == "depth":
+        snapshot = market_index.view(realm_id, region)
+        costs, filled = snapshot.quote_many([r[0] for r in requests], [r[1] for r in requests])
+        missing = [item_id for item_id, _ in requests if not snapshot.contains(item_id)]
+        fallback = get_latest_prices(db, missing, realm_id=realm_id, region=region)
+        results = []
+        for (item_id, quantity), cost, fill in zip(requests, costs.tolist(), filled.tolist()):
+            if item_id in fallback:
+                cost, fill = fallback[item_id] * quantity, quantity
+            results.append((cost, fill))
+        return results
+
+    prices = get_latest_prices(db, [item_id for item_id, _ in requests], pricing, realm_id, region)
+    return [(prices[item_id] * quantity, quantity) for item_id, quantity in requests]
+
+def load_history_arrays(db: Session, tracked_ids, start_time: datetime, realm_id=None, region=None):
+    """
+    Loads the price history of all given tracked items since `start_time` in one query.
+    Returns (item, buyout, quantity) arrays sorted by item and time.
+    """
+    rows = db.query(models.ItemPriceHistory.item_id, models.ItemPriceHistory.buyout, models.ItemPriceHistory.quantity)\
+        .filter(models.ItemPriceHistory.item_id.in_(tracked_ids))\
+        .filter(models.ItemPriceHistory.timestamp >= start_time, realm_filter(realm_id, region=region))\
+        .order_by(models.ItemPriceHistory.item_id.asc(), models.ItemPriceHistory.timestamp.asc()).all()
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty
+    # Flatten the rows directly; np.array() on Row objects is an order of magnitude slower
+    history = np.fromiter(chain.from_iterable(rows), dtype=np.int64, count=len(rows) * 3).reshape(-1, 3)
+    return history[:, 0], history[:, 1], history[:, 2]
+
+def calculate_liquidity_score(db: Session, crafts: int = 1, pricing: str = "min", limit: int = 10, price_source: str = "min", realm_id=None, region=None):
+    """
+    Ranks all recipes by liquidity score = daily sell-through * profit margin / (price changes + 1).
+    The whole 48h history of every crafted item is loaded with one query and scored with grouped
+    array operations instead of per-recipe queries.
+    `price_source` values the crafted items at their minimum buyout or market value; sales are
+    always estimated from the minimum buyout.
+    """
+    if price_source not in PRICE_SOURCES:
+        raise ValueError(f"Unknown price source {price_source!r}")
     now = datetime.utcnow()
     start_time = now - timedelta(hours=48)
 
     # Get all crafted items that have a recipe
-    recipes = db.query(models.Recipe).all()
-    
-    results = []
-
-    for recipe in recipes:
-        tracked_crafted = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == recipe.crafted_item_id).first()
-        if not tracked_crafted:
-            continue
-            
-        # Get history for this item using the internal DB id
-        history = db.query(models.ItemPriceHistory)\
-            .filter(models.ItemPriceHistory.item_id == tracked_crafted.id)\
-            .filter(models.ItemPriceHistory.timestamp >= start_time)\
-            .order_by(models.ItemPriceHistory.timestamp.asc()).all()
-
-        if len(history) < 2:
-            continue
-
-        total_sold = 0
-        price_changes = 0
-        
-        prev_qty = history[0].quantity
-        prev_price = history[0].buyout
-
-        # Track sales and price changes
-        for entry in history[1:]:
-            curr_qty = entry.quantity
-            curr_price = entry.buyout
-
-            if curr_price == prev_price and curr_qty < prev_qty:
-                total_sold += (prev_qty - curr_qty)
-            elif curr_price != prev_price:
-                price_changes += 1
-
-            prev_qty = curr_qty
-            prev_price = curr_price
-
-        # We look at 48h of data, so divide by 2 for daily sell-through rate
-        sell_through_rate = total_sold / 2.0
-
-        if sell_through_rate < 1:
-            continue
-
-        # Calculate production cost
-        crafting_cost = 0
-        for reagent in recipe.reagents:
-            reagent_price = get_latest_price(db, reagent.item_id)
-            crafting_cost += reagent_price * reagent.quantity
-
-        current_price = history[-1].buyout if history else 0
-        profit = current_price - crafting_cost
-
-        if profit <= 0:
-            continue
-
-        # Liquidity score = Sell-through rate * Profit margin / (Price changes + 1)
-        profit_margin = profit / crafting_cost if crafting_cost > 0 else 0
-        stability_index = 1.0 / (price_changes + 1)
-        
-        liquidity_score = sell_through_rate * profit_margin * stability_index
-
-        results.append({
-            "item_id": recipe.crafted_item_id,
-            "name": recipe.name,
-            "sell_through_rate_24h": sell_through_rate,
-            "price_changes_48h": price_changes,
-            "current_price": current_price,
-            "crafting_cost": crafting_cost,
-            "profit": profit,
-            "liquidity_score": liquidity_score,
-            "stability_index": stability_index
-        })
-
-    # Sort by liquidity score
-    results.sort(key=lambda x: x["liquidity_score"], reverse=True)
-    
-    return results[:10]
+    recipes = db.query(models.Recipe).options(selectinload(models.Recipe.reagents)).all()
+    if not recipes:
+        return []
+
+    tracked_pk = dict(db.query(models.TrackedItem.item_id, models.TrackedItem.id)
+                      .filter(models.TrackedItem.item_id.in_({r.crafted_item_id for r in recipes})).all())
+    recipes = [r for r in recipes if r.crafted_item_id in tracked_pk]
+    if not recipes:
+        return []
+    recipe_pks = np.array([tracked_pk[r.crafted_item_id] for r in recipes], dtype=np.int64)
+
+    # Per-item history statistics over 48h, grouped by the internal item id
+    items, prices, quantities = load_history_arrays(db, recipe_pks.tolist(), start_time, realm_id, region)
+    if len(items) == 0:
+        return []
+    group_ids, group_start, counts = np.unique(items, return_index=True, return_counts=True)
+    group = np.searchsorted(group_ids, items)
+
+    same_item = items[1:] == items[:-1]
+    same_price = prices[1:] == prices[:-1]
+    qty_drop = quantities[:-1] - quantities[1:]
+    sold_step = np.where(same_item & same_price & (qty_drop > 0), qty_drop, 0)
+    change_step = (same_item & ~same_price).astype(np.int64)
+
+    total_sold = np.bincount(group[1:], weights=sold_step, minlength=len(group_ids))
+    price_changes = np.bincount(group[1:], weights=change_step, minlength=len(group_ids)).astype(np.int64)
+    latest_prices = prices[group_start + counts - 1]
+
+    # Map the grouped statistics back onto the recipes
+    pos = np.minimum(np.searchsorted(group_ids, recipe_pks), len(group_ids) - 1)
+    has_group = group_ids[pos] == recipe_pks
+    sample_count = np.where(has_group, counts[pos], 0)
+    changes = np.where(has_group, price_changes[pos], 0)
+    current_price = np.where(has_group, latest_prices[pos], 0)
+    if price_source == "market":
+        market = get_latest_prices(db, [r.crafted_item_id for r in recipes], "market", realm_id, region)
+        current_price = np.where(has_group, np.array([market[r.crafted_item_id] for r in recipes], dtype=np.int64), 0)
+
+    # We look at 48h of data, so divide by 2 for daily sell-through rate
+    sell_through = np.where(has_group, total_sold[pos], 0) / 2.0
+    # Prefer the auction-level measurement over the quantity heuristic once it is available
+    # (auctions are diffed for the home realm only)
+    measured = get_measured_sell_through(db, recipe_pks.tolist(), start_time) if realm_id in (None, config.home_realm()) and region is None else {}
+    if measured:
+        measured_rates = np.array([measured.get(pk, np.nan) for pk in recipe_pks.tolist()])
+        sell_through = np.where(np.isnan(measured_rates), sell_through, measured_rates)
+
+    # Production cost per craft of every recipe, averaged over a batch of `crafts`
+    recipe_of_reagent = np.array([i for i, r in enumerate(recipes) for _ in r.reagents], dtype=np.int64)
+    reagent_costs = get_reagent_costs(db, [(reg.item_id, reg.quantity * crafts) for r in recipes for reg in r.reagents], pricing, realm_id, region)
+    batch_cost = np.bincount(recipe_of_reagent, weights=[cost for cost, _ in reagent_costs], minlength=len(recipes))
+    crafting_cost = np.round(batch_cost / crafts).astype(np.int64)
+
+    profit = current_price - crafting_cost
+    profit_margin = np.divide(profit, crafting_cost, out=np.zeros(len(recipes)), where=crafting_cost > 0)
+    stability_index = 1.0 / (changes + 1)
+    liquidity_score = sell_through * profit_margin * stability_index
+
+    eligible = (sample_count >= 2) & (sell_through >= 1) & (profit > 0)
+    candidates = np.flatnonzero(eligible)
+    # Stable sort keeps recipe order for equal scores
+    ranked = candidates[np.argsort(-liquidity_score[candidates], kind="stable")][:limit]
+
+    return [{
+        "item_id": recipes[i].crafted_item_id,
+        "name": recipes[i].name,
+        "sell_through_rate_24h": float(sell_through[i]),
+        "price_changes_48h": int(changes[i]),
+        "current_price": int(current_price[i]),
+        "crafting_cost": int(crafting_cost[i]),
+        "profit": int(profit[i]),
+        "liquidity_score": float(liquidity_score[i]),
+        "stability_index": float(stability_index[i])
+    } for i in ranked]
@@ -0,0 +1,225 @@
+"""
+arbitrage.py
+Cross-realm arbitrage finder: buy a realm-bound item where it is cheapest and sell it on the
+realm where it is worth the most and actually sells.
+After every ingestion the latest snapshots of the realms' own auctions (commodities are traded
+region-wide, so they have no spread) are folded into a matrix of items x realms holding the
+minimum price, market value and listed quantity, next to a decayed estimate of the units sold
+per day from the auction diffs of every realm. Gear listed in variants (item level, sockets,
+tertiary stats) gets a row per variant key instead, so different variants are never compared. Ranking is a few array operations over that
+matrix; only the best candidates are priced through the order book of their buy realm.
+No history is read per request.
+
+The worker saves the index next to the market state (see market_state.py), where the API
+processes pick it up.
+"""
+import os
+import tempfile
+import threading
+import numpy as np
+from crafting_planner import AUCTION_HOUSE_CUT
+
+SELL_THROUGH_HALF_LIFE = 3 * 86400 # Seconds; older diffs fade out of the sales estimate
+MIN_SOLD_PER_DAY = 1.0 # Default for a "healthy" sell realm
+INDEX_FILE = "arbitrage.npz"
+REFINE_FACTOR = 4 # Candidates priced through the order book per requested result
+
+
+def fold_rates(previous, ids, rates, weight):
+    """
+    Folds the units sold per day of one diff ({sorted ids: rates}) into the decayed estimate
+    `previous` ((ids, rates) or None); ids without sales in this interval decay towards zero.
+    """
+    if previous is None:
+        return ids, rates
+    old_ids, old_rates = previous
+    merged_ids = np.union1d(old_ids, ids)
+    merged = np.zeros(len(merged_ids))
+    merged[np.searchsorted(merged_ids, old_ids)] = old_rates * (1 - weight)
+    merged[np.searchsorted(merged_ids, ids)] += rates * weight
+    return merged_ids, merged
+
+
+class ArbitrageIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rates = {} # realm id -> (item ids, decayed units sold per day), both sorted by item id
+        self._variant_rates = {} # realm id -> (variant keys, decayed units sold per day), both sorted by key
+        self._loaded_mtime = None
+        self._set(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64),
+                  np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64), np.zeros((0, 0), dtype=np.int64),
+                  np.zeros((0, 0)), None)
+
+    def _set(self, realm_ids, item_ids, variant_keys, min_prices, market_values, quantities, sold_per_day, updated_at):
+        with self._lock:
+            self.realm_ids = realm_ids
+            self.item_ids = item_ids # Item id of each row
+            self.variant_keys = variant_keys # Variant key of each row; 0 for all listings of an item without variants
+            self.min_prices = min_prices # 0 where the item is not listed
+            self.market_values = market_values
+            self.quantities = quantities
+            self.sold_per_day = sold_per_day
+            self.updated_at = updated_at
+
+    def observe_diff(self, realm_id, diff):
+        """ Folds one auction diff of a realm into its decayed units-sold-per-day estimate. """
+        if diff is None:
+            return
+        interval = (diff.ended_at - diff.started_at).total_seconds()
+        if interval <= 0:
+            return
+        weight = 1 - 0.5 ** (interval / SELL_THROUGH_HALF_LIFE)
+        for rates, ids, sold_units in ((self._rates, diff.item_ids, diff.sold_units),
+                                       (self._variant_rates, diff.variant_keys, diff.variant_sold_units)):
+            rates[realm_id] = fold_rates(rates.get(realm_id), ids, sold_units * 86400.0 / interval, weight)
+
+    def rebuild(self, realm_snapshots, updated_at):
+        """
+        Rebuilds the matrix from the latest snapshot of every realm's own auctions ({realm id: MarketSnapshot}).
+        Items listed in variants on any realm get a row per variant key; their listings without a
+        variant are left out rather than mixed into one of them.
+        """
+        realm_ids = np.array(sorted(realm_snapshots), dtype=np.int64)
+        snapshots = [realm_snapshots[int(r)] for r in realm_ids]
+        empty = np.zeros(0, dtype=np.int64)
+        variant_items = np.unique(np.concatenate([s.variant_items for s in snapshots] or [empty]))
+        # Per realm: (column, order book, positions in the book, item ids, variant keys or None) of its
+        # rows; the ids of a book are sorted
+        parts = []
+        for col, snapshot in enumerate(snapshots):
+            plain = np.flatnonzero(~np.isin(snapshot.item_ids, variant_items))
+            parts.append((col, snapshot, plain, snapshot.item_ids[plain], None))
+            if snapshot.variants is not None:
+                keys = snapshot.variants.item_ids
+                parts.append((col, snapshot.variants, np.arange(len(keys)), snapshot.variant_items, keys))
+
+        # Rows: the items without variants, then the variant keys
+        plain_ids = np.unique(np.concatenate([items for *_, items, keys in parts if keys is None] or [empty]))
+        listed_keys = np.unique(np.concatenate([keys for *_, keys in parts if keys is not None] or [empty]))
+        item_ids = np.concatenate((plain_ids, np.zeros(len(listed_keys), dtype=np.int64)))
+        variant_keys = np.concatenate((np.zeros(len(plain_ids), dtype=np.int64), listed_keys))
+
+        shape = (len(item_ids), len(realm_ids))
+        min_prices = np.zeros(shape, dtype=np.int64)
+        market_values = np.zeros(shape, dtype=np.int64)
+        quantities = np.zeros(shape, dtype=np.int64)
+        sold_per_day = np.zeros(shape)
+        for col, book, positions, items, keys in parts:
+            if keys is None:
+                ids, row, all_rates = items, np.searchsorted(plain_ids, items), self._rates
+            else:
+                ids, row, all_rates = keys, len(plain_ids) + np.searchsorted(listed_keys, keys), self._variant_rates
+                item_ids[row] = items
+            starts, ends = book.offsets[:-1][positions], book.offsets[1:][positions]
+            min_prices[row, col] = book.prices[starts]
+            market_values[row, col] = book.market_values()[positions]
+            quantities[row, col] = book.cum_quantity[ends] - book.cum_quantity[starts]
+            # Sales per variant key for variant rows, per item otherwise
+            rates = all_rates.get(int(realm_ids[col]))
+            if rates is not None and len(ids):
+                rate_ids, values = rates
+                pos = np.minimum(np.searchsorted(ids, rate_ids), len(ids) - 1)
+                found = ids[pos] == rate_ids
+                sold_per_day[row[pos[found]], col] = values[found]
+        self._set(realm_ids, item_ids, variant_keys, min_prices, market_values, quantities, sold_per_day, updated_at)
+
+    def rank(self, limit=50, min_sold=MIN_SOLD_PER_DAY, days=1.0, views=None):
+        """
+        Ranks items (or variants of gear) by the expected profit of buying on the cheapest realm and
+        selling, at its market value minus the auction house cut, on the realm with the highest
+        market value among those selling at least `min_sold` units a day. The volume is what the
+        sell realm absorbs in `days`, capped by the listed supply of the buy realm. With `views`
+        ({realm id: MarketSnapshot}) the volume is priced through the buy realm's order book
+        instead of at its minimum price.
+        """
+        with self._lock:
+            realm_ids, item_ids, variant_keys = self.realm_ids, self.item_ids, self.variant_keys
+            min_prices, market_values = self.min_prices, self.market_values
+            quantities, sold_per_day = self.quantities, self.sold_per_day
+        if len(realm_ids) < 2 or len(item_ids) == 0:
+            return []
+
+        rows = np.arange(len(item_ids))
+        buy_prices = np.where(min_prices > 0, min_prices, np.inf)
+        buy_col = np.argmin(buy_prices, axis=1)
+        buy_price = buy_prices[rows, buy_col]
+
+        sell_values = np.where((sold_per_day >= min_sold) & (market_values > 0), market_values, -np.inf).astype(np.float64)
+        sell_values[rows, buy_col] = -np.inf # Buying and selling on the same realm is no arbitrage
+        sell_col = np.argmax(sell_values, axis=1)
+        sell_value = sell_values[rows, sell_col]
+
+        unit_profit = sell_value * (1 - AUCTION_HOUSE_CUT) - buy_price
+        volume = np.minimum(quantities[rows, buy_col], np.floor(sold_per_day[rows, sell_col] * days))
+        valid = np.isfinite(unit_profit) & (unit_profit > 0) & (volume >= 1)
+        candidates = np.flatnonzero(valid)
+        # Upper bound at the minimum price; deeper levels only lower it, so refining the best few suffices
+        estimate = unit_profit[candidates] * volume[candidates]
+        candidates = candidates[np.argsort(-estimate, kind="stable")][:max(limit, 1) * REFINE_FACTOR]
+
+        results = []
+        for row in candidates.tolist():
+            buy_realm, sell_realm = int(realm_ids[buy_col[row]]), int(realm_ids[sell_col[row]])
+            item_id, variant_key, units = int(item_ids[row]), int(variant_keys[row]), int(volume[row])
+            cost = int(buy_price[row]) * units
+            # A variant is priced through its own order book
+            view = (views or {}).get(buy_realm)
+            book, key = (view.variants, variant_key) if variant_key and view is not None else (view, item_id)
+            if book is not None and book.contains(key):
+                cost, units = book.cost_for_quantity(key, units)
+            revenue = int(sell_value[row] * (1 - AUCTION_HOUSE_CUT) * units)
+            if units <= 0 or revenue <= cost:
+                continue
+            results.append({
+                "item_id": item_id,
+                "variant_key": variant_key or None,
+                "buy_realm_id": buy_realm,
+                "buy_price": int(buy_price[row]),
+                "buy_listed_quantity": int(quantities[row, buy_col[row]]),
+                "sell_realm_id": sell_realm,
+                "sell_market_value": int(sell_value[row]),
+                "sell_sold_per_day": round(float(sold_per_day[row, sell_col[row]]), 2),
+                "spread_pct": round(float((sell_value[row] - buy_price[row]) / buy_price[row] * 100), 2),
+                "quantity": units,
+                "cost": cost,
+                "revenue": revenue,
+                "expected_profit": revenue - cost
+            })
+        results.sort(key=lambda r: -r["expected_profit"])
+        return results[:limit]
+
+    # --- Handoff to the API processes ---
+
+    def save(self, directory):
+        """ Worker: writes the matrix atomically to `directory`. """
+        os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            arrays = {
+                "realm_ids": self.realm_ids, "item_ids": self.item_ids, "variant_keys": self.variant_keys, "min_prices": self.min_prices,
+                "market_values": self.market_values, "quantities": self.quantities,
+                "sold_per_day": self.sold_per_day, "updated_at": np.array(self.updated_at or 0.0)
+            }
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, os.path.join(directory, INDEX_FILE))
+
+    def refresh(self, directory):
+        """ API: loads the matrix saved by the worker if it changed. Returns True if it did. """
+        path = os.path.join(directory, INDEX_FILE)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        if mtime == self._loaded_mtime:
+            return False
+        with np.load(path) as data:
+            # Indexes saved before variant rows have one row per item
+            variant_keys = data["variant_keys"] if "variant_keys" in data else np.zeros(len(data["item_ids"]), dtype=np.int64)
+            self._set(data["realm_ids"], data["item_ids"], variant_keys, data["min_prices"], data["market_values"],
+                      data["quantities"], data["sold_per_day"], float(data["updated_at"]) or None)
+        self._loaded_mtime = mtime
+        return True
+
+
+arbitrage_index = ArbitrageIndex()
@@ -0,0 +1,161 @@
+"""
+auction_diff.py
+Auction-level diffing engine for sell-through measurement.
+Consecutive snapshots of the same auction house are matched by their stable auction ids,
+so every auction can be classified as newly listed, sold (fully or partially) or expired,
+instead of guessing sales from changes of the aggregated quantity.
+"""
+from datetime import datetime
+import numpy as np
+import models
+
+# Expected remaining lifetime of an auction per time_left bucket (SHORT, MEDIUM, LONG, VERY_LONG),
+# using the middle of each bucket: <30m, 30m-2h, 2h-12h, 12h-48h.
+EXPECTED_REMAINING_SECONDS = np.array([900, 4500, 25200, 108000], dtype=np.int64)
+
+
+class SellThroughDiff:
+    """ Per-item result of diffing two snapshots; all arrays are aligned with ``item_ids``. """
+
+    def __init__(self, item_ids, sold_units, sold_auctions, expired_units, new_units, started_at, ended_at,
+                 variant_keys=None, variant_sold_units=None):
+        self.item_ids = item_ids
+        self.sold_units = sold_units
+        self.sold_auctions = sold_auctions
+        self.expired_units = expired_units
+        self.new_units = new_units
+        self.started_at = started_at
+        self.ended_at = ended_at
+        # Units sold per variant key of realm gear (see market_index.variant_keys), aligned with each other
+        self.variant_keys = variant_keys if variant_keys is not None else np.zeros(0, dtype=np.int64)
+        self.variant_sold_units = variant_sold_units if variant_sold_units is not None else np.zeros(0, dtype=np.int64)
+
+    def as_dict(self):
+        """ Maps item id -> (sold_units, sold_auctions, expired_units, new_units). """
+        return {
+            item_id: counts for item_id, *counts in zip(
+                self.item_ids.tolist(), self.sold_units.tolist(), self.sold_auctions.tolist(),
+                self.expired_units.tolist(), self.new_units.tolist()
+            )
+        }
+
+
+def diff_frames(prev, curr):
+    """
+    Diffs two AuctionFrames of the same auction house (both sorted by auction id).
+    - Auctions only in `curr` are new listings.
+    - Auctions still present with a lower quantity were partially bought (commodities).
+    - Auctions that vanished are expired if their time_left bucket says they were due to run out
+      within the interval, otherwise sold. Cancellations cannot be told apart from purchases.
+    """
+    interval = max(curr.captured_at - prev.captured_at, 0)
+
+    # Match previous auctions against the current snapshot
+    pos = np.searchsorted(curr.auction_ids, prev.auction_ids)
+    pos_clipped = np.minimum(pos, max(len(curr) - 1, 0))
+    if len(curr):
+        present = curr.auction_ids[pos_clipped] == prev.auction_ids
+    else:
+        present = np.zeros(len(prev), dtype=bool)
+
+    vanished = ~present
+    expired = vanished & (EXPECTED_REMAINING_SECONDS[prev.time_left] <= interval)
+    sold = vanished & ~expired
+
+    partial = np.zeros(len(prev), dtype=np.int64)
+    partial[present] = np.maximum(prev.quantities[present] - curr.quantities[pos_clipped[present]], 0)
+
+    sold_units = np.where(sold, prev.quantities, partial)
+    expired_units = np.where(expired, prev.quantities, 0)
+
+    # Listings that did not exist in the previous snapshot
+    if len(prev):
+        prev_pos = np.minimum(np.searchsorted(prev.auction_ids, curr.auction_ids), len(prev) - 1)
+        is_new = prev.auction_ids[prev_pos] != curr.auction_ids
+    else:
+        is_new = np.ones(len(curr), dtype=bool)
+
+    # Group all events by item id in one pass
+    event_items = np.concatenate((prev.item_ids, curr.item_ids[is_new]))
+    item_ids, inverse = np.unique(event_items, return_inverse=True)
+    n_prev = len(prev)
+
+    def grouped(weights):
+        return np.bincount(inverse, weights=weights, minlength=len(item_ids)).astype(np.int64)
+
+    zeros_new = np.zeros(int(is_new.sum()), dtype=np.int64)
+    # Sales per variant; auctions without one (key 0) only count for their item
+    has_variant = prev.variants > 0
+    variant_keys, variant_inverse = np.unique(prev.variants[has_variant], return_inverse=True)
+    return SellThroughDiff(
+        item_ids,
+        grouped(np.concatenate((sold_units, zeros_new))),
+        grouped(np.concatenate((sold.astype(np.int64), zeros_new))),
+        grouped(np.concatenate((expired_units, zeros_new))),
+        grouped(np.concatenate((np.zeros(n_prev, dtype=np.int64), curr.quantities[is_new]))),
+        datetime.utcfromtimestamp(prev.captured_at),
+        datetime.utcfromtimestamp(curr.captured_at),
+        variant_keys,
+        np.bincount(variant_inverse, weights=sold_units[has_variant], minlength=len(variant_keys)).astype(np.int64)
+    )
+
+
+class SellThroughTracker:
+    """ Remembers the previous frame of every auction house (commodities, each realm) to diff against. """
+
+    def __init__(self):
+        self._previous = {}
+
+    def observe(self, source, frame):
+        """
+        Stores `frame` as the latest state of `source` and returns the diff against the previous one.
+        Returns None for the first frame and for re-downloads of an unchanged snapshot.
+        """
+        prev = self._previous.get(source)
+        if prev is not None and len(prev) == len(frame) \
+                and np.array_equal(prev.auction_ids, frame.auction_ids) \
+                and np.array_equal(prev.quantities, frame.quantities):
+            return None
+        self._previous[source] = frame
+        if prev is None:
+            return None
+        return diff_frames(prev, frame)
+
+
+def record_sell_through(db, diffs, tracked_items):
+    """
+    Persists one interval of sell-through counts for the tracked items covered by `diffs`, the
+    diffs of the auction houses from the same ingestion run; they are summed per item. Items of
+    auction houses that were not diffed get no row, rather than a row without sales.
+    """
+    diffs = [d for d in diffs if d is not None]
+    if not diffs:
+        return []
+
+    counts = {}
+    for diff in diffs:
+        for item_id, values in diff.as_dict().items():
+            totals = counts.get(item_id, (0, 0, 0, 0))
+            counts[item_id] = tuple(a + b for a, b in zip(totals, values))
+
+    started_at = min(d.started_at for d in diffs)
+    ended_at = max(d.ended_at for d in diffs)
+    rows = []
+    for item in tracked_items:
+        if item.item_id not in counts:
+            continue
+        sold_units, sold_auctions, expired_units, new_units = counts[item.item_id]
+        rows.append(models.ItemSellThrough(
+            item_id=item.id,
+            interval_start=started_at,
+            interval_end=ended_at,
+            sold_units=sold_units,
+            sold_auctions=sold_auctions,
+            expired_units=expired_units,
+            new_units=new_units
+        ))
+    db.add_all(rows)
+    return rows
+
+
+sell_through_tracker = SellThroughTracker()
@@ -0,0 +1,69 @@
+"""
+bench_arbitrage.py
+Cost of the cross-realm arbitrage ranking for a growing number of realms.
+Synthetic realm snapshots and sales are folded into the ArbitrageIndex once (as after an
+ingestion); each request then only ranks the matrix and prices the best candidates.
+
+Usage:
+    python bench_arbitrage.py [--realms 2,8,32] [--items 20000] [--auctions 60000] [--requests 20]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+import numpy as np
+
+from market_index import AuctionFrame, MarketSnapshot
+from auction_diff import SellThroughDiff
+from arbitrage import ArbitrageIndex
+
+
+def synthetic_snapshot(rng, items, auctions):
+    item_ids = rng.integers(1, items + 1, auctions)
+    frame = AuctionFrame(
+        np.arange(auctions, dtype=np.int64),
+        item_ids.astype(np.int64),
+        rng.integers(10_000, 10_000_000, auctions).astype(np.int64),
+        rng.integers(1, 5, auctions).astype(np.int64),
+        rng.integers(0, 4, auctions).astype(np.int8),
+        time.time()
+    )
+    return MarketSnapshot.from_frame(frame)
+
+
+def build_index(realms, items, auctions):
+    rng = np.random.default_rng(realms)
+    index = ArbitrageIndex()
+    snapshots = {}
+    for realm_id in range(1, realms + 1):
+        snapshots[realm_id] = synthetic_snapshot(rng, items, auctions)
+        item_ids = snapshots[realm_id].item_ids
+        ended_at = datetime.utcnow()
+        # An hour of sales; only the sold units matter to the index
+        index.observe_diff(realm_id, SellThroughDiff(
+            item_ids, rng.integers(0, 10, len(item_ids)), None, None, None, ended_at - timedelta(hours=1), ended_at
+        ))
+    started = time.perf_counter()
+    index.rebuild(snapshots, time.time())
+    return index, snapshots, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the cross-realm arbitrage ranking.")
+    parser.add_argument("--realms", default="2,8,32")
+    parser.add_argument("--items", type=int, default=20000, help="Distinct realm-bound item ids")
+    parser.add_argument("--auctions", type=int, default=60000, help="Auctions per realm snapshot")
+    parser.add_argument("--requests", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'realms':>6} {'rebuild':>9} {'rank':>9} {'results':>8}")
+    for realms in (int(r) for r in args.realms.split(",")):
+        index, snapshots, rebuild = build_index(realms, args.items, args.auctions)
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            results = index.rank(50, views=snapshots)
+        rank = (time.perf_counter() - started) / args.requests
+        print(f"{realms:>6} {rebuild * 1000:>7.1f}ms {rank * 1000:>7.1f}ms {len(results):>8}")
+
+
+if __name__ == "__main__":
+    main()
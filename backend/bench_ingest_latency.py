@@ -0,0 +1,125 @@
+"""
+bench_ingest_latency.py
+API latency while a commodities snapshot is parsed.
+A synthetic snapshot is spooled to a file and parsed into an AuctionFrame three ways: inline on
+the event loop (as the ingestion used to), in a thread (still holding the GIL while parsing)
+and in the snapshot_worker process. Meanwhile a small ASGI app on the same event loop is
+queried every 10ms, and the request latencies are reported per mode.
+
+Usage:
+    python bench_ingest_latency.py [--auctions 300000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+import httpx
+from fastapi import FastAPI
+
+import snapshot_worker
+
+app = FastAPI()
+
+
+@app.get("/ping")
+async def ping():
+    return {"ok": True}
+
+
+@app.get("/sync")
+def sync_ping():
+    return {"ok": True}
+
+
+def write_snapshot(auctions):
+    rng = random.Random(1)
+    data = {"auctions": [{
+        "id": i,
+        "item": {"id": rng.randint(1, 20000)},
+        "quantity": rng.randint(1, 200),
+        "unit_price": rng.randint(100, 10_000_000),
+        "time_left": rng.choice(["SHORT", "MEDIUM", "LONG", "VERY_LONG"])
+    } for i in range(auctions)]}
+    f = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+    json.dump(data, f)
+    f.close()
+    return f.name
+
+
+def copy_file(path):
+    fd, copy = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "wb") as out, open(path, "rb") as src:
+        out.write(src.read())
+    return copy
+
+
+async def measure(path, mode):
+    latencies = []
+    done = asyncio.Event()
+    finished = float("inf")
+
+    async def probe(client):
+        # Open loop: a request "arrives" every 10ms whether or not the loop is free, and its
+        # latency counts from the arrival, so stalls are charged to every request they delay
+        arrival = time.perf_counter()
+        while not done.is_set() or arrival < finished:
+            delay = arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await client.get("/ping" if len(latencies) % 2 else "/sync")
+            latencies.append((time.perf_counter() - arrival) * 1000)
+            arrival += 0.01
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        prober = asyncio.create_task(probe(client))
+        await asyncio.sleep(0.2)
+        latencies.clear() # Only requests arriving during the parse count
+        started = time.perf_counter()
+        spooled = copy_file(path)
+        if mode == "inline":
+            frame = snapshot_worker.parse_snapshot_file(spooled)
+            os.remove(spooled)
+        elif mode == "thread":
+            frame = await asyncio.to_thread(snapshot_worker.parse_snapshot_file, spooled)
+            os.remove(spooled)
+        else:
+            frame = await snapshot_worker.parse_snapshot(spooled)
+        finished = time.perf_counter()
+        elapsed = finished - started
+        done.set()
+        await prober
+
+    latencies.sort()
+    print(f"{mode:>8}: parse {elapsed:.2f}s ({len(frame)} auctions), {len(latencies)} requests, "
+          f"latency p50 {statistics.median(latencies):.1f}ms p99 {latencies[int(len(latencies) * 0.99) - 1]:.1f}ms "
+          f"max {latencies[-1]:.1f}ms")
+
+
+async def run(path):
+    # Start the worker process up front; its spawn time is paid once per server start
+    await snapshot_worker.parse_snapshot(copy_file(path))
+    for mode in ("inline", "thread", "process"):
+        await measure(path, mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark API latency during snapshot parsing.")
+    parser.add_argument("--auctions", type=int, default=300000)
+    args = parser.parse_args()
+
+    path = write_snapshot(args.auctions)
+    print(f"Snapshot: {args.auctions} auctions, {os.path.getsize(path) / 1024 / 1024:.0f} MiB")
+    try:
+        asyncio.run(run(path))
+    finally:
+        snapshot_worker.shutdown()
+        os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
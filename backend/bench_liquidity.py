@@ -0,0 +1,114 @@
+"""
+bench_liquidity.py
+Benchmark for analytics.calculate_liquidity_score on a synthetic catalog.
+Creates a throw-away SQLite database with N recipes (3 reagents each, drawn from a shared pool)
+and 48h of half-hourly price history for every item, then times the scoring and counts queries.
+
+Usage:
+    python bench_liquidity.py [--recipes 1000] [--runs 5]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import models
+import analytics
+import rollups
+from liquidity_tracker import LiquidityTracker
+
+
+def seed(session, recipe_count, reagent_pool=300, samples=96):
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    reagent_ids = list(range(100000, 100000 + reagent_pool))
+    crafted_ids = range(200000, 200000 + recipe_count)
+
+    tracked = {}
+    for item_id in reagent_ids + list(crafted_ids):
+        tracked[item_id] = models.TrackedItem(item_id=item_id, name=f"Item {item_id}")
+    session.add_all(tracked.values())
+    session.flush()
+
+    history = []
+    for item_id, item in tracked.items():
+        # Crafted items sell above their reagents so a realistic share of recipes is profitable
+        price = rng.randint(200000, 2000000) if item_id in crafted_ids else rng.randint(1000, 100000)
+        quantity = rng.randint(50, 2000)
+        for k in range(samples):
+            if rng.random() < 0.2:
+                price = max(1, int(price * rng.uniform(0.9, 1.1)))
+            quantity = max(1, quantity - rng.randint(0, 15)) if rng.random() < 0.7 else quantity + rng.randint(0, 40)
+            history.append({
+                "item_id": item.id,
+                "buyout": price,
+                "quantity": quantity,
+                "timestamp": now - timedelta(minutes=30 * (samples - k))
+            })
+    session.bulk_insert_mappings(models.ItemPriceHistory, history)
+
+    for crafted_id in crafted_ids:
+        recipe = models.Recipe(name=f"Recipe {crafted_id}", crafted_item_id=crafted_id, crafted_quantity=1)
+        recipe.reagents = [
+            models.RecipeReagent(item_id=reagent_id, name=f"Item {reagent_id}", quantity=rng.randint(1, 5))
+            for reagent_id in rng.sample(reagent_ids, 3)
+        ]
+        session.add(recipe)
+    session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the liquidity scoring.")
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+
+    queries = []
+    event.listen(engine, "before_cursor_execute", lambda *a: queries.append(1))
+
+    session = Session()
+    started = time.perf_counter()
+    seed(session, args.recipes)
+    print(f"Seeded {args.recipes} recipes in {time.perf_counter() - started:.1f}s ({path})")
+
+    timings = []
+    for _ in range(args.runs):
+        session.expire_all()
+        queries.clear()
+        started = time.perf_counter()
+        results = analytics.calculate_liquidity_score(session)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    print(f"calculate_liquidity_score: median {timings[len(timings) // 2] * 1000:.1f} ms, "
+          f"best {timings[0] * 1000:.1f} ms, {len(queries)} queries, {len(results)} results")
+
+    # Incremental tracker: one rebuild from the rollups, after which reads are served from memory
+    rollups.rebuild_from_history(session)
+    session.commit()
+    tracker = LiquidityTracker()
+    started = time.perf_counter()
+    tracker.rebuild(session)
+    rebuild_seconds = time.perf_counter() - started
+    queries.clear()
+    started = time.perf_counter()
+    for _ in range(args.runs):
+        results = tracker.top_recipes(session)
+    read_seconds = (time.perf_counter() - started) / args.runs
+    print(f"LiquidityTracker: rebuild {rebuild_seconds * 1000:.1f} ms, read {read_seconds * 1000:.3f} ms, "
+          f"{len(queries)} queries, {len(results)} results")
+    session.close()
+
+
+if __name__ == "__main__":
+    main()
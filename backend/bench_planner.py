@@ -0,0 +1,72 @@
+"""
+bench_planner.py
+Benchmark for crafting_planner.plan_crafts on a synthetic glyph catalog.
+Seeds recipes, price history and rollups like bench_liquidity.py, publishes a synthetic order book
+with a few dozen price levels per item, and times planning runs for a large budget.
+
+Usage:
+    python bench_planner.py [--recipes 1000] [--runs 5] [--budget 500000000]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import models
+import rollups
+from bench_liquidity import seed
+from crafting_planner import plan_crafts
+from market_index import market_index, MarketSnapshot
+
+
+def seed_market(session, levels=40):
+    rng = random.Random(7)
+    item_ids, prices, quantities = [], [], []
+    for item in session.query(models.TrackedItem).all():
+        price = rng.randint(1000, 100000) if item.item_id < 200000 else rng.randint(200000, 2000000)
+        for level in range(levels):
+            item_ids.append(item.item_id)
+            prices.append(int(price * (1 + 0.02 * level)))
+            quantities.append(rng.randint(1, 200))
+    market_index.publish(MarketSnapshot.from_arrays(
+        np.array(item_ids, dtype=np.int64), np.array(prices, dtype=np.int64), np.array(quantities, dtype=np.int64)
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the crafting planner.")
+    parser.add_argument("--recipes", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=int, default=500000000)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), "bench.db")
+    engine = create_engine(f"sqlite:///{path}")
+    models.Base.metadata.create_all(bind=engine)
+    session = sessionmaker(bind=engine)()
+    seed(session, args.recipes)
+    # Sell-through caps come from the liquidity tracker, which loads from the rollups
+    rollups.rebuild_from_history(session)
+    session.commit()
+    seed_market(session)
+
+    timings = []
+    for _ in range(args.runs):
+        started = time.perf_counter()
+        plan = plan_crafts(session, args.budget)
+        timings.append(time.perf_counter() - started)
+
+    timings.sort()
+    print(f"plan_crafts: median {timings[len(timings) // 2] * 1000:.1f} ms, best {timings[0] * 1000:.1f} ms, "
+          f"{sum(c['crafts'] for c in plan['crafts'])} crafts over {len(plan['crafts'])} recipes, "
+          f"{len(plan['shopping_list'])} reagents, spent {plan['spent']} of {args.budget}")
+    session.close()
+
+
+if __name__ == "__main__":
+    main()
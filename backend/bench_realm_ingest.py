@@ -0,0 +1,89 @@
+"""
+bench_realm_ingest.py
+Ingestion time of the auction polling for a growing number of tracked realms.
+A simulated client answers every snapshot request after a fixed network delay with a synthetic
+realm snapshot spooled to a file; publish_cadence.poll_sources downloads and parses them one
+at a time (parallel=1, as before) and concurrently (the default).
+
+Usage:
+    python bench_realm_ingest.py [--realms 1,2,4,8] [--latency 0.5] [--auctions 50000]
+"""
+import argparse
+import asyncio
+import json
+import random
+import tempfile
+import time
+
+import snapshot_worker
+from market_index import realm_source
+from publish_cadence import PublishTracker, poll_sources, PARALLEL_FETCHES
+
+
+class SimulatedClient:
+    def __init__(self, latency, auctions):
+        self.latency = latency
+        self.last_modified = {}
+        self.last_status = {}
+        rng = random.Random(1)
+        self.body = json.dumps({"auctions": [{
+            "id": i,
+            "item": {"id": rng.randint(1, 20000)},
+            "quantity": 1,
+            "buyout": rng.randint(100, 10_000_000),
+            "time_left": rng.choice(["SHORT", "MEDIUM", "LONG", "VERY_LONG"])
+        } for i in range(auctions)]})
+
+    def fetch(self, source):
+        time.sleep(self.latency) # Request and download time
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as f:
+            f.write(self.body)
+        self.last_status[source] = 200
+        self.last_modified[source] = time.time()
+        return f.name
+
+
+class DiscardRows:
+    """ Stands in for the session: the benchmark does not keep publish rows. """
+
+    def add(self, row):
+        pass
+
+
+async def measure(client, realms, parallel):
+    fetchers = {
+        realm_source(realm_id): (client, lambda since, source=realm_source(realm_id): client.fetch(source))
+        for realm_id in range(1, realms + 1)
+    }
+    started = time.perf_counter()
+    frames = await poll_sources(DiscardRows(), fetchers, tracker=PublishTracker(), parallel=parallel)
+    assert len(frames) == realms
+    return time.perf_counter() - started
+
+
+async def run(realm_counts, client):
+    # Start the parse workers up front; their spawn time is paid once per process start
+    await measure(client, snapshot_worker.PARSE_WORKERS, PARALLEL_FETCHES)
+    print(f"{'realms':>6} {'sequential':>11} {'concurrent':>11} {'speedup':>8}")
+    for realms in realm_counts:
+        sequential = await measure(client, realms, 1)
+        concurrent = await measure(client, realms, PARALLEL_FETCHES)
+        print(f"{realms:>6} {sequential:>10.2f}s {concurrent:>10.2f}s {sequential / concurrent:>7.1f}x")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark multi-realm auction ingestion.")
+    parser.add_argument("--realms", default="1,2,4,8")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated seconds per snapshot download")
+    parser.add_argument("--auctions", type=int, default=50000, help="Auctions per realm snapshot")
+    args = parser.parse_args()
+
+    client = SimulatedClient(args.latency, args.auctions)
+    try:
+        asyncio.run(run([int(r) for r in args.realms.split(",")], client))
+    finally:
+        snapshot_worker.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -3,9 +3,58 @@ blizzard_api.py
 A wrapper for the Battle.net/Blizzard API.
 Handles OAuth2 token exchange, character profile fetching, and auction house data retrieval.
 """
+import os
 import requests
+import tempfile
+import threading
 import time
 from datetime import datetime
+from email.utils import formatdate, parsedate_to_datetime
+
+# Blizzard's API quota per client: 100 requests per second and 36,000 per hour
+REQUESTS_PER_SECOND = 100
+REQUESTS_PER_HOUR = 36000
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all threads using a client: refills at the hourly quota and holds
+    at most one second of requests, so parallel snapshot downloads stay within both limits.
+    """
+
+    def __init__(self, per_second=REQUESTS_PER_SECOND, per_hour=REQUESTS_PER_HOUR):
+        self._lock = threading.Lock()
+        self.rate = per_hour / 3600
+        self.burst = per_second
+        self._tokens = float(per_second)
+        self._updated = time.monotonic()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# The quota belongs to the API client, so the clients of all regions with the same credentials share one limiter
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def shared_rate_limiter(client_id):
+    with _rate_limiters_lock:
+        if client_id not in _rate_limiters:
+            _rate_limiters[client_id] = RateLimiter()
+        return _rate_limiters[client_id]
+
+
+POOL_SIZE = 8 # Kept-alive connections per client; snapshot downloads run in parallel threads
+
 
 class BlizzardAPI:
     def __init__(self, client_id, client_secret, region="eu"):
@@ -14,13 +63,20 @@ class BlizzardAPI:
         self.region = region
         self.access_token = None
         self.token_expiry = 0
+        self.last_modified = {} # Snapshot kind -> publish time (epoch seconds) from the Last-Modified header
+        self.last_status = {} # Snapshot kind -> HTTP status of the last request (304: not modified)
+        self.rate_limiter = shared_rate_limiter(client_id)
+        # One connection pool per client (and so per region host) instead of a new connection per request
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
 
     def get_token(self):
         if self.access_token and time.time() < self.token_expiry:
             return self.access_token
 
         url = f"https://{self.region}.battle.net/oauth/token"
-        response = requests.post(url, data={"grant_type": "client_credentials"}, auth=(self.client_id, self.client_secret))
+        response = self.session.post(url, data={"grant_type": "client_credentials"}, auth=(self.client_id, self.client_secret))
         
         if response.status_code == 200:
             data = response.json()
@@ -35,7 +91,7 @@ class BlizzardAPI:
         url = f"https://{self.region}.api.blizzard.com/data/wow/token/index?namespace=dynamic-{self.region}"
         headers = {"Authorization": f"Bearer {token}"}
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         else:
@@ -47,7 +103,7 @@ class BlizzardAPI:
         url = f"https://{self.region}.api.blizzard.com/data/wow/item/{item_id}?namespace=static-{self.region}&locale=de_DE"
         headers = {"Authorization": f"Bearer {token}"}
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
@@ -57,31 +113,62 @@ class BlizzardAPI:
         url = f"https://{self.region}.api.blizzard.com/data/wow/media/item/{item_id}?namespace=static-{self.region}"
         headers = {"Authorization": f"Bearer {token}"}
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
 
-    def get_commodity_price_snapshot(self):
+    def get_commodity_price_snapshot(self, if_modified_since=None, spool=False, kind="commodities"):
+        """ `kind` names the snapshot in last_modified / last_status (e.g. the region's source name). """
         token = self.get_token()
         url = f"https://{self.region}.api.blizzard.com/data/wow/auctions/commodities?namespace=dynamic-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {token}"}
-        
-        response = requests.get(url, headers=headers)
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            return response.json()
-        return None
+        return self._get_snapshot(kind, url, token, if_modified_since, spool)
 
-    def get_realm_auctions_snapshot(self, connected_realm_id):
+    def get_realm_auctions_snapshot(self, connected_realm_id, if_modified_since=None, spool=False):
         token = self.get_token()
         url = f"https://{self.region}.api.blizzard.com/data/wow/connected-realm/{connected_realm_id}/auctions?namespace=dynamic-{self.region}&locale=de_DE"
+        return self._get_snapshot(f"realm:{connected_realm_id}", url, token, if_modified_since, spool)
+
+    def _get_snapshot(self, kind, url, token, if_modified_since=None, spool=False):
+        """
+        Downloads an auction snapshot. With `if_modified_since` (epoch seconds) the request is
+        conditional: an unchanged snapshot answers 304 without a body and None is returned.
+        With spool=True the body is streamed to a temporary file and its path is returned
+        instead of the parsed JSON; the caller deletes it (see snapshot_worker.py).
+        """
         headers = {"Authorization": f"Bearer {token}"}
-        
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
+        if if_modified_since:
+            headers["If-Modified-Since"] = formatdate(if_modified_since, usegmt=True)
+
+        # Snapshots of several realms are downloaded in parallel threads
+        self.rate_limiter.acquire()
+        response = self.session.get(url, headers=headers, stream=spool)
+        self.last_status[kind] = response.status_code
+        if response.status_code != 200:
+            response.close()
+            return None
+        self._remember_last_modified(kind, response)
+        if not spool:
             return response.json()
-        return None
+        with response, tempfile.NamedTemporaryFile("wb", suffix=".json", prefix="auctions_", delete=False) as f:
+            try:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+            except BaseException:
+                # A download that broke off (e.g. a connection reset) must not leave a partial file behind
+                f.close()
+                os.remove(f.name)
+                raise
+        return f.name
+
+    def _remember_last_modified(self, kind, response):
+        header = response.headers.get("Last-Modified")
+        if not header:
+            return
+        try:
+            self.last_modified[kind] = parsedate_to_datetime(header).timestamp()
+        except (TypeError, ValueError):
+            pass
 
     def search_items_by_name(self, query):
         token = self.get_token()
@@ -89,7 +176,7 @@ class BlizzardAPI:
         url = f"https://{self.region}.api.blizzard.com/data/wow/search/item?name.de_DE={query}&namespace=static-{self.region}&orderby=id&_page=1"
         headers = {"Authorization": f"Bearer {token}"}
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
@@ -99,7 +186,7 @@ class BlizzardAPI:
         url = f"https://{self.region}.api.blizzard.com/data/wow/recipe/{recipe_id}?namespace=static-{self.region}&locale=de_DE"
         headers = {"Authorization": f"Bearer {token}"}
         
-        response = requests.get(url, headers=headers)
+        response = self.session.get(url, headers=headers)
         if response.status_code == 200:
             return response.json()
         return None
@@ -118,67 +205,87 @@ class BlizzardAPI:
             "client_id": self.client_id,
             "client_secret": self.client_secret
         }
-        response = requests.post(url, data=data)
+        response = self.session.post(url, data=data)
+        if response.status_code == 200:
+            return response.json()
+        return None
+
+    def get_user_info(self, user_token):
+        """ Battle.net account of a user token: {"id", "battletag", ...}. """
+        response = self._get_profile("https://oauth.battle.net/userinfo", user_token)
         if response.status_code == 200:
             return response.json()
         return None
 
+    def _get_profile(self, url, user_token, kind=None, if_modified_since=None):
+        """
+        Profile request with a user token. Profile requests count against the same quota as the
+        auction polling, so they go through the rate limiter. With `if_modified_since` (epoch
+        seconds) an unchanged resource answers 304; status and Last-Modified are kept under `kind`.
+        """
+        headers = {"Authorization": f"Bearer {user_token}"}
+        if if_modified_since:
+            headers["If-Modified-Since"] = formatdate(if_modified_since, usegmt=True)
+        self.rate_limiter.acquire()
+        response = self.session.get(url, headers=headers)
+        if kind:
+            self.last_status[kind] = response.status_code
+            if response.status_code == 200:
+                self._remember_last_modified(kind, response)
+        return response
+
     def get_account_profile(self, user_token):
         url = f"https://{self.region}.api.blizzard.com/profile/user/wow?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token)
         if response.status_code == 200:
             return response.json()
         return None
 
-    def get_character_profile(self, user_token, realm_slug, char_name):
+    def get_character_profile(self, user_token, realm_slug, char_name, if_modified_since=None):
+        """ Returns None if the character was not found or, with `if_modified_since`, is unchanged (see last_status). """
         # We need lowercase name and slug for API
         url = f"https://{self.region}.api.blizzard.com/profile/wow/character/{realm_slug}/{char_name.lower()}?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token, character_kind(realm_slug, char_name), if_modified_since)
         if response.status_code == 200:
             return response.json()
-        
-        with open("debug_api_error.txt", "w") as f:
-            f.write(f"URL: {url}\nStatus: {response.status_code}\nResponse: {response.text}\n")
-            
+        if response.status_code == 304:
+            return None
+
         print(f"Error fetching character profile for {char_name}: {response.status_code} - {response.text}")
         return None
 
     def get_protected_character_profile(self, user_token, realm_id, char_id):
         url = f"https://{self.region}.api.blizzard.com/profile/user/wow/protected-character/{realm_id}-{char_id}?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token)
         if response.status_code == 200:
             return response.json()
-        
-        with open("debug_api_error_protected.txt", "w") as f:
-            f.write(f"URL: {url}\nStatus: {response.status_code}\nResponse: {response.text}\n")
-            
+
         print(f"Error fetching protected profile for {char_id}: {response.status_code} - {response.text}")
         return None
 
     def get_character_statistics(self, user_token, realm_slug, char_name):
         # We want "Time Played" which is in achievements/statistics, NOT the combat stats
         url = f"https://{self.region}.api.blizzard.com/profile/wow/character/{realm_slug}/{char_name.lower()}/achievements/statistics?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token)
         if response.status_code == 200:
             return response.json()
         return None
 
     def get_character_equipment(self, user_token, realm_slug, char_name):
         url = f"https://{self.region}.api.blizzard.com/profile/wow/character/{realm_slug}/{char_name.lower()}/equipment?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token)
         if response.status_code == 200:
             return response.json()
         return None
 
     def get_character_professions(self, user_token, realm_slug, char_name):
         url = f"https://{self.region}.api.blizzard.com/profile/wow/character/{realm_slug}/{char_name.lower()}/professions?namespace=profile-{self.region}&locale=de_DE"
-        headers = {"Authorization": f"Bearer {user_token}"}
-        response = requests.get(url, headers=headers)
+        response = self._get_profile(url, user_token)
         if response.status_code == 200:
             return response.json()
         return None
+
+
+def character_kind(realm_slug, char_name):
+    """ Key of a character's profile summary in last_status / last_modified. """
+    return f"character:{realm_slug}/{char_name.lower()}"
@@ -0,0 +1,329 @@
+"""
+character_sync.py
+Character sync of all stored Battle.net accounts (one user token per account, stored by the
+OAuth callback; the row stays as the account's registry entry when the token expires). The
+worker's character_sync job syncs every account with an unexpired token:
+- Accounts are served fairly: accounts with a requested sync (a login or "sync now") first,
+  then the account synced longest ago. Their characters are interleaved round-robin and fetched
+  by a few threads, so a large account does not hold up the others. All profile requests go
+  through the client's rate limiter, which the auction polling uses as well.
+- Only changed characters are fetched in full. The profile summary is requested with
+  If-Modified-Since; an unchanged character (304, or the same last login) costs this one
+  request, a changed one also its protected profile, equipment, professions and statistics.
+- At most MAX_REFRESHES_PER_RUN characters are fetched in full per run. An account that did
+  not finish keeps its old last_synced_at and so comes first in the next run.
+Equipment and profession tiers go to their own tables (one row per slot / tier), written
+with one upsert statement per character.
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import func, or_, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from database import SessionLocal
+from blizzard_api import character_kind
+import models
+
+SYNC_THREADS = 4
+MAX_REFRESHES_PER_RUN = 200
+DELVES_COMPLETED_STATISTIC = 40734
+
+
+def due_accounts(db, now=None):
+    """
+    Tokens of the accounts to sync, in the order they are served. Accounts with an expired token
+    are skipped but stay connected (with their characters) until the user logs in again.
+    """
+    now = now or time.time()
+    tokens = db.query(models.UserAccessToken).filter(models.UserAccessToken.expires_at > now).all()
+    # Requested syncs first (oldest request first), then the account synced longest ago
+    return sorted(tokens, key=lambda t: (
+        t.sync_requested_at is None,
+        t.sync_requested_at or datetime.min,
+        t.last_synced_at or datetime.min
+    ))
+
+
+def interleave(queues):
+    """ Round-robin over lists: one element of every list in turn until all are exhausted. """
+    queues = [list(q) for q in queues]
+    for i in range(max((len(q) for q in queues), default=0)):
+        for q in queues:
+            if i < len(q):
+                yield q[i]
+
+
+class RefreshBudget:
+    """ Full character fetches left in this run; shared by the fetch threads. """
+
+    def __init__(self, refreshes):
+        self._lock = threading.Lock()
+        self.left = refreshes
+
+    def take(self):
+        with self._lock:
+            if self.left <= 0:
+                return False
+            self.left -= 1
+            return True
+
+
+def parse_equipment(raw_equip):
+    """ Rows of character_equipment from the equipment response; None if it could not be fetched. """
+    if not raw_equip or 'equipped_items' not in raw_equip:
+        return None
+    return [{
+        "slot": item['slot']['type'],
+        "item_id": item.get('item', {}).get('id'),
+        "name": item.get('name', 'Unknown'),
+        "quality": item.get('quality', {}).get('type', 'COMMON'),
+        "level": item.get('level', {}).get('value', 0)
+    } for item in raw_equip['equipped_items'] if item.get('slot', {}).get('type')]
+
+
+def parse_professions(raw_professions):
+    """ Rows of character_profession_tiers from the professions response; None if it could not be fetched. """
+    if not raw_professions or 'primaries' not in raw_professions:
+        return None
+    return [{
+        "profession": prof.get('profession', {}).get('name', 'Unknown'),
+        "profession_id": prof.get('profession', {}).get('id'),
+        "tier": tier.get('tier', {}).get('name', 'Unknown Expansion'),
+        "tier_id": tier.get('tier', {}).get('id'),
+        "skill_points": tier.get('skill_points', 0),
+        "max_skill_points": tier.get('max_skill_points', 0)
+    } for prof in raw_professions['primaries'] for tier in prof.get('tiers', [])]
+
+
+def upsert_rows(db, model, rows, keys):
+    """ Inserts `rows` in one statement; rows that exist by `keys` (a unique constraint) are updated. """
+    if not rows:
+        return
+    stmt = sqlite_insert(model).values(rows)
+    updates = {column: stmt.excluded[column] for column in rows[0] if column not in keys}
+    db.execute(stmt.on_conflict_do_update(index_elements=keys, set_=updates))
+
+
+def store_details(db, character_id, equipment, tiers):
+    """
+    Writes the equipment and profession tiers of a character with bulk upserts and removes the
+    slots and tiers it no longer has. None (not fetched) keeps the stored rows.
+    """
+    if equipment is not None:
+        upsert_rows(db, models.CharacterEquipment, [dict(row, character_id=character_id) for row in equipment],
+                    ["character_id", "slot"])
+        db.query(models.CharacterEquipment)\
+            .filter(models.CharacterEquipment.character_id == character_id,
+                    models.CharacterEquipment.slot.notin_([row["slot"] for row in equipment]))\
+            .delete(synchronize_session=False)
+    if tiers is not None:
+        upsert_rows(db, models.CharacterProfessionTier, [dict(row, character_id=character_id) for row in tiers],
+                    ["character_id", "profession", "tier"])
+        db.query(models.CharacterProfessionTier)\
+            .filter(models.CharacterProfessionTier.character_id == character_id,
+                    tuple_(models.CharacterProfessionTier.profession, models.CharacterProfessionTier.tier)
+                    .notin_([(row["profession"], row["tier"]) for row in tiers]))\
+            .delete(synchronize_session=False)
+
+
+def parse_delves(stats):
+    """ Returns (delves completed, highest tier completed) from the achievement statistics. """
+    delves_completed = 0
+    delves_max_tier = 0
+    if stats and 'categories' in stats:
+        for cat in stats['categories']:
+            for s in cat.get('statistics', []):
+                quant = int(s.get('quantity', 0))
+                if s.get('id') == DELVES_COMPLETED_STATISTIC:
+                    delves_completed = quant
+                # Infer max tier from name e.g. "Tiefen der Stufe 1 abgeschlossen"
+                name_lower = s.get('name', '').lower()
+                if ('stufe' in name_lower or 'tier' in name_lower or 'level' in name_lower) and ('tiefe' in name_lower or 'delve' in name_lower):
+                    match = re.search(r'(?:stufe|tier|level)\s*(\d+)', name_lower)
+                    if match and quant > 0:
+                        delves_max_tier = max(delves_max_tier, int(match.group(1)))
+    return delves_completed, delves_max_tier
+
+
+def fetch_character(client, user_token, char, known, budget):
+    """
+    Fetches one character of an account profile. `known` is (last_login, profile_modified_at) of
+    the stored character or None. Returns (status, details) with status "unchanged", "deferred"
+    (out of budget), "ghost" (deleted or transferred) or "changed".
+    """
+    realm_slug, name = char['realm']['slug'], char['name']
+    last_login, modified_at = known or (None, None)
+    public_details = client.get_character_profile(user_token, realm_slug, name, if_modified_since=modified_at)
+    kind = character_kind(realm_slug, name)
+    if client.last_status.get(kind) == 304:
+        return "unchanged", None
+    if public_details and last_login and public_details.get('last_login_timestamp') == last_login:
+        return "unchanged", None
+    if not budget.take():
+        return "deferred", None
+
+    # Fetch Protected Profile (for Gold)
+    protected_details = client.get_protected_character_profile(user_token, char['realm']['id'], char['id'])
+    # Filter Ghost Characters (Deleted/Transferred) that return 404
+    if not protected_details and not public_details:
+        return "ghost", None
+
+    # Only update gold if we successfully retrieved it from the API to avoid wiping data on 404s
+    gold = None
+    if protected_details and 'money' in protected_details:
+        gold = protected_details['money']
+    elif public_details and 'money' in public_details:
+        gold = public_details['money']
+
+    equipment = professions = None
+    try:
+        equipment = parse_equipment(client.get_character_equipment(user_token, realm_slug, name))
+    except Exception as e:
+        print(f"Failed to fetch equipment for {name}: {e}")
+    try:
+        professions = parse_professions(client.get_character_professions(user_token, realm_slug, name))
+    except Exception as e:
+        print(f"Failed to fetch professions for {name}: {e}")
+    # Note: Blizzard has removed 'Total time played' from the Web API; only the delves come from the statistics
+    delves_completed, delves_max_tier = parse_delves(client.get_character_statistics(user_token, realm_slug, name))
+
+    return "changed", {
+        "gold": gold,
+        "item_level": (public_details or {}).get('equipped_item_level', 0),
+        "equipment": equipment,
+        "professions": professions,
+        "delves_completed": delves_completed,
+        "delves_max_tier": delves_max_tier,
+        "last_login": (public_details or {}).get('last_login_timestamp'),
+        "profile_modified_at": int(client.last_modified[kind]) if kind in client.last_modified else None
+    }
+
+
+def apply_character(db, owner, char, details, timestamp):
+    """ Inserts or updates a changed character (looked up by its Blizzard id, not the database id). """
+    db_char = db.query(models.Character).filter_by(blizzard_id=char['id']).first()
+    if not db_char:
+        db_char = models.Character(blizzard_id=char['id'], gold=0, played_time=0)
+        if 'playable_class' in char:
+            db_char.class_name = char['playable_class']['name']
+        else:
+            db_char.class_name = char.get('character_class', {}).get('name', 'Unknown')
+        db.add(db_char)
+    db_char.owner = owner
+    db_char.name = char['name']
+    db_char.realm = char['realm']['name']
+    db_char.level = char.get('level', 0)
+    db_char.item_level = details["item_level"]
+    if details["gold"] is not None:
+        db_char.gold = int(details["gold"])
+    db_char.delves_completed = details["delves_completed"]
+    db_char.delves_max_tier = details["delves_max_tier"]
+    db_char.last_login = details["last_login"]
+    db_char.profile_modified_at = details["profile_modified_at"]
+    db_char.last_updated = timestamp
+    db.flush() # Assigns the id of a new character
+    store_details(db, db_char.id, details["equipment"], details["professions"])
+
+
+def record_gold(db, owners):
+    """ Updates today's gold snapshot of the synced accounts and of all accounts together. """
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    totals = dict(db.query(models.Character.owner, func.sum(models.Character.gold))
+                  .filter(models.Character.owner.in_(owners)).group_by(models.Character.owner).all())
+    totals[None] = db.query(func.sum(models.Character.gold)).scalar() or 0
+    for owner, total in totals.items():
+        snapshot = db.query(models.AccountGoldHistory)\
+            .filter(models.AccountGoldHistory.owner.is_(None) if owner is None else models.AccountGoldHistory.owner == owner,
+                    models.AccountGoldHistory.timestamp >= today).first()
+        if snapshot:
+            snapshot.total_gold = int(total or 0)
+            snapshot.timestamp = datetime.utcnow()
+        else:
+            db.add(models.AccountGoldHistory(total_gold=int(total or 0), owner=owner, timestamp=datetime.utcnow()))
+    db.commit()
+    print(f"Total account gold snapshot updated: {totals[None] / 10000}g")
+
+
+def load_accounts(client, db):
+    """ Account profiles of the due accounts: [(token row, account id, user token, characters)]. """
+    accounts = []
+    for entry in due_accounts(db):
+        profile = client.get_account_profile(entry.access_token)
+        if not profile:
+            print(f"Failed to fetch the profile of account {entry.battletag or entry.account_id}.")
+            continue
+        account_id = entry.account_id or profile.get('id')
+        if entry.account_id is None and account_id is not None:
+            # A token stored before multi-account support; a newer login of the same account supersedes it
+            if db.query(models.UserAccessToken).filter_by(account_id=account_id).first():
+                db.delete(entry)
+                db.commit()
+                continue
+            entry.account_id = account_id
+            db.commit()
+        characters = [c for account in profile.get('wow_accounts', []) for c in account.get('characters', [])]
+        accounts.append((entry, account_id, entry.access_token, characters))
+    return accounts
+
+
+def sync_accounts(client):
+    """ Syncs the characters of all accounts with a stored, unexpired token (see the module docstring). """
+    db = SessionLocal()
+    try:
+        accounts = load_accounts(client, db)
+        if not accounts:
+            return
+        known = {c.blizzard_id: (c.last_login, c.profile_modified_at) for c in
+                 db.query(models.Character.blizzard_id, models.Character.last_login, models.Character.profile_modified_at)}
+        # Plain values only: the fetch threads must not touch the session's objects
+        work = list(interleave([[(entry.id, account_id, token, char) for char in chars] for entry, account_id, token, chars in accounts]))
+        print(f"Syncing {len(work)} characters of {len(accounts)} account(s)...")
+        budget = RefreshBudget(MAX_REFRESHES_PER_RUN)
+
+        def fetch(task):
+            _, _, token, char = task
+            try:
+                return fetch_character(client, token, char, known.get(char['id']), budget)
+            except Exception as e:
+                print(f"Failed to sync char {char.get('name')}: {e}")
+                return "failed", None
+
+        timestamp = datetime.utcnow()
+        counts = {"unchanged": 0, "changed": 0, "deferred": 0, "ghost": 0, "failed": 0}
+        unfinished = set()
+        # map() yields in submission order; the database writes stay on this thread
+        with ThreadPoolExecutor(max_workers=SYNC_THREADS) as pool:
+            for (entry_id, account_id, _, char), (status, details) in zip(work, pool.map(fetch, work)):
+                counts[status] += 1
+                if status in ("deferred", "failed"):
+                    unfinished.add(entry_id)
+                elif status == "ghost":
+                    db_ghost = db.query(models.Character).filter_by(blizzard_id=char['id']).first()
+                    if db_ghost:
+                        print(f"Removing deleted ghost character from database: {db_ghost.name}")
+                        db.delete(db_ghost)
+                        db.commit()
+                elif status == "changed":
+                    apply_character(db, account_id, char, details, timestamp)
+                    db.commit()
+                    print(f"Synced {char['name']}: {(details['gold'] or 0) / 10000}g")
+
+        now = datetime.utcnow()
+        for entry, account_id, _, chars in accounts:
+            # Unchanged characters synced before multi-account support get their owner without a fetch
+            if account_id is not None:
+                db.query(models.Character)\
+                    .filter(models.Character.blizzard_id.in_([c['id'] for c in chars]),
+                            or_(models.Character.owner.is_(None), models.Character.owner != account_id))\
+                    .update({models.Character.owner: account_id}, synchronize_session=False)
+            if entry.id not in unfinished:
+                entry.last_synced_at = now
+                entry.sync_requested_at = None
+        db.commit()
+        print(f"Character sync complete: {counts['changed']} changed, {counts['unchanged']} unchanged, "
+              f"{counts['deferred']} deferred, {counts['ghost']} removed, {counts['failed']} failed.")
+        record_gold(db, [account_id for _, account_id, _, _ in accounts if account_id is not None])
+    finally:
+        db.close()
@@ -0,0 +1,45 @@
+"""
+check_market_value.py
+Checks MarketSnapshot.market_values on thin order books with a troll auction far below the
+market, where the cheapest share of the supply is mostly (or only) the troll.
+
+Usage:
+    python check_market_value.py
+"""
+import sys
+from market_index import MarketSnapshot
+
+MARKET = 1_000_000
+
+
+def book(levels):
+    """ Snapshot of one item (id 1) from [(unit price, quantity), ...] levels. """
+    return MarketSnapshot.from_auctions([
+        {"id": i, "item": {"id": 1}, "unit_price": price, "quantity": quantity}
+        for i, (price, quantity) in enumerate(levels)
+    ])
+
+
+CASES = [
+    # (description, levels, expected market value)
+    ("troll + 5 listings", [(1, 1)] + [(MARKET, 1)] * 5, MARKET),
+    ("troll + 10 listings", [(1, 1)] + [(MARKET, 1)] * 10, MARKET),
+    ("5-unit troll over 95 units", [(1, 5), (MARKET, 95)], MARKET),
+    ("troll + spread book", [(1, 1), (900_000, 2), (1_000_000, 3), (1_100_000, 4)], 900_000),
+    ("no troll", [(MARKET, 10), (2 * MARKET, 10)], MARKET),
+    ("too thin to tell", [(1, 1), (MARKET, 1)], 1),
+]
+
+
+def main():
+    failed = 0
+    for description, levels, expected in CASES:
+        value = book(levels).market_value(1)
+        ok = value == expected
+        failed += not ok
+        print(f"[{'PASS' if ok else 'FAIL'}] {description}: {value} (expected {expected})")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,7 +16,16 @@ class Config:
         self.client_id = os.getenv("BLIZZARD_CLIENT_ID", "")
         self.client_secret = os.getenv("BLIZZARD_CLIENT_SECRET", "")
         self.region = os.getenv("BLIZZARD_REGION", "eu")
+        # Further regions whose token price and commodities are tracked, comma separated (e.g. "us,kr,tw")
+        self.tracked_regions = [r.strip().lower() for r in os.getenv("BLIZZARD_REGIONS", "").split(",") if r.strip()]
         self.home_realm_id = os.getenv("BLIZZARD_HOME_REALM_ID", "1618") # Default to Die Aldor
+        # Further connected realms whose auction houses are tracked, comma separated
+        self.tracked_realm_ids = [r.strip() for r in os.getenv("BLIZZARD_REALM_IDS", "").split(",") if r.strip()]
+        self.archive_dir = os.getenv("SNAPSHOT_ARCHIVE_DIR", "") # Empty disables the raw snapshot archive
+        self.alert_webhook_url = os.getenv("ALERT_WEBHOOK_URL", "") # Target of the "webhook" alert sink
+        self.market_state_dir = os.getenv("MARKET_STATE_DIR", "market_state") # Latest snapshots, handed from the worker to the API
+        # Runs the worker inside the API process (single-process setups); otherwise start worker.py
+        self.embedded_worker = os.getenv("EMBEDDED_WORKER", "false").lower() in ("1", "true", "yes")
         self.load()
 
     def load(self):
@@ -26,14 +35,45 @@ class Config:
                 self.client_id = data.get("client_id", self.client_id)
                 self.client_secret = data.get("client_secret", self.client_secret)
                 self.region = data.get("region", self.region)
+                self.tracked_regions = data.get("tracked_regions", self.tracked_regions)
                 self.home_realm_id = data.get("home_realm_id", self.home_realm_id)
+                self.tracked_realm_ids = data.get("tracked_realm_ids", self.tracked_realm_ids)
+                self.archive_dir = data.get("archive_dir", self.archive_dir)
+                self.alert_webhook_url = data.get("alert_webhook_url", self.alert_webhook_url)
+                self.market_state_dir = data.get("market_state_dir", self.market_state_dir)
+                self.embedded_worker = data.get("embedded_worker", self.embedded_worker)
+
+    def home_realm(self):
+        return int(self.home_realm_id)
+
+    def realm_ids(self):
+        """ All tracked connected realm ids, the home realm first. """
+        realm_ids = [self.home_realm()]
+        for realm_id in self.tracked_realm_ids:
+            if int(realm_id) not in realm_ids:
+                realm_ids.append(int(realm_id))
+        return realm_ids
+
+    def regions(self):
+        """ All tracked regions, the primary region (of the home realm and the user's account) first. """
+        regions = [self.region]
+        for region in self.tracked_regions:
+            if region not in regions:
+                regions.append(region)
+        return regions
 
     def save(self):
         data = {
             "client_id": self.client_id,
             "client_secret": self.client_secret,
             "region": self.region,
-            "home_realm_id": self.home_realm_id
+            "tracked_regions": self.tracked_regions,
+            "home_realm_id": self.home_realm_id,
+            "tracked_realm_ids": self.tracked_realm_ids,
+            "archive_dir": self.archive_dir,
+            "alert_webhook_url": self.alert_webhook_url,
+            "market_state_dir": self.market_state_dir,
+            "embedded_worker": self.embedded_worker
         }
         with open(CONFIG_FILE, "w") as f:
             json.dump(data, f, indent=4)
@@ -0,0 +1,156 @@
+"""
+correlation.py
+Cross-item correlation and co-movement of the tracked items, computed in batch from the
+hourly rollups. All items are aligned on one hourly grid and correlated on their hourly log
+returns with matrix products: one for the same-hour correlation matrix and one per lag for the
+lagged cross-correlation (does the herb lead the ink?). The strongest partners of every item
+are stored per UTC day in item_correlations, so the endpoint only reads a few rows.
+
+Run this module directly to recompute today's results.
+"""
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import Integer, cast, func
+import models
+from rollups import bucket_start
+
+DEFAULT_DAYS = 30
+MAX_LAG_HOURS = 24
+TOP_PAIRS = 20 # Partners stored per item
+MIN_OVERLAP = 48 # Hourly returns two items need in common to be compared
+
+_lock = threading.Lock()
+_computed_day = None
+
+
+def load_hourly_matrix(db, days=DEFAULT_DAYS, end=None):
+    """
+    Returns (blizzard item ids, prices) where prices is an (items x hours) matrix of the hourly
+    average buyout over the last `days`, NaN where an item has no rollup for the hour.
+    """
+    end = bucket_start(end or datetime.utcnow())
+    start = end - timedelta(days=days)
+    hours = days * 24
+    # Hour index computed by SQLite, so no per-row datetime parsing happens in Python
+    hour = cast(func.round((func.julianday(models.ItemPriceRollup.bucket_start) - func.julianday(start)) * 24), Integer)
+    rows = db.query(models.ItemPriceRollup.item_id, hour, models.ItemPriceRollup.sum_buyout, models.ItemPriceRollup.samples)\
+        .filter(models.ItemPriceRollup.bucket_start >= start, models.ItemPriceRollup.bucket_start < end)\
+        .filter(models.ItemPriceRollup.samples > 0).all()
+    item_ids = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id).all())
+    if not rows:
+        return np.zeros(0, dtype=np.int64), np.zeros((0, hours))
+
+    data = np.array(rows, dtype=np.float64)
+    pks, row_index = np.unique(data[:, 0].astype(np.int64), return_inverse=True)
+    prices = np.full((len(pks), hours), np.nan)
+    hour_index = data[:, 1].astype(np.int64)
+    in_range = (hour_index >= 0) & (hour_index < hours)
+    prices[row_index[in_range], hour_index[in_range]] = data[in_range, 2] / data[in_range, 3]
+
+    known = np.array([pk in item_ids for pk in pks.tolist()], dtype=bool)
+    return np.array([item_ids[pk] for pk in pks[known].tolist()], dtype=np.int64), prices[known]
+
+
+def correlate(prices, max_lag=MAX_LAG_HOURS):
+    """
+    Correlates the hourly log returns of every pair of rows of `prices`.
+    Returns (correlation, lagged correlation, lag, overlap), all (items x items):
+    lagged[i, j] is the strongest correlation between item i at hour t and item j at hour
+    t + lag[i, j] over 1 <= |lag| <= max_lag; a positive lag means item i leads item j.
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        returns = np.diff(np.log(np.where(prices > 0, prices, np.nan)), axis=1)
+    observed = ~np.isnan(returns)
+    n_obs = np.maximum(observed.sum(axis=1), 1)
+    steps = returns.shape[1]
+
+    # Standardize every series over its own observed returns; missing hours contribute 0
+    filled = np.where(observed, returns, 0.0)
+    centered = np.where(observed, filled - (filled.sum(axis=1) / n_obs)[:, None], 0.0)
+    std = np.sqrt((centered ** 2).sum(axis=1) / n_obs)
+    z = np.divide(centered, std[:, None], out=np.zeros_like(centered), where=std[:, None] > 0).astype(np.float32)
+    mask = observed.astype(np.float32)
+
+    overlap = mask @ mask.T
+    correlation = np.clip((z @ z.T) / np.maximum(overlap, 1), -1, 1)
+
+    lagged = np.zeros_like(correlation)
+    lag = np.zeros(correlation.shape, dtype=np.int16)
+    for shift in range(1, min(max_lag, steps - 1) + 1):
+        # Hours where item i at t and item j at t + shift are both observed
+        shifted_overlap = mask[:, :-shift] @ mask[:, shift:].T
+        leads = np.clip((z[:, :-shift] @ z[:, shift:].T) / np.maximum(shifted_overlap, 1), -1, 1)
+        leads[shifted_overlap < MIN_OVERLAP] = 0
+        for values, signed in ((leads, shift), (leads.T, -shift)):
+            better = np.abs(values) > np.abs(lagged)
+            lagged = np.where(better, values, lagged)
+            lag = np.where(better, signed, lag).astype(np.int16)
+    return correlation, lagged, lag, overlap
+
+
+def top_pairs(item_ids, correlation, lagged, lag, overlap, k=TOP_PAIRS):
+    """ Yields (item_id, other_item_id, correlation, lag, lagged_correlation, overlap) for the k strongest partners of every item. """
+    n = len(item_ids)
+    if n < 2:
+        return
+    score = np.maximum(np.abs(correlation), np.abs(lagged))
+    score[overlap < MIN_OVERLAP] = -1
+    np.fill_diagonal(score, -1)
+    k = min(k, n - 1)
+    best = np.argpartition(-score, k - 1, axis=1)[:, :k]
+    for i in range(n):
+        partners = best[i][np.argsort(-score[i, best[i]])]
+        for j in partners.tolist():
+            if score[i, j] < 0:
+                break
+            yield (int(item_ids[i]), int(item_ids[j]), float(correlation[i, j]), int(lag[i, j]),
+                   float(lagged[i, j]), int(overlap[i, j]))
+
+
+def compute_and_store(db, day=None, days=DEFAULT_DAYS):
+    """ Recomputes the correlation results for `day` (today by default) and drops older days. """
+    global _computed_day
+    day = day or datetime.utcnow().strftime("%Y-%m-%d")
+    item_ids, prices = load_hourly_matrix(db, days)
+    rows = []
+    if len(item_ids) >= 2:
+        correlation, lagged, lag, overlap = correlate(prices)
+        rows = [dict(day=day, item_id=a, other_item_id=b, correlation=c, lag_hours=l, lagged_correlation=lc, samples=o)
+                for a, b, c, l, lc, o in top_pairs(item_ids, correlation, lagged, lag, overlap)]
+    db.query(models.ItemCorrelation).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.ItemCorrelation, rows)
+    db.commit()
+    _computed_day = day
+    return len(rows)
+
+
+def ensure_computed(db):
+    """ Computes today's results unless they exist already; returns the UTC day. """
+    day = datetime.utcnow().strftime("%Y-%m-%d")
+    with _lock:
+        if _computed_day != day and not db.query(models.ItemCorrelation.id).filter(models.ItemCorrelation.day == day).first():
+            compute_and_store(db, day)
+    return day
+
+
+def get_correlations(db, item_id, limit=10):
+    """ Strongest partners of `item_id` from today's results, computing them first if needed. """
+    day = ensure_computed(db)
+    rows = db.query(models.ItemCorrelation)\
+        .filter(models.ItemCorrelation.day == day, models.ItemCorrelation.item_id == item_id).all()
+    rows.sort(key=lambda r: max(abs(r.correlation), abs(r.lagged_correlation)), reverse=True)
+    return rows[:limit]
+
+
+if __name__ == "__main__":
+    import time
+    from database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = compute_and_store(session)
+        print(f"Stored {count} correlated pairs in {time.perf_counter() - started:.2f}s.")
+    finally:
+        session.close()
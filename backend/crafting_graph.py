@@ -0,0 +1,193 @@
+"""
+crafting_graph.py
+Recursive make-vs-buy solver over the recipe graph.
+Recipes only model one level (crafted item <- reagents), but a reagent can itself be the
+crafted item of another recipe (e.g. inks from pigments). The solver links recipes into a
+graph, breaks cycles, and decides for every item whether buying it or crafting it from its
+own cheapest inputs is cheaper. Per-unit decisions are memoized per price generation, so
+evaluating all recipes visits every shared intermediate only once.
+"""
+import threading
+from sqlalchemy.orm import selectinload
+import models
+import analytics
+from market_index import market_index
+
+UNPRICED = float("inf")
+
+
+class CraftingGraph:
+    def __init__(self, recipes, prices, names=None):
+        # crafted item id -> (recipe id, recipe name, crafted quantity, [(reagent item id, quantity)])
+        self.recipes = {
+            r.crafted_item_id: (r.id, r.name, max(r.crafted_quantity or 1, 1), [(reg.item_id, reg.quantity) for reg in r.reagents])
+            for r in recipes
+        }
+        self.names = dict(names or {})
+        for r in recipes:
+            self.names.setdefault(r.crafted_item_id, r.name)
+            for reg in r.reagents:
+                self.names.setdefault(reg.item_id, reg.name)
+        # Unknown or zero prices mean the item cannot be bought
+        self.prices = {item_id: price for item_id, price in prices.items() if price}
+        self.cycle_edges = self._find_cycle_edges()
+        self._memo = {}
+
+    def _find_cycle_edges(self):
+        """
+        Depth-first search over crafted item -> reagent edges. Edges that point back to an item
+        still on the stack close a cycle; the solver treats those reagents as buy-only.
+        """
+        cycle_edges = set()
+        state = {} # item id -> 1 while on the stack, 2 when finished
+        for root in sorted(self.recipes):
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(sorted({i for i, _ in self.recipes[root][3]})))]
+            while stack:
+                item_id, children = stack[-1]
+                child = next(children, None)
+                if child is None:
+                    state[item_id] = 2
+                    stack.pop()
+                    continue
+                if state.get(child) == 1:
+                    cycle_edges.add((item_id, child))
+                elif child not in state and child in self.recipes:
+                    state[child] = 1
+                    stack.append((child, iter(sorted({i for i, _ in self.recipes[child][3]}))))
+        return cycle_edges
+
+    def cycles(self):
+        return sorted(self.cycle_edges)
+
+    # --- Solving ---
+
+    def unit_cost(self, item_id):
+        """ Returns (cheapest cost per unit, "buy" | "craft"); the cost is UNPRICED if the item can be neither bought nor crafted. """
+        decision = self._memo.get(item_id)
+        if decision is not None:
+            return decision
+
+        # Solve the reagents first with an explicit stack; deep chains would overflow recursion
+        stack = [item_id]
+        while stack:
+            current = stack[-1]
+            if current in self._memo:
+                stack.pop()
+                continue
+            pending = [
+                reagent for reagent, _ in self.recipes[current][3]
+                if reagent not in self._memo and (current, reagent) not in self.cycle_edges
+            ] if current in self.recipes else []
+            if pending:
+                stack.extend(pending)
+                continue
+            self._memo[current] = self._decide(current)
+            stack.pop()
+        return self._memo[item_id]
+
+    def _decide(self, item_id):
+        buy = self.prices.get(item_id, UNPRICED)
+        recipe = self.recipes.get(item_id)
+        if recipe is None:
+            return buy, "buy"
+        craft = self._craft_cost(item_id) / recipe[2]
+        if craft < buy:
+            return craft, "craft"
+        return buy, "buy"
+
+    def _craft_cost(self, item_id):
+        total = 0
+        for reagent, quantity in self.recipes[item_id][3]:
+            if (item_id, reagent) in self.cycle_edges:
+                cost = self.prices.get(reagent, UNPRICED)
+            else:
+                cost = self._memo[reagent][0]
+            total += cost * quantity
+        return total
+
+    def tree(self, item_id, quantity=1, force_craft=False, _path=()):
+        """
+        Expands the optimal acquisition of `quantity` units into a nested dict.
+        With force_craft the root is crafted even if buying it would be cheaper (used for recipe views).
+        """
+        unit_cost, action = self.unit_cost(item_id)
+        recipe = self.recipes.get(item_id)
+        if force_craft and recipe is not None:
+            action = "craft"
+        node = {
+            "item_id": item_id,
+            "name": self.names.get(item_id, f"Item {item_id}"),
+            "quantity": quantity,
+            "action": action,
+            "buy_price": self.prices.get(item_id),
+            "unit_cost": None,
+            "total_cost": None
+        }
+        if action == "craft" and item_id not in _path:
+            recipe_id, _, crafted_quantity, reagents = recipe
+            crafts = -(-quantity // crafted_quantity) # Whole crafts only
+            node["recipe_id"] = recipe_id
+            node["crafts"] = crafts
+            node["reagents"] = []
+            total = 0
+            for reagent, reagent_quantity in reagents:
+                if (item_id, reagent) in self.cycle_edges:
+                    child = self._bought(reagent, reagent_quantity * crafts)
+                else:
+                    child = self.tree(reagent, reagent_quantity * crafts, _path=_path + (item_id,))
+                node["reagents"].append(child)
+                total = total + child["total_cost"] if total is not None and child["total_cost"] is not None else None
+            node["total_cost"] = total
+            node["unit_cost"] = total / quantity if total is not None and quantity else None
+        elif unit_cost != UNPRICED:
+            node["action"] = "buy"
+            node["unit_cost"] = unit_cost
+            node["total_cost"] = unit_cost * quantity
+        return node
+
+    def _bought(self, item_id, quantity):
+        price = self.prices.get(item_id)
+        return {
+            "item_id": item_id,
+            "name": self.names.get(item_id, f"Item {item_id}"),
+            "quantity": quantity,
+            "action": "buy",
+            "buy_price": price,
+            "unit_cost": price,
+            "total_cost": price * quantity if price else None,
+            "cycle": True
+        }
+
+
+class CraftingGraphCache:
+    """ Keeps one solved graph per price generation, price source and realm; recipe edits drop them through invalidate(). """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._graphs = {} # (price source, realm id, region) -> (key, graph)
+        self._version = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+
+    def get(self, db, source="min", realm_id=None, region=None):
+        key = (market_index.snapshot.generation, self._version)
+        with self._lock:
+            cached = self._graphs.get((source, realm_id, region))
+            if cached is not None and cached[0] == key:
+                return cached[1]
+        recipes = db.query(models.Recipe).options(selectinload(models.Recipe.reagents)).all()
+        item_ids = {r.crafted_item_id for r in recipes} | {reg.item_id for r in recipes for reg in r.reagents}
+        names = dict(db.query(models.TrackedItem.item_id, models.TrackedItem.name)
+                     .filter(models.TrackedItem.item_id.in_(item_ids)).all()) if item_ids else {}
+        graph = CraftingGraph(recipes, analytics.get_latest_prices(db, item_ids, source, realm_id, region), names)
+        with self._lock:
+            self._graphs[(source, realm_id, region)] = (key, graph)
+        return graph
+
+
+crafting_graph = CraftingGraphCache()
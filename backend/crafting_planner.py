@@ -0,0 +1,188 @@
+"""
+crafting_planner.py
+Batch crafting planner: picks craft quantities across many recipes for a gold budget.
+Reagents are bought through the order book of the in-memory market snapshot, so recipes that
+share a reagent drive each other's costs up as the plan grows. Every recipe is capped by the
+number of units the market absorbs (its daily sell-through times the planning horizon).
+
+The solver is a lazy greedy: a heap holds the marginal profit of one more craft of every
+recipe. The best entry is re-priced against the reagents bought so far; if it is still at
+least as good as the next entry it is crafted, otherwise it goes back onto the heap.
+Marginal reagent costs are non-decreasing, so stale heap entries only ever overestimate.
+"""
+import heapq
+import time
+from bisect import bisect_left
+from sqlalchemy.orm import selectinload
+import models
+import analytics
+from market_index import market_index
+from liquidity_tracker import liquidity_tracker
+
+# Share of the sale price the auction house keeps
+AUCTION_HOUSE_CUT = 0.05
+
+
+class ReagentBook:
+    """ Order book of one reagent with the units already bought by the plan. """
+    __slots__ = ("prices", "cum_quantity", "cum_cost", "bought", "spent", "fallback_price")
+
+    def __init__(self, snapshot, item_id, fallback_price):
+        span = snapshot._locate(item_id)
+        if span is not None:
+            start, end = span
+            # Plain lists: bisect on a short list is much cheaper than a numpy call per step
+            self.prices = snapshot.prices[start:end].tolist()
+            self.cum_quantity = (snapshot.cum_quantity[start + 1:end + 1] - snapshot.cum_quantity[start]).tolist()
+            self.cum_cost = (snapshot.cum_cost[start + 1:end + 1] - snapshot.cum_cost[start]).tolist()
+        else:
+            self.prices = self.cum_quantity = self.cum_cost = None
+        self.fallback_price = fallback_price
+        self.bought = 0
+        self.spent = 0
+
+    def cost_of_first(self, quantity):
+        """ Cost of the cheapest `quantity` units, or None if the market does not hold that many. """
+        if quantity <= 0:
+            return 0
+        if self.prices is None:
+            # Not in the snapshot: price at the last recorded minimum, without depth
+            return self.fallback_price * quantity if self.fallback_price else None
+        if quantity > self.cum_quantity[-1]:
+            return None
+        level = bisect_left(self.cum_quantity, quantity)
+        before_qty = self.cum_quantity[level - 1] if level else 0
+        before_cost = self.cum_cost[level - 1] if level else 0
+        return before_cost + (quantity - before_qty) * self.prices[level]
+
+    def marginal_cost(self, quantity):
+        cost = self.cost_of_first(self.bought + quantity)
+        return None if cost is None else cost - self.spent
+
+    def buy(self, quantity):
+        self.bought += quantity
+        self.spent = self.cost_of_first(self.bought)
+
+
+def plan_crafts(db, budget, recipe_ids=None, days=1.0, max_crafts=None, realm_id=None, region=None):
+    """
+    Chooses craft counts per recipe that maximize expected profit within `budget` (copper).
+    `max_crafts` optionally overrides the sell-through cap of individual recipes ({recipe_id: crafts}).
+    Prices are those of `realm_id` (default: the home realm) or of a further `region`'s commodities.
+    """
+    started = time.perf_counter()
+    max_crafts = max_crafts or {}
+    snapshot = market_index.view(realm_id, region)
+
+    query = db.query(models.Recipe).options(selectinload(models.Recipe.reagents))
+    if recipe_ids:
+        query = query.filter(models.Recipe.id.in_(recipe_ids))
+    recipes = [r for r in query.all() if r.reagents]
+
+    crafted_ids = {r.crafted_item_id for r in recipes}
+    reagent_ids = {reg.item_id for r in recipes for reg in r.reagents}
+    latest = analytics.get_latest_prices(db, crafted_ids | reagent_ids, "market", realm_id, region)
+    rates = liquidity_tracker.sell_through_rates(db, crafted_ids)
+    names = {reg.item_id: reg.name for r in recipes for reg in r.reagents}
+    books = {item_id: ReagentBook(snapshot, item_id, latest.get(item_id, 0)) for item_id in reagent_ids}
+
+    candidates = {}
+    for r in recipes:
+        # Sell at the robust market value, so a single undercut auction does not skew the plan
+        sale_price = snapshot.market_value(r.crafted_item_id) or latest.get(r.crafted_item_id, 0)
+        # The market absorbs roughly sell-through * days units; crafts yield crafted_quantity each
+        crafted_quantity = max(r.crafted_quantity or 1, 1)
+        cap = max_crafts.get(r.id, int(rates.get(r.crafted_item_id, 0) * days) // crafted_quantity)
+        if sale_price <= 0 or cap <= 0:
+            continue
+        candidates[r.id] = {
+            "recipe": r,
+            "revenue": int(sale_price * crafted_quantity * (1 - AUCTION_HOUSE_CUT)),
+            "cap": cap,
+            "crafts": 0,
+            "cost": 0,
+            "reagents": [(reg.item_id, reg.quantity) for reg in r.reagents]
+        }
+
+    def marginal(entry):
+        cost = 0
+        for item_id, quantity in entry["reagents"]:
+            step = books[item_id].marginal_cost(quantity)
+            if step is None:
+                return None
+            cost += step
+        return cost
+
+    heap = []
+    for recipe_id, entry in candidates.items():
+        cost = marginal(entry)
+        if cost is not None and entry["revenue"] > cost:
+            heap.append((cost - entry["revenue"], recipe_id))
+    heapq.heapify(heap)
+
+    remaining = budget
+    while heap:
+        _, recipe_id = heapq.heappop(heap)
+        entry = candidates[recipe_id]
+        cost = marginal(entry)
+        if cost is None or entry["revenue"] <= cost or cost > remaining:
+            continue
+        profit = entry["revenue"] - cost
+        if heap and -heap[0][0] > profit:
+            # Shared reagents got more expensive since this entry was pushed
+            heapq.heappush(heap, (-profit, recipe_id))
+            continue
+
+        for item_id, quantity in entry["reagents"]:
+            books[item_id].buy(quantity)
+        entry["crafts"] += 1
+        entry["cost"] += cost
+        remaining -= cost
+        if entry["crafts"] < entry["cap"]:
+            heapq.heappush(heap, (-profit, recipe_id))
+
+    crafts = []
+    for entry in candidates.values():
+        if not entry["crafts"]:
+            continue
+        r = entry["recipe"]
+        revenue = entry["revenue"] * entry["crafts"]
+        crafts.append({
+            "recipe_id": r.id,
+            "name": r.name,
+            "crafted_item_id": r.crafted_item_id,
+            "crafts": entry["crafts"],
+            "max_crafts": entry["cap"],
+            "units": entry["crafts"] * max(r.crafted_quantity or 1, 1),
+            "expected_revenue": revenue,
+            "reagent_cost": entry["cost"],
+            "expected_profit": revenue - entry["cost"]
+        })
+    crafts.sort(key=lambda c: c["expected_profit"], reverse=True)
+
+    shopping_list = []
+    for item_id, book in books.items():
+        if not book.bought:
+            continue
+        shopping_list.append({
+            "item_id": item_id,
+            "name": names.get(item_id),
+            "quantity": book.bought,
+            "total_cost": book.spent,
+            "avg_unit_price": book.spent / book.bought,
+            "max_unit_price": book.prices[bisect_left(book.cum_quantity, book.bought)] if book.prices else book.fallback_price
+        })
+    shopping_list.sort(key=lambda s: s["total_cost"], reverse=True)
+
+    spent = budget - remaining
+    revenue = sum(c["expected_revenue"] for c in crafts)
+    return {
+        "budget": budget,
+        "spent": spent,
+        "expected_revenue": revenue,
+        "expected_profit": revenue - spent,
+        "crafts": crafts,
+        "shopping_list": shopping_list,
+        "generation": snapshot.generation,
+        "solve_seconds": round(time.perf_counter() - started, 4)
+    }
@@ -0,0 +1,189 @@
+"""
+indicators.py
+Streaming technical indicators for the tracked item prices and the WoW token.
+Each series keeps the last WINDOW samples with running sums, an exponential moving average
+and monotonic deques for the rolling minimum and maximum, so every new sample updates the
+SMA, EMA, rolling standard deviation, extrema and Bollinger-style bands in O(1).
+The values are stored per sample in series_indicators, next to the rollups, and the history
+endpoints join them onto the price rows they already load.
+
+Series keys: 'item:<blizzard item id>' and 'token:<region>'.
+Run this module directly to (re)compute the indicators of all existing history.
+"""
+import calendar
+import math
+import threading
+from collections import deque
+import models
+from analytics import realm_filter
+
+WINDOW = 48 # Samples (24h at the 30 minute ingestion cadence)
+EMA_SPAN = 12
+BAND_WIDTH = 2.0 # Bands at SMA +/- BAND_WIDTH standard deviations
+
+
+def item_series(item_id):
+    return f"item:{item_id}"
+
+
+def token_series(region):
+    return f"token:{region}"
+
+
+def epoch(timestamp):
+    """ Epoch seconds of a naive UTC datetime (or pass-through for Blizzard's integer timestamps). """
+    if isinstance(timestamp, int):
+        return timestamp
+    return calendar.timegm(timestamp.utctimetuple())
+
+
+class RollingIndicators:
+    __slots__ = ("values", "total", "total_sq", "ema", "count", "minima", "maxima")
+
+    def __init__(self):
+        self.values = deque()
+        self.total = 0
+        self.total_sq = 0
+        self.ema = None
+        self.count = 0
+        # (sample number, value); minima ascending and maxima descending in value
+        self.minima = deque()
+        self.maxima = deque()
+
+    def push(self, value):
+        self.count += 1
+        self.values.append(value)
+        self.total += value
+        self.total_sq += value * value
+        if len(self.values) > WINDOW:
+            old = self.values.popleft()
+            self.total -= old
+            self.total_sq -= old * old
+
+        while self.minima and self.minima[-1][1] >= value:
+            self.minima.pop()
+        self.minima.append((self.count, value))
+        if self.minima[0][0] <= self.count - WINDOW:
+            self.minima.popleft()
+        while self.maxima and self.maxima[-1][1] <= value:
+            self.maxima.pop()
+        self.maxima.append((self.count, value))
+        if self.maxima[0][0] <= self.count - WINDOW:
+            self.maxima.popleft()
+
+        alpha = 2.0 / (EMA_SPAN + 1)
+        self.ema = value if self.ema is None else self.ema + alpha * (value - self.ema)
+
+    def current(self):
+        n = len(self.values)
+        sma = self.total / n
+        # Prices are integers, so the variance numerator is exact
+        std = math.sqrt(max(n * self.total_sq - self.total * self.total, 0)) / n
+        return {
+            "sma": sma,
+            "ema": self.ema,
+            "std": std,
+            "rolling_min": self.minima[0][1],
+            "rolling_max": self.maxima[0][1],
+            "upper_band": sma + BAND_WIDTH * std,
+            "lower_band": sma - BAND_WIDTH * std
+        }
+
+
+class IndicatorEngine:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.states = {} # series -> (RollingIndicators, timestamp of the last sample)
+
+    def _warm(self, db, series, before):
+        """ Restores the state of a series from its last stored samples before `before`. """
+        rows = db.query(models.SeriesIndicator.value, models.SeriesIndicator.ema)\
+            .filter(models.SeriesIndicator.series == series, models.SeriesIndicator.timestamp < before)\
+            .order_by(models.SeriesIndicator.timestamp.desc(), models.SeriesIndicator.sample_id.desc()).limit(WINDOW).all()
+        state = RollingIndicators()
+        for value, _ in reversed(rows):
+            state.push(value)
+        if rows:
+            state.ema = rows[0][1]
+        return state
+
+    def update(self, db, series, sample_id, timestamp, value):
+        """ Folds one new sample into its series and adds the SeriesIndicator row. The caller commits. """
+        ts = epoch(timestamp)
+        with self._lock:
+            state, last_ts = self.states.get(series, (None, None))
+            if state is None or ts < last_ts:
+                # First sample since startup, or an out-of-order write (e.g. a replay)
+                state = self._warm(db, series, ts)
+            state.push(value)
+            self.states[series] = (state, ts)
+            row = models.SeriesIndicator(series=series, sample_id=sample_id, timestamp=ts, value=value, **state.current())
+        db.add(row)
+        return row
+
+    def forget(self, series_keys=None):
+        """ Drops cached states (all if None) so they are reloaded from the table. """
+        with self._lock:
+            if series_keys is None:
+                self.states = {}
+            for series in series_keys or ():
+                self.states.pop(series, None)
+
+
+def indicator_fields(row):
+    """ Indicator columns of a SeriesIndicator row for API responses (None if not computed). """
+    if row is None:
+        return {"sma": None, "ema": None, "std": None, "rolling_min": None, "rolling_max": None, "upper_band": None, "lower_band": None}
+    return {
+        "sma": row.sma,
+        "ema": row.ema,
+        "std": row.std,
+        "rolling_min": row.rolling_min,
+        "rolling_max": row.rolling_max,
+        "upper_band": row.upper_band,
+        "lower_band": row.lower_band
+    }
+
+
+def rebuild_from_history(db):
+    """ Recomputes the indicators of every item and token series from the raw history. """
+    db.query(models.SeriesIndicator).delete(synchronize_session=False)
+    item_ids = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id).all())
+
+    def run(series_rows):
+        rows, states = [], {}
+        for series, sample_id, timestamp, value in series_rows:
+            state = states.setdefault(series, RollingIndicators())
+            state.push(value)
+            rows.append(dict(series=series, sample_id=sample_id, timestamp=epoch(timestamp), value=value, **state.current()))
+            if len(rows) >= 5000:
+                db.bulk_insert_mappings(models.SeriesIndicator, rows)
+                rows = []
+        db.bulk_insert_mappings(models.SeriesIndicator, rows)
+
+    # Indicators follow the home realm's prices, like the live ingestion
+    history = db.query(models.ItemPriceHistory.item_id, models.ItemPriceHistory.id, models.ItemPriceHistory.timestamp, models.ItemPriceHistory.buyout)\
+        .filter(realm_filter())\
+        .order_by(models.ItemPriceHistory.item_id.asc(), models.ItemPriceHistory.timestamp.asc(), models.ItemPriceHistory.id.asc())
+    run((item_series(item_ids[pk]), sample_id, ts, value) for pk, sample_id, ts, value in history.yield_per(5000) if pk in item_ids)
+
+    tokens = db.query(models.WowTokenHistory.region, models.WowTokenHistory.id, models.WowTokenHistory.last_updated_timestamp, models.WowTokenHistory.price)\
+        .order_by(models.WowTokenHistory.last_updated_timestamp.asc(), models.WowTokenHistory.id.asc())
+    run((token_series(region or "eu"), sample_id, ts, value) for region, sample_id, ts, value in tokens.yield_per(5000))
+    db.commit()
+    indicator_engine.forget()
+
+
+indicator_engine = IndicatorEngine()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        print("Recomputing indicators from item_price_history and wow_token_history...")
+        rebuild_from_history(session)
+        print(f"Done. {session.query(models.SeriesIndicator).count()} indicator rows.")
+    finally:
+        session.close()
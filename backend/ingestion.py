@@ -0,0 +1,167 @@
+"""
+ingestion.py
+Turns one market snapshot into persisted history for the tracked items: price history rows,
+auction-level sell-through, hourly rollups, streaming indicators and hour-of-week seasonality.
+Shared by the live background update (main.py) and the archive replay (replay.py), so both
+produce exactly the same data from the same snapshot.
+
+The derived data (sell-through, rollups, indicators, seasonality) follows the home realm;
+further tracked realms and regions only get price history rows (record_realm_prices,
+record_region_prices). Tracked items listed
+in several variants also get a price history row per variant (record_variant_prices).
+"""
+import json
+import models
+import rollups
+import seasonality
+from indicators import indicator_engine, item_series
+from auction_diff import record_sell_through
+from market_index import describe_variant
+
+
+def summarize_items(snapshot, item_ids):
+    """ Maps each listed item id to (min_price, market_value, total_quantity) in the snapshot. """
+    summaries = {}
+    for item_id in item_ids:
+        price = snapshot.min_price(item_id)
+        if price is not None:
+            summaries[item_id] = (price, snapshot.market_value(item_id), snapshot.total_quantity(item_id))
+    return summaries
+
+
+def record_market_state(db, snapshot, diffs, tracked_items, timestamp, verbose=True, realm_id=None, commodities=None, fresh=None):
+    """
+    Writes the state of `snapshot` at `timestamp` for `tracked_items` and returns the new
+    ItemPriceHistory and ItemSellThrough rows. `diffs` are the sell-through diffs of the same
+    run (may be empty). The caller commits.
+    Rows get `realm_id`, except for items listed in `commodities` (the region-wide snapshot).
+    With `fresh` (the snapshots of the sources that published a new frame in this run) only
+    items listed in one of them get price rows; the others would repeat the previous sample.
+    """
+    priced_items = tracked_items
+    if fresh is not None:
+        priced_items = [item for item in tracked_items if any(s.contains(item.item_id) for s in fresh)]
+    summaries = summarize_items(snapshot, [item.item_id for item in priced_items])
+
+    new_entries = []
+    for item in priced_items:
+        if item.item_id in summaries:
+            price, market_value, quantity = summaries[item.item_id]
+            new_entries.append(models.ItemPriceHistory(
+                item_id=item.id,
+                buyout=price,
+                market_value=market_value,
+                quantity=quantity,
+                timestamp=timestamp,
+                realm_id=None if commodities is not None and commodities.contains(item.item_id) else realm_id
+            ))
+            if verbose:
+                print(f"Updated {item.name}: {price / 10000}g, market value {market_value / 10000}g (Qty: {quantity})")
+
+    if new_entries:
+        db.add_all(new_entries)
+    record_variant_prices(db, snapshot, priced_items, timestamp, realm_id)
+
+    sell_through_rows = record_sell_through(db, diffs, tracked_items)
+    if sell_through_rows and verbose:
+        print("Recorded auction-level sell-through for tracked items.")
+
+    rollups.record_samples(
+        db,
+        timestamp,
+        {entry.item_id: (entry.buyout, entry.quantity) for entry in new_entries},
+        measured_sold={row.item_id: row.sold_units for row in sell_through_rows}
+    )
+    # record_samples flushed, so the history rows have their ids
+    item_ids = {item.id: item.item_id for item in tracked_items}
+    for entry in new_entries:
+        indicator_engine.update(db, item_series(item_ids[entry.item_id]), entry.id, timestamp, entry.buyout)
+
+    samples = {item_series(item_ids[entry.item_id]): (entry.buyout, None) for entry in new_entries}
+    for row in sell_through_rows:
+        series = item_series(item_ids[row.item_id])
+        samples[series] = (samples.get(series, (None, None))[0], seasonality.sold_per_hour(row))
+    seasonality.record(db, timestamp, samples)
+    return new_entries, sell_through_rows
+
+
+def record_realm_prices(db, realm_snapshots, tracked_items, timestamp):
+    """
+    Writes price history rows for the tracked items listed on further realms. `realm_snapshots`
+    maps realm ids to snapshots of the realm's own auctions, so commodities are not repeated.
+    Returns the new rows; the caller commits.
+    """
+    pks = {item.item_id: item.id for item in tracked_items}
+    new_entries = []
+    for realm_id, snapshot in realm_snapshots.items():
+        for item_id, (price, market_value, quantity) in summarize_items(snapshot, pks).items():
+            new_entries.append(models.ItemPriceHistory(
+                item_id=pks[item_id],
+                buyout=price,
+                market_value=market_value,
+                quantity=quantity,
+                timestamp=timestamp,
+                realm_id=realm_id
+            ))
+        record_variant_prices(db, snapshot, tracked_items, timestamp, realm_id)
+    db.add_all(new_entries)
+    return new_entries
+
+
+def record_region_prices(db, region_snapshots, tracked_items, timestamp):
+    """
+    Writes price history rows for the tracked items listed on the commodity auction house of
+    further regions ({region: MarketSnapshot}). Returns the new rows; the caller commits.
+    """
+    pks = {item.item_id: item.id for item in tracked_items}
+    new_entries = []
+    for region, snapshot in region_snapshots.items():
+        for item_id, (price, market_value, quantity) in summarize_items(snapshot, pks).items():
+            new_entries.append(models.ItemPriceHistory(
+                item_id=pks[item_id],
+                buyout=price,
+                market_value=market_value,
+                quantity=quantity,
+                timestamp=timestamp,
+                region=region
+            ))
+    db.add_all(new_entries)
+    return new_entries
+
+
+def record_variant_prices(db, snapshot, tracked_items, timestamp, realm_id):
+    """
+    Writes a price history row per listed variant of the tracked items and registers variants
+    not seen before in item_variants. Returns the new price rows; the caller commits.
+    """
+    if snapshot.variants is None:
+        return []
+    pks = {item.item_id: item.id for item in tracked_items}
+    keys = [key for item_id in pks for key in snapshot.item_variants(item_id).tolist()]
+    if not keys:
+        return []
+
+    known = {key for (key,) in db.query(models.ItemVariant.variant_key).filter(models.ItemVariant.variant_key.in_(keys))}
+    for key in keys:
+        if key not in known and key in snapshot.variant_info:
+            item_id = snapshot.variant_info[key][0]
+            bonus_ids, modifiers = describe_variant(snapshot.variant_info[key])
+            db.add(models.ItemVariant(variant_key=key, item_id=item_id, bonus_ids=",".join(map(str, bonus_ids)),
+                                      modifiers=json.dumps(modifiers) if modifiers else None, first_seen_at=timestamp))
+    # The same variant can be listed on several realms of this run
+    db.flush()
+
+    variants = snapshot.variants
+    new_entries = []
+    for key, (price, market_value, quantity) in summarize_items(variants, keys).items():
+        new_entries.append(models.ItemPriceHistory(
+            item_id=pks[snapshot.variant_item(key)],
+            variant_key=key,
+            buyout=price,
+            market_value=market_value,
+            quantity=quantity,
+            timestamp=timestamp,
+            realm_id=realm_id
+        ))
+    db.add_all(new_entries)
+    return new_entries
@@ -0,0 +1,153 @@
+"""
+job_queue.py
+Durable job queue and leases in the database, shared by the API and the worker process.
+The API only enqueues ("sync now", "update prices now"); the worker claims a job by setting
+a lease on it and renews the lease with heartbeats while the job runs. If a worker dies, the
+lease runs out and the job is queued again (up to max_attempts). At most one job per kind is
+queued or running at a time, enforced by a partial unique index on dedupe_key.
+
+Named leases in worker_leases make sure only one worker runs the scheduler; worker_state
+carries small results of the worker (e.g. polling metrics) to the API processes.
+"""
+import json
+from datetime import datetime, timedelta
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+import models
+
+# Kinds the worker can run; they match the names of its scheduled jobs
+JOB_KINDS = ("task_reset", "token_price", "commodity_prices", "character_sync", "backup", "correlations")
+ACTIVE = ("queued", "running")
+LEASE_SECONDS = 90
+HEARTBEAT_SECONDS = 30
+
+
+def enqueue(db, kind, payload=None, max_attempts=3):
+    """ Queues a job unless one of the same kind is already queued or running. Returns (job, created). """
+    existing = db.query(models.QueuedJob).filter(models.QueuedJob.dedupe_key == kind, models.QueuedJob.status.in_(ACTIVE)).first()
+    if existing:
+        return existing, False
+    now = datetime.utcnow()
+    job = models.QueuedJob(kind=kind, payload=json.dumps(payload) if payload is not None else None, status="queued",
+                           dedupe_key=kind, created_at=now, available_at=now, attempts=0, max_attempts=max_attempts)
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another process queued the same kind in the meantime
+        db.rollback()
+        return db.query(models.QueuedJob).filter(models.QueuedJob.dedupe_key == kind, models.QueuedJob.status.in_(ACTIVE)).first(), False
+    return job, True
+
+
+def recover_expired(db):
+    """ Requeues running jobs whose lease ran out; jobs out of attempts fail. Returns the number requeued. """
+    now = datetime.utcnow()
+    expired = models.QueuedJob.status == "running", models.QueuedJob.lease_until < now
+    db.query(models.QueuedJob).filter(*expired, models.QueuedJob.attempts >= models.QueuedJob.max_attempts)\
+        .update({models.QueuedJob.status: "failed", models.QueuedJob.finished_at: now,
+                 models.QueuedJob.error: "Lease expired (worker lost)"}, synchronize_session=False)
+    requeued = db.query(models.QueuedJob).filter(*expired)\
+        .update({models.QueuedJob.status: "queued", models.QueuedJob.worker_id: None, models.QueuedJob.lease_until: None},
+                synchronize_session=False)
+    db.commit()
+    return requeued
+
+
+def claim(db, worker_id, kinds=JOB_KINDS):
+    """ Claims the oldest available job of `kinds` for `worker_id`; returns it or None. """
+    now = datetime.utcnow()
+    candidates = db.query(models.QueuedJob.id)\
+        .filter(models.QueuedJob.status == "queued", models.QueuedJob.available_at <= now, models.QueuedJob.kind.in_(kinds))\
+        .order_by(models.QueuedJob.id.asc()).limit(5).all()
+    for (job_id,) in candidates:
+        # The status condition makes the claim atomic: only one worker's update matches
+        claimed = db.query(models.QueuedJob).filter(models.QueuedJob.id == job_id, models.QueuedJob.status == "queued")\
+            .update({models.QueuedJob.status: "running", models.QueuedJob.worker_id: worker_id,
+                     models.QueuedJob.started_at: now, models.QueuedJob.heartbeat_at: now,
+                     models.QueuedJob.lease_until: now + timedelta(seconds=LEASE_SECONDS),
+                     models.QueuedJob.attempts: models.QueuedJob.attempts + 1}, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.query(models.QueuedJob).filter(models.QueuedJob.id == job_id).first()
+    return None
+
+
+def heartbeat(db, job_id, worker_id):
+    """ Extends the lease of a running job; False if the worker no longer holds it. """
+    now = datetime.utcnow()
+    renewed = db.query(models.QueuedJob)\
+        .filter(models.QueuedJob.id == job_id, models.QueuedJob.worker_id == worker_id, models.QueuedJob.status == "running")\
+        .update({models.QueuedJob.heartbeat_at: now, models.QueuedJob.lease_until: now + timedelta(seconds=LEASE_SECONDS)},
+                synchronize_session=False)
+    db.commit()
+    return bool(renewed)
+
+
+def finish(db, job_id, worker_id, status, error=None):
+    """ Marks a claimed job as done, failed or skipped. """
+    db.query(models.QueuedJob).filter(models.QueuedJob.id == job_id, models.QueuedJob.worker_id == worker_id)\
+        .update({models.QueuedJob.status: status, models.QueuedJob.error: error, models.QueuedJob.finished_at: datetime.utcnow(),
+                 models.QueuedJob.lease_until: None}, synchronize_session=False)
+    db.commit()
+
+
+def job_dict(job):
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "worker_id": job.worker_id,
+        "attempts": job.attempts,
+        "error": job.error
+    }
+
+
+# --- Named leases ---
+
+def acquire_lease(db, name, owner, seconds=LEASE_SECONDS):
+    """ Takes or renews the lease `name` for `owner`; False while another owner holds an unexpired lease. """
+    now = datetime.utcnow()
+    until = now + timedelta(seconds=seconds)
+    updated = db.query(models.WorkerLease)\
+        .filter(models.WorkerLease.name == name, or_(models.WorkerLease.owner == owner, models.WorkerLease.lease_until < now))\
+        .update({models.WorkerLease.owner: owner, models.WorkerLease.lease_until: until}, synchronize_session=False)
+    db.commit()
+    if updated:
+        return True
+    if db.query(models.WorkerLease).filter(models.WorkerLease.name == name).first():
+        return False
+    db.add(models.WorkerLease(name=name, owner=owner, lease_until=until))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return False
+
+
+def release_lease(db, name, owner):
+    db.query(models.WorkerLease).filter(models.WorkerLease.name == name, models.WorkerLease.owner == owner)\
+        .delete(synchronize_session=False)
+    db.commit()
+
+
+# --- Shared state ---
+
+def save_state(db, name, data):
+    """ Stores a JSON-serializable value the worker shares with the API processes (e.g. polling metrics). """
+    state = db.query(models.WorkerState).filter(models.WorkerState.name == name).first()
+    if state is None:
+        state = models.WorkerState(name=name)
+        db.add(state)
+    state.data = json.dumps(data)
+    state.updated_at = datetime.utcnow()
+    db.commit()
+
+
+def load_state(db, name, default=None):
+    state = db.query(models.WorkerState).filter(models.WorkerState.name == name).first()
+    return json.loads(state.data) if state and state.data else default
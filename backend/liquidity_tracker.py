@@ -0,0 +1,238 @@
+"""
+liquidity_tracker.py
+Incrementally maintained liquidity and profit metrics for the /api/analysis/glyphs ranking.
+Each tracked item keeps a 48h sliding window of hourly buckets (estimated and measured units
+sold, price changes, samples) with running totals, updated in O(1) when a new sample arrives
+and decremented when buckets age out. Recipe crafting costs are adjusted through a reagent ->
+recipe index whenever a reagent price moves, and the top-K ranking is recomputed once per
+ingestion, so the endpoint is a plain read.
+After a restart the state is rebuilt from the hourly rollups (see rollups.py).
+"""
+import heapq
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from sqlalchemy.orm import selectinload
+import models
+import rollups
+
+WINDOW_HOURS = 48
+TOP_K = 10
+# A few hours of auction-level data are too little to extrapolate a daily rate from
+MIN_MEASURED_HOURS = 6
+
+
+class ItemWindow:
+    """ Sliding window of one item. Buckets are [bucket_start, sold, changes, samples, measured or None]. """
+    __slots__ = ("buckets", "sold", "changes", "samples", "measured", "measured_hours", "last_price", "last_quantity")
+
+    def __init__(self):
+        self.buckets = deque()
+        self.sold = 0
+        self.changes = 0
+        self.samples = 0
+        self.measured = 0
+        self.measured_hours = 0
+        self.last_price = None
+        self.last_quantity = None
+
+    def _bucket(self, bucket_start):
+        if not self.buckets or self.buckets[-1][0] != bucket_start:
+            self.buckets.append([bucket_start, 0, 0, 0, None])
+        return self.buckets[-1]
+
+    def add(self, bucket_start, sold=0, changes=0, samples=0, measured=None):
+        bucket = self._bucket(bucket_start)
+        bucket[1] += sold
+        bucket[2] += changes
+        bucket[3] += samples
+        self.sold += sold
+        self.changes += changes
+        self.samples += samples
+        if measured is not None:
+            if bucket[4] is None:
+                bucket[4] = 0
+                self.measured_hours += 1
+            bucket[4] += measured
+            self.measured += measured
+
+    def observe(self, bucket_start, price, quantity, measured=None):
+        """ Folds in one new sample, using the same sales heuristic as analytics and rollups. """
+        sold = changes = 0
+        if self.last_price is not None:
+            if price == self.last_price and quantity < self.last_quantity:
+                sold = self.last_quantity - quantity
+            elif price != self.last_price:
+                changes = 1
+        self.add(bucket_start, sold, changes, 1, measured)
+        self.last_price = price
+        self.last_quantity = quantity
+
+    def evict(self, oldest_bucket):
+        while self.buckets and self.buckets[0][0] < oldest_bucket:
+            _, sold, changes, samples, measured = self.buckets.popleft()
+            self.sold -= sold
+            self.changes -= changes
+            self.samples -= samples
+            if measured is not None:
+                self.measured -= measured
+                self.measured_hours -= 1
+
+    def sell_through_rate(self):
+        """ Daily sell-through: measured if enough auction-level data exists, else estimated over 48h. """
+        if self.measured_hours >= MIN_MEASURED_HOURS:
+            return self.measured / (self.measured_hours / 24.0)
+        return self.sold / (WINDOW_HOURS / 24.0)
+
+
+class LiquidityTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = False
+        self.windows = {} # Blizzard item id -> ItemWindow
+        self.prices = {} # Blizzard item id -> latest price (also outside the window)
+        self.recipes = [] # [recipe_id, name, crafted_item_id, [(reagent_item_id, quantity)], crafting_cost]
+        self.reagent_users = {} # Reagent item id -> [(recipe entry, quantity)]
+        self.recipes_dirty = True
+        self.top = []
+        self.updated_at = None
+
+    # --- Loading ---
+
+    def rebuild(self, db, now=None):
+        """ Rebuilds all windows and recipe costs from the hourly rollups of the last 48h. """
+        now = now or datetime.utcnow()
+        oldest = rollups.bucket_start(now) - timedelta(hours=WINDOW_HOURS - 1)
+        item_ids = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id).all())
+
+        windows = {}
+        rows = db.query(models.ItemPriceRollup)\
+            .filter(models.ItemPriceRollup.bucket_start >= oldest)\
+            .order_by(models.ItemPriceRollup.item_id.asc(), models.ItemPriceRollup.bucket_start.asc()).all()
+        for row in rows:
+            if row.item_id not in item_ids:
+                continue
+            window = windows.setdefault(item_ids[row.item_id], ItemWindow())
+            window.add(row.bucket_start, row.sold_units or 0, row.price_changes or 0, row.samples or 0, row.measured_sold_units)
+            window.last_price = row.close_buyout
+            window.last_quantity = row.close_quantity
+
+        prices = {}
+        for pk, row in rollups.latest_rollups(db, list(item_ids), now).items():
+            prices[item_ids[pk]] = row.close_buyout
+
+        with self._lock:
+            self.windows = windows
+            self.prices = prices
+            self._load_recipes(db)
+            self._refresh(now)
+            self.loaded = True
+
+    def _load_recipes(self, db):
+        self.recipes = []
+        self.reagent_users = {}
+        for recipe in db.query(models.Recipe).options(selectinload(models.Recipe.reagents)).order_by(models.Recipe.id.asc()).all():
+            reagents = [(reg.item_id, reg.quantity) for reg in recipe.reagents]
+            entry = [recipe.id, recipe.name, recipe.crafted_item_id, reagents,
+                     sum(self.prices.get(item_id, 0) * qty for item_id, qty in reagents)]
+            self.recipes.append(entry)
+            for item_id, qty in reagents:
+                self.reagent_users.setdefault(item_id, []).append((entry, qty))
+        self.recipes_dirty = False
+
+    def invalidate_recipes(self):
+        """ Called when recipes or reagents change; the recipe index is reloaded on the next read. """
+        self.recipes_dirty = True
+
+    # --- Updates ---
+
+    def observe(self, db, timestamp, samples):
+        """
+        Applies one ingestion run. `samples` maps Blizzard item ids to (price, quantity, measured_sold or None).
+        """
+        if not self.loaded:
+            # The rollups written for this run already contain the samples
+            self.rebuild(db, timestamp)
+            return
+
+        bucket = rollups.bucket_start(timestamp)
+        with self._lock:
+            if self.recipes_dirty:
+                self._load_recipes(db)
+            for item_id, (price, quantity, measured) in samples.items():
+                self.windows.setdefault(item_id, ItemWindow()).observe(bucket, price, quantity, measured)
+
+                old_price = self.prices.get(item_id, 0)
+                if price != old_price:
+                    for entry, qty in self.reagent_users.get(item_id, ()):
+                        entry[4] += (price - old_price) * qty
+                    self.prices[item_id] = price
+            self._refresh(timestamp)
+
+    def _refresh(self, now):
+        oldest = rollups.bucket_start(now) - timedelta(hours=WINDOW_HOURS - 1)
+        for window in self.windows.values():
+            window.evict(oldest)
+        self.top = heapq.nlargest(TOP_K, self._scored(), key=lambda r: r["liquidity_score"])
+        self.updated_at = now
+
+    def _scored(self):
+        for recipe_id, name, crafted_item_id, _, crafting_cost in self.recipes:
+            window = self.windows.get(crafted_item_id)
+            if window is None or window.samples < 2:
+                continue
+            sell_through_rate = window.sell_through_rate()
+            if sell_through_rate < 1:
+                continue
+
+            current_price = window.last_price
+            profit = current_price - crafting_cost
+            if profit <= 0:
+                continue
+
+            # Liquidity score = Sell-through rate * Profit margin / (Price changes + 1)
+            profit_margin = profit / crafting_cost if crafting_cost > 0 else 0
+            stability_index = 1.0 / (window.changes + 1)
+            yield {
+                "item_id": crafted_item_id,
+                "name": name,
+                "sell_through_rate_24h": sell_through_rate,
+                "price_changes_48h": window.changes,
+                "current_price": current_price,
+                "crafting_cost": crafting_cost,
+                "profit": profit,
+                "liquidity_score": sell_through_rate * profit_margin * stability_index,
+                "stability_index": stability_index
+            }
+
+    # --- Reads ---
+
+    def top_recipes(self, db, limit=TOP_K):
+        now = datetime.utcnow()
+        if not self.loaded:
+            self.rebuild(db, now)
+        elif self.recipes_dirty or rollups.bucket_start(now) != rollups.bucket_start(self.updated_at):
+            # Recipes changed, or an hour passed without ingestion and old buckets must age out
+            with self._lock:
+                if self.recipes_dirty:
+                    self._load_recipes(db)
+                self._refresh(now)
+        return self.top[:limit]
+
+    def crafting_costs(self, db):
+        """ Current reagent cost per craft, keyed by crafted Blizzard item id. """
+        if not self.loaded:
+            self.rebuild(db)
+        elif self.recipes_dirty:
+            with self._lock:
+                self._load_recipes(db)
+        return {entry[2]: entry[4] for entry in self.recipes}
+
+    def sell_through_rates(self, db, item_ids):
+        """ Daily sell-through of the given Blizzard item ids over the current window (0 if unknown). """
+        if not self.loaded:
+            self.rebuild(db)
+        return {item_id: self.windows[item_id].sell_through_rate() if item_id in self.windows else 0.0 for item_id in item_ids}
+
+
+liquidity_tracker = LiquidityTracker()
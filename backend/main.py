@@ -6,14 +6,14 @@ for World of Warcraft tokens, characters, and commodity prices.
 
 [2026-02-25T14:15:00] STATUS: WORKING (v.0.5.2)
 - Battle.net OAuth Login and Return-Redirect redirect successfully
-- Background Character Sync correctly fetches item level, gold, names, equipment, and professions (JSON)
+- Background Character Sync correctly fetches item level, gold, names, equipment, and professions
 - Clean database schema reset via SQLAlchemy applied & Historical data recovered
 - Token and Item tracking fetch accurately, history restored
 - Playtime metrics successfully removed as unsupported by Blizzard Web API
 DO NOT BREAK THIS BASE FUNCTIONALITY.
 """
 
-from fastapi import FastAPI, Depends, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Request
 from pydantic import BaseModel
 import pydantic
 from sqlalchemy.orm import Session
@@ -36,33 +36,66 @@ import asyncio
 import time
 from datetime import datetime, timedelta
 from contextlib import asynccontextmanager
-import backup
+import os
 import auto_restore
+import snapshot_archive
+import snapshot_worker
+import correlation
+import seasonality
+import scheduler
+import job_queue
+import market_state
+from market_state import market_state_reader
+from publish_cadence import publish_tracker, poll_sources
+from market_index import market_index, MarketSnapshot, build_views, realm_source, source_realm, region_source, source_region, describe_variant
+from auction_diff import sell_through_tracker
+from ingestion import record_market_state, record_realm_prices, record_region_prices
+from liquidity_tracker import liquidity_tracker
+from crafting_graph import crafting_graph
+from crafting_planner import plan_crafts
+from arbitrage import arbitrage_index
+from market_scanner import market_scanner, METRICS as SCANNER_METRICS, MAX_HOURS as SCANNER_MAX_HOURS
+from alerts import alert_engine, event_dict, RULE_KINDS, SINKS
+from indicators import indicator_engine, indicator_fields, item_series, token_series
 
 # Attempt auto-restore before SQLAlchemy tries to bind/create tables
 auto_restore.check_and_restore()
 
 models.Base.metadata.create_all(bind=engine)
 
-# Global API Client
+# Global API Client of the primary region; further regions have their own (see get_client)
 blizzard_client = None
+blizzard_clients = {}
+latest_snapshots = {} # Auction source -> MarketSnapshot of its latest frame, combined into the realm views
 
-async def update_token_price(db: Session):
+def get_client(region=None):
+    """ Pooled API client of a configured region (default: the primary region). """
+    global blizzard_client
+    region = region or config.region
+    if region == config.region:
+        if not blizzard_client:
+            blizzard_client = BlizzardAPI(config.client_id, config.client_secret, config.region)
+        return blizzard_client
+    if region not in blizzard_clients:
+        blizzard_clients[region] = BlizzardAPI(config.client_id, config.client_secret, region)
+    return blizzard_clients[region]
+
+async def update_token_price(db: Session, region=None):
     """
-    Background Task: Fetches the latest WoW Token price from the Blizzard API.
-    It checks if the timestamp is already in the database and inserts a new record if not.
+    Background Task: Fetches the latest WoW Token price of a region (default: the primary region)
+    from the Blizzard API. It checks if the timestamp is already in the database and inserts a new
+    record if not.
     """
-    global blizzard_client
     if not config.client_id or not config.client_secret:
         print("Missing Blizzard API credentials.")
         return
 
-    if not blizzard_client:
-        blizzard_client = BlizzardAPI(config.client_id, config.client_secret, config.region)
-
-    print("Fetching WoW Token Price...")
+    region = region or config.region
+    client = get_client(region)
+    print(f"Fetching WoW Token Price ({region})...")
     try:
-        data = blizzard_client.get_wow_token_price()
+        # In a thread, so the regions are fetched concurrently
+        data = await asyncio.to_thread(client.get_wow_token_price)
         if data:
             price_copper = data.get("price")
             # Blizzard returns milliseconds, we store seconds
@@ -70,106 +103,199 @@ async def update_token_price(db: Session):
             last_updated = int(last_updated_ms / 1000)
 
             # Check if this timestamp already exists to avoid duplicates
-            existing = db.query(models.WowTokenHistory).filter_by(last_updated_timestamp=last_updated).first()
+            existing = db.query(models.WowTokenHistory).filter(models.WowTokenHistory.last_updated_timestamp == last_updated,
+                                                               token_region_filter(region)).first()
             if not existing:
                 new_entry = models.WowTokenHistory(
                     price=price_copper,
                     last_updated_timestamp=last_updated,
-                    region=config.region
+                    region=region
                 )
                 db.add(new_entry)
                 db.commit()
-                print(f"Updated Token Price: {price_copper / 10000}g")
+                indicator_engine.update(db, token_series(region), new_entry.id, last_updated, price_copper)
+                seasonality.record(db, last_updated, {token_series(region): (price_copper, None)})
+                db.commit()
+                print(f"Updated Token Price ({region}): {price_copper / 10000}g")
             else:
-                print("Token price already up to date.")
+                print(f"Token price ({region}) already up to date.")
     except Exception as e:
-        print(f"Error updating token price: {e}")
+        print(f"Error updating token price ({region}): {e}")
+
+def token_region_filter(region):
+    # Rows from before multi-region support may have no region; they were all "eu"
+    return sqlalchemy.func.coalesce(models.WowTokenHistory.region, "eu") == region
 
 async def update_commodity_prices(db: Session):
     """
     Background Task: Updates prices for all user-tracked commodities.
-    It takes an auction house snapshot from the Blizzard API, extracts the lowest prices
-    for tracked items, and saves them to the price history table.
+    It polls the commodity auction house and those of all tracked connected realms whose next
+    snapshot is due, in parallel, rebuilds the in-memory market view of every realm from the new
+    snapshots, extracts the lowest prices for tracked items, and saves them to the price history
+    (per realm) and the rollup tables (home realm).
     """
+    if not config.client_id or not config.client_secret:
+        print("Missing Blizzard API credentials.")
+        return
+
     try:
-        print("Updating Commodity and Realm Prices...")
-        tracked_items = db.query(models.TrackedItem).all()
-        if not tracked_items:
-            print("No tracked items. Skipping update.")
+        realm_ids = config.realm_ids()
+        home_realm_id = realm_ids[0]
+        client = get_client()
+        fetchers = {"commodities": (client, lambda since: client.get_commodity_price_snapshot(since, spool=True))}
+        for realm_id in realm_ids:
+            fetchers[realm_source(realm_id)] = (client, lambda since, realm_id=realm_id: client.get_realm_auctions_snapshot(realm_id, since, spool=True))
+        # Further regions: their commodities, through the client of the region
+        for region in config.regions()[1:]:
+            source = region_source(region)
+            region_client = get_client(region)
+            fetchers[source] = (region_client, lambda since, c=region_client, source=source: c.get_commodity_price_snapshot(since, spool=True, kind=source))
+        publish_tracker.warm(db)
+
+        # Only sources whose next snapshot is predicted to be out are polled, concurrently.
+        # Downloads run in threads and parsing in the worker processes, so the event loop
+        # keeps serving API requests meanwhile.
+        new_frames = await poll_sources(db, fetchers)
+        db.commit()
+
+        if not new_frames:
+            print("No new auction snapshot published. Skipping update.")
             return
 
-        tracked_ids = {item.item_id for item in tracked_items}
-        min_prices = {} 
-        total_quantities = {}
-
-        # Fetch Commodity snapshot
-        c_snapshot = blizzard_client.get_commodity_price_snapshot()
-        if c_snapshot and 'auctions' in c_snapshot:
-            c_auctions = c_snapshot['auctions']
-            print(f"Processing {len(c_auctions)} commodity auctions...")
-            for auction in c_auctions:
-                item_id = auction['item']['id']
-                if item_id in tracked_ids:
-                    price = auction.get('unit_price', auction.get('buyout', 0))
-                    qty = auction.get('quantity', 1)
-                    
-                    if item_id not in total_quantities:
-                        total_quantities[item_id] = 0
-                    total_quantities[item_id] += qty
-
-                    if price > 0:
-                        if item_id not in min_prices or price < min_prices[item_id]:
-                            min_prices[item_id] = price
-
-        # Fetch Realm snapshot
-        home_realm_id = getattr(config, 'home_realm_id', '1618')
-        r_snapshot = blizzard_client.get_realm_auctions_snapshot(home_realm_id)
-        if r_snapshot and 'auctions' in r_snapshot:
-            r_auctions = r_snapshot['auctions']
-            print(f"Processing {len(r_auctions)} realm auctions for realm {home_realm_id}...")
-            for auction in r_auctions:
-                item_id = auction['item']['id']
-                if item_id in tracked_ids:
-                    price = auction.get('unit_price', auction.get('buyout', 0))
-                    qty = auction.get('quantity', 1)
-                    
-                    if item_id not in total_quantities:
-                        total_quantities[item_id] = 0
-                    total_quantities[item_id] += qty
-
-                    if price > 0:
-                        if item_id not in min_prices or price < min_prices[item_id]:
-                            min_prices[item_id] = price
-        
-        new_entries = []
-        timestamp = datetime.utcnow()
-        
-        for item in tracked_items:
-            if item.item_id in min_prices:
-                new_entries.append(models.ItemPriceHistory(
-                    item_id=item.id,
-                    buyout=min_prices[item.item_id],
-                    quantity=total_quantities.get(item.item_id, 1),
-                    timestamp=timestamp
-                ))
-                print(f"Updated {item.name}: {min_prices[item.item_id] / 10000}g (Qty: {total_quantities.get(item.item_id, 1)})")
-        
-        if new_entries:
-            db.add_all(new_entries)
-            db.commit()
+        # Optionally keep the raw snapshots so history can be recomputed later (see replay.py)
+        if config.archive_dir:
+            archive_snapshots(config.archive_dir, new_frames)
+
+        # Keep the full market of every realm in memory so untracked items can be priced until the
+        # next run; a source without a new snapshot contributes its latest one
+        for source in list(latest_snapshots):
+            if source not in fetchers:
+                del latest_snapshots[source]
+        for source, frame in new_frames.items():
+            latest_snapshots[source] = await asyncio.to_thread(MarketSnapshot.from_frame, frame)
+        views = await asyncio.to_thread(build_views, latest_snapshots, realm_ids)
+        regions = {source_region(source): s for source, s in latest_snapshots.items() if source_region(source)}
+        snapshot = market_index.publish(views[home_realm_id], views, regions)
+        stats = snapshot.stats()
+        print(f"Market index rebuilt for {len(views)} realm(s): {stats['items']} items, {stats['price_levels']} price levels "
+              f"on the home realm, {sum(v.nbytes for v in views.values()) / 1024:.0f} KiB")
+
+        # Diff against the previous snapshots of the same auction houses to measure sell-through
+        diffs = {source: sell_through_tracker.observe(source, frame) for source, frame in new_frames.items()}
+        arbitrage = any(source_realm(source) is not None for source in new_frames)
+        if arbitrage:
+            await asyncio.to_thread(update_arbitrage_index, realm_ids, diffs)
+        try:
+            record_prices(db, snapshot, new_frames, diffs, realm_ids, regions)
+        finally:
+            # Hand the new snapshots to the API processes (see market_state.py) only once this run's
+            # price rows and rollups are committed: reloading them invalidates what was built from those
+            await asyncio.to_thread(save_market_state, new_frames, arbitrage)
     except Exception as e:
         print(f"Error updating commodities: {e}")
 
+def record_prices(db, snapshot, new_frames, diffs, realm_ids, regions):
+    """ Writes and commits the price history, sell-through and rollups of one ingestion run. """
+    home_realm_id = realm_ids[0]
+    timestamp = datetime.utcnow()
+    tracked_items = db.query(models.TrackedItem).all()
+    # Further realms only get price history rows for their own (non-commodity) listings
+    other_realms = {realm_id: latest_snapshots[realm_source(realm_id)] for realm_id in realm_ids[1:] if realm_source(realm_id) in new_frames}
+    if tracked_items and other_realms:
+        record_realm_prices(db, other_realms, tracked_items, timestamp)
+        db.commit()
+    new_regions = {region: s for region, s in regions.items() if region_source(region) in new_frames}
+    if tracked_items and new_regions:
+        record_region_prices(db, new_regions, tracked_items, timestamp)
+        db.commit()
+
+    home_sources = ("commodities", realm_source(home_realm_id))
+    if not any(source in new_frames for source in home_sources):
+        return
+    market_scanner.observe(snapshot)
+
+    if not tracked_items:
+        print("No tracked items. Skipping price history update.")
+        return
+
+    home_diffs = [diff for source, diff in diffs.items() if source in home_sources]
+    # Sources are polled independently: only items of a source with a new snapshot get a sample
+    fresh = [latest_snapshots[source] for source in home_sources if source in new_frames]
+    new_entries, sell_through_rows = record_market_state(db, snapshot, home_diffs, tracked_items, timestamp, realm_id=home_realm_id,
+                                                         commodities=latest_snapshots.get("commodities"), fresh=fresh)
+    db.commit()
+
+    # Keep the liquidity ranking current without recomputing it per request
+    item_ids = {item.id: item.item_id for item in tracked_items}
+    measured = {row.item_id: row.sold_units for row in sell_through_rows}
+    liquidity_tracker.observe(db, timestamp, {
+        item_ids[entry.item_id]: (entry.buyout, entry.quantity, measured.get(entry.item_id))
+        for entry in new_entries
+    })
+    alert_engine.evaluate(db, timestamp, {item_ids[entry.item_id]: (entry.buyout, entry.quantity) for entry in new_entries})
+
+def update_arbitrage_index(realm_ids, diffs):
+    """ Folds the realm diffs into the cross-realm arbitrage index. """
+    for source, diff in diffs.items():
+        realm_id = source_realm(source)
+        if realm_id is not None:
+            arbitrage_index.observe_diff(realm_id, diff)
+    arbitrage_index.rebuild({
+        realm_id: latest_snapshots[realm_source(realm_id)]
+        for realm_id in realm_ids if realm_source(realm_id) in latest_snapshots
+    }, time.time())
+
+def save_market_state(new_frames, arbitrage):
+    """ Writes the new snapshots and, if it was rebuilt, the arbitrage index for the API processes. """
+    try:
+        market_state.save(config.market_state_dir, new_frames)
+    except Exception as e:
+        print(f"Error saving market state: {e}")
+    if arbitrage:
+        try:
+            arbitrage_index.save(config.market_state_dir)
+        except Exception as e:
+            print(f"Error saving arbitrage index: {e}")
+
+def archive_snapshots(directory, frames):
+    """ Writes every received snapshot frame to the compressed archive directory. """
+    for source, frame in frames.items():
+        if frame is None:
+            continue
+        try:
+            started = time.perf_counter()
+            path = snapshot_archive.write_archive(directory, source, frame)
+            print(f"Archived {source} snapshot to {path} ({os.path.getsize(path) / 1024:.0f} KiB in {time.perf_counter() - started:.2f}s)")
+        except Exception as e:
+            print(f"Error archiving {source} snapshot: {e}")
+
+async def refresh_market_state():
+    """ Reloads the in-memory market index whenever the worker publishes new snapshots. """
+    while True:
+        try:
+            await asyncio.to_thread(market_state_reader.refresh, config.market_state_dir)
+        except Exception as e:
+            print(f"Error loading market state: {e}")
+        await asyncio.sleep(market_state.REFRESH_SECONDS)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
-    FastAPI Lifespan Manager: Starts the background scheduler as soon as the API starts,
-    and cleans up resources when the API stops.
+    FastAPI Lifespan Manager: The background jobs run in the worker process (worker.py); the API
+    only follows its market snapshots. With EMBEDDED_WORKER the worker runs in this process instead.
     """
-    # Startup: Start background task loop
-    asyncio.create_task(scheduler())
+    if config.embedded_worker:
+        import worker
+        task = asyncio.create_task(worker.Worker().run())
+    else:
+        task = asyncio.create_task(refresh_market_state())
     yield
-    # Shutdown logic if needed
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    snapshot_worker.shutdown()
 
 def check_and_reset_tasks(db: Session):
     """
@@ -229,59 +355,6 @@ def check_and_reset_tasks(db: Session):
         db.commit()
         print(f"Automatically reset {count} tasks.")
 
-async def scheduler():
-    """
-    Background Scheduler: Runs in an infinite loop while the server is alive.
-    Triggers token and commodity price updates every 30 minutes, and performs a database backup at 4 AM server time.
-    """
-    while True:
-        try:
-            # Create a new session for the background task
-            db = next(get_db())
-            
-            # Reset Tasks
-            check_and_reset_tasks(db)
-            
-            await update_token_price(db)
-            await update_commodity_prices(db)
-
-            # Trigger automatic character sync if a valid token exists
-            token_entry = db.query(models.UserAccessToken).first()
-            if token_entry:
-                if time.time() < token_entry.expires_at:
-                    print("Running automatic background character sync...")
-                    import threading
-                    threading.Thread(target=sync_user_characters, args=(token_entry.access_token,)).start()
-                else:
-                    print("Skipping automatic character sync: Token expired.")
-                    db.delete(token_entry)
-                    db.commit()
-
-        except Exception as e:
-            print(f"Scheduler Error: {e}")
-        finally:
-            if 'db' in locals():
-                db.close()
-        
-        # Wait for 30 minutes
-        await asyncio.sleep(1800)
-
-        # Run Backup every ~24 hours (48 * 30min)
-        # For simplicity, we can check the hour or just use a counter.
-        # However, a simpler approach is to run it on startup or specific time.
-        # Let's keep it simple: run backup if hour is 4 AM (server time)
-        now = datetime.now()
-        if now.hour == 4 and now.minute < 30:
-             try:
-                 print("Starting daily backup...")
-                 # Run synchronously to avoid complex async file IO issues, 
-                 # copying a small DB is fast enough.
-                 backup.create_backup()
-             except Exception as e:
-                 print(f"Backup Error: {e}")
-
-
-
 app = FastAPI(title="RealmGuardian API", lifespan=lifespan)
 
 # Enable CORS for Frontend
@@ -303,8 +376,10 @@ def read_root():
     }
 
 @app.get("/api/token/latest")
-def get_latest_token(db: Session = Depends(get_db)):
-    latest = db.query(models.WowTokenHistory).order_by(models.WowTokenHistory.last_updated_timestamp.desc()).first()
+def get_latest_token(region: str | None = None, db: Session = Depends(get_db)):
+    region = resolve_region(region) or config.region
+    latest = db.query(models.WowTokenHistory).filter(token_region_filter(region))\
+        .order_by(models.WowTokenHistory.last_updated_timestamp.desc()).first()
     if not latest:
         return {"price": 0, "last_updated": 0, "formatted": "0g"}
     return {
@@ -313,61 +388,389 @@ def get_latest_token(db: Session = Depends(get_db)):
         "formatted": f"{latest.price / 10000:,.0f}g"
     }
 
+@app.get("/api/token/seasonality")
+def get_token_seasonality(region: str | None = None, db: Session = Depends(get_db)):
+    """ Hour-of-week profile of the WoW token price (see /api/items/{item_id}/seasonality). """
+    region = resolve_region(region) or config.region
+    return {"region": region, **seasonality.profile(db, token_series(region))}
+
 @app.get("/api/analysis/glyphs")
-def get_glyph_analysis(db: Session = Depends(get_db)):
-    results = analytics.calculate_liquidity_score(db)
+def get_glyph_analysis(crafts: int = 1, pricing: str = "min", price_source: str = "min", realm_id: int | None = None,
+                       region: str | None = None, db: Session = Depends(get_db)):
+    # The default ranking is maintained incrementally on every ingestion; batch sizes,
+    # order-book pricing, market values and other realms or regions are computed on demand.
+    realm_id, region = resolve_market(realm_id, region)
+    pricing, price_source = resolve_pricing(pricing), resolve_price_source(price_source)
+    if crafts <= 1 and pricing == "min" and price_source == "min" and realm_id is None and region is None:
+        return liquidity_tracker.top_recipes(db)
+    results = analytics.calculate_liquidity_score(db, crafts=max(crafts, 1), pricing=pricing, price_source=price_source,
+                                                  realm_id=realm_id, region=region)
     return results
 
-@app.get("/api/token/history")
-def get_token_history(range: str = "24h", db: Session = Depends(get_db)):
-    now = datetime.utcnow()
-    
-    # Refined Time Ranges & Downsampling
-    # 24h: 20min intervals (raw)
-    # 7d: 1 hour intervals
-    # 14d: 2 hour intervals
-    # 30d: 4 hour intervals
-    
-    if range == "24h":
-        start_time = now - timedelta(hours=24)
-        interval_seconds = 0
-    elif range == "7d":
-        start_time = now - timedelta(days=7)
-        interval_seconds = 3600
-    elif range == "14d":
-        start_time = now - timedelta(days=14)
-        interval_seconds = 7200
-    elif range == "30d":
-        start_time = now - timedelta(days=30)
-        interval_seconds = 14400
-    else:
-        # Default
-        start_time = now - timedelta(hours=24)
-        interval_seconds = 0
-    
-    start_timestamp = start_time.timestamp()
+# Refined Time Ranges & Downsampling: range -> (span, bucket seconds); 24h is raw (20min intervals)
+TOKEN_RANGES = {
+    "24h": (timedelta(hours=24), 0),
+    "7d": (timedelta(days=7), 3600),
+    "14d": (timedelta(days=14), 7200),
+    "30d": (timedelta(days=30), 14400)
+}
 
-    # Query
-    query = db.query(models.WowTokenHistory)\
-        .filter(models.WowTokenHistory.last_updated_timestamp >= start_timestamp)\
+@app.get("/api/token/history")
+def get_token_history(range: str = "24h", region: str | None = None, db: Session = Depends(get_db)):
+    region = resolve_region(region) or config.region
+    span, interval_seconds = TOKEN_RANGES.get(range, TOKEN_RANGES["24h"])
+    start_timestamp = (datetime.utcnow() - span).timestamp()
+
+    # Query, with the streaming indicators of each sample joined on (see indicators.py)
+    query = db.query(models.WowTokenHistory, models.SeriesIndicator)\
+        .outerjoin(models.SeriesIndicator, sqlalchemy.and_(
+            models.SeriesIndicator.sample_id == models.WowTokenHistory.id,
+            models.SeriesIndicator.series == sqlalchemy.literal("token:") + sqlalchemy.func.coalesce(models.WowTokenHistory.region, "eu")))\
+        .filter(models.WowTokenHistory.last_updated_timestamp >= start_timestamp, token_region_filter(region))\
         .order_by(models.WowTokenHistory.last_updated_timestamp.asc())
 
     results = query.all()
 
+    def to_dict(entry, indicator):
+        return {
+            "id": entry.id,
+            "price": entry.price,
+            "last_updated_timestamp": entry.last_updated_timestamp,
+            "region": entry.region,
+            "created_at": entry.created_at,
+            **indicator_fields(indicator)
+        }
+
     if interval_seconds == 0 or not results:
-        return results
+        return [to_dict(entry, indicator) for entry, indicator in results]
 
     # Downsampling
     downsampled = []
     last_bucket = 0
-    for entry in results:
+    for entry, indicator in results:
         bucket = (entry.last_updated_timestamp // interval_seconds) * interval_seconds
         if bucket > last_bucket:
-            downsampled.append(entry)
+            downsampled.append(to_dict(entry, indicator))
             last_bucket = bucket
             
     return downsampled
 
+@app.get("/api/token/compare")
+def compare_token_prices(range: str = "7d", db: Session = Depends(get_db)):
+    """
+    WoW token prices of all tracked regions side by side from a single query: the latest price,
+    range low/high and change per region, its ratio to the primary region's price, and a common
+    time axis (buckets as in /api/token/history) with one price per region.
+    """
+    span, interval_seconds = TOKEN_RANGES.get(range, TOKEN_RANGES["7d"])
+    interval_seconds = interval_seconds or 1200 # Blizzard updates the token price every 20 minutes
+    start_timestamp = (datetime.utcnow() - span).timestamp()
+    regions = config.regions()
+
+    region_column = sqlalchemy.func.coalesce(models.WowTokenHistory.region, "eu")
+    rows = db.query(region_column, models.WowTokenHistory.last_updated_timestamp, models.WowTokenHistory.price)\
+        .filter(models.WowTokenHistory.last_updated_timestamp >= start_timestamp, region_column.in_(regions))\
+        .order_by(models.WowTokenHistory.last_updated_timestamp.asc()).all()
+
+    series = {region: [] for region in regions}
+    buckets = {}
+    for region, ts, price in rows:
+        series[region].append((ts, price))
+        # The last sample of each bucket stands for it
+        buckets.setdefault(ts // interval_seconds * interval_seconds, {})[region] = price
+
+    base = series[config.region][-1][1] if series[config.region] else None
+    summary = []
+    for region in regions:
+        samples = series[region]
+        if not samples:
+            summary.append({"region": region, "price": None})
+            continue
+        prices = [price for _, price in samples]
+        summary.append({
+            "region": region,
+            "price": prices[-1],
+            "last_updated": samples[-1][0],
+            "low": min(prices),
+            "high": max(prices),
+            "change_pct": round((prices[-1] - prices[0]) / prices[0] * 100, 2) if prices[0] else None,
+            "ratio_to_primary": round(prices[-1] / base, 4) if base else None
+        })
+    return {
+        "range": range,
+        "primary_region": config.region,
+        "regions": summary,
+        "history": [{"timestamp": bucket, **prices} for bucket, prices in sorted(buckets.items())]
+    }
+
+
+# --- Live Market Endpoints ---
+
+def resolve_realm(realm_id):
+    """ Validates a realm filter; the home realm (the default view) is returned as None. """
+    if realm_id is None or realm_id == config.home_realm():
+        return None
+    if realm_id not in config.realm_ids():
+        raise HTTPException(status_code=404, detail="Realm not tracked")
+    return realm_id
+
+def resolve_region(region):
+    """ Validates a region filter; the primary region (the default) is returned as None. """
+    if region is None or region.lower() == config.region:
+        return None
+    if region.lower() not in config.regions():
+        raise HTTPException(status_code=404, detail="Region not tracked")
+    return region.lower()
+
+def resolve_market(realm_id, region):
+    """
+    Validates the realm and region filters of a price endpoint. Further regions only have their
+    commodities tracked, so they have no realms. Returns (realm_id, region), None for the defaults.
+    """
+    region = resolve_region(region)
+    if region is not None and realm_id is not None:
+        raise HTTPException(status_code=400, detail="realm_id only applies to the primary region")
+    return resolve_realm(realm_id), region
+
+def resolve_price_source(price_source):
+    """ Validates the price of the items: the minimum buyout or the market value (analytics.PRICE_SOURCES). """
+    if price_source not in analytics.PRICE_SOURCES:
+        raise HTTPException(status_code=400, detail=f"Unknown price_source, expected one of {', '.join(analytics.PRICE_SOURCES)}")
+    return price_source
+
+def resolve_pricing(pricing):
+    """ Validates how reagents are priced (see analytics.get_reagent_costs). """
+    if pricing not in analytics.PRICINGS:
+        raise HTTPException(status_code=400, detail=f"Unknown pricing, expected one of {', '.join(analytics.PRICINGS)}")
+    return pricing
+
+@app.get("/api/realms")
+def get_realms():
+    """ Tracked connected realms; every realm-aware endpoint takes one of them as `realm_id`. """
+    return {"home_realm_id": config.home_realm(), "realm_ids": config.realm_ids()}
+
+@app.get("/api/regions")
+def get_regions():
+    """ Tracked regions; token and price endpoints take one of them as `region` (default: the primary region). """
+    return {"primary_region": config.region, "regions": config.regions()}
+
+@app.get("/api/market/items/{item_id}")
+def get_market_item(item_id: int, quantity: int = 1, levels: int = 20, realm_id: int | None = None, variant_key: int | None = None,
+                    region: str | None = None):
+    """
+    Answers price queries for any item id from the in-memory index of the latest snapshot,
+    whether or not the item is tracked: min price, cost of buying `quantity` units and market depth.
+    Realm-bound items are priced on `realm_id` (default: the home realm), across all their
+    variants or for one `variant_key`; commodities also on a further `region`.
+    """
+    snapshot = market_index.view(*resolve_market(realm_id, region))
+    if not snapshot.contains(item_id):
+        raise HTTPException(status_code=404, detail="Item not listed in the latest snapshot")
+    book, key = snapshot, item_id
+    if variant_key is not None:
+        if snapshot.variant_item(variant_key) != item_id:
+            raise HTTPException(status_code=404, detail="Variant not listed in the latest snapshot")
+        book, key = snapshot.variants, variant_key
+
+    cost, filled = book.cost_for_quantity(key, quantity)
+    return {
+        "item_id": item_id,
+        "variant_key": variant_key,
+        "variants": len(snapshot.item_variants(item_id)),
+        "min_price": book.min_price(key),
+        "market_value": book.market_value(key),
+        "total_quantity": book.total_quantity(key),
+        "quantity": quantity,
+        "filled_quantity": filled,
+        "total_cost": cost,
+        "avg_unit_price": cost / filled if filled else 0,
+        "depth": [{"price": p, "quantity": q} for p, q in book.depth(key, levels)],
+        "generation": snapshot.generation
+    }
+
+@app.get("/api/market/items/{item_id}/variants")
+def get_market_item_variants(item_id: int, realm_id: int | None = None, region: str | None = None, db: Session = Depends(get_db)):
+    """
+    Prices of every listed variant of an item (bonus ids and modifiers) on `realm_id`, cheapest first.
+    Each variant_key can be passed to the market item and item history endpoints.
+    """
+    snapshot = market_index.view(*resolve_market(realm_id, region))
+    keys = snapshot.item_variants(item_id).tolist()
+    known = {v.variant_key: v for v in db.query(models.ItemVariant).filter(models.ItemVariant.variant_key.in_(keys))} if keys else {}
+
+    def describe(key):
+        if key in snapshot.variant_info:
+            return describe_variant(snapshot.variant_info[key])
+        if key in known:
+            variant = known[key]
+            return [int(b) for b in variant.bonus_ids.split(",") if b], json.loads(variant.modifiers or "[]")
+        return [], []
+
+    variants = []
+    for key in keys:
+        bonus_ids, modifiers = describe(key)
+        variants.append({
+            "variant_key": key,
+            "bonus_ids": bonus_ids,
+            "modifiers": modifiers,
+            "min_price": snapshot.variants.min_price(key),
+            "market_value": snapshot.variants.market_value(key),
+            "total_quantity": snapshot.variants.total_quantity(key)
+        })
+    variants.sort(key=lambda v: v["min_price"])
+    return {"item_id": item_id, "variants": variants, "generation": snapshot.generation}
+
+@app.get("/api/market/movers")
+def get_market_movers(metric: str = "price_drop", hours: int = 24, limit: int = 20, min_quantity: int = 0, min_price: int = 0, db: Session = Depends(get_db)):
+    """
+    Largest price drops/rises or supply changes over the last `hours` across every listed item,
+    tracked or not. Prices are market values; percent changes of thin markets can be suppressed
+    with min_quantity / min_price.
+    """
+    if metric not in SCANNER_METRICS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric, expected one of {', '.join(SCANNER_METRICS)}")
+    if not 1 <= hours <= SCANNER_MAX_HOURS:
+        raise HTTPException(status_code=400, detail=f"hours must be between 1 and {SCANNER_MAX_HOURS}")
+
+    deltas, top = market_scanner.top_movers(metric, hours, min(max(limit, 1), 200), min_quantity, min_price)
+    if deltas is None:
+        return {"metric": metric, "hours": hours, "reference_time": None, "items": []}
+
+    item_ids = [int(deltas.item_ids[i]) for i in top]
+    names = dict(db.query(models.TrackedItem.item_id, models.TrackedItem.name)
+                 .filter(models.TrackedItem.item_id.in_(item_ids)).all()) if item_ids else {}
+    return {
+        "metric": metric,
+        "hours": hours,
+        "reference_time": deltas.reference.observed_at,
+        "items": [{
+            "item_id": int(deltas.item_ids[i]),
+            "name": names.get(int(deltas.item_ids[i])),
+            "market_value": int(deltas.prices[i]),
+            "reference_market_value": int(deltas.ref_prices[i]),
+            "price_change_pct": round(float(deltas.price_pct[i]), 2),
+            "quantity": int(deltas.quantities[i]),
+            "reference_quantity": int(deltas.ref_quantities[i]),
+            "supply_change_pct": round(float(deltas.supply_pct[i]), 2)
+        } for i in top]
+    }
+
+@app.get("/api/market/arbitrage")
+def get_market_arbitrage(limit: int = 20, min_sold: float = 1.0, days: float = 1.0, db: Session = Depends(get_db)):
+    """
+    Cross-realm arbitrage: realm-bound items to buy on the cheapest tracked realm and sell on the
+    most valuable realm that sells at least `min_sold` units a day, ranked by expected profit after
+    the auction house cut for `days` of sales. Served from the index built at ingestion.
+    Gear is compared per variant (`variant_key`, see /api/market/items/{item_id}/variants);
+    other items have no variant_key.
+    """
+    items = arbitrage_index.rank(min(max(limit, 1), 200), max(min_sold, 0), max(days, 0), market_index.realms)
+    item_ids = [item["item_id"] for item in items]
+    names = dict(db.query(models.TrackedItem.item_id, models.TrackedItem.name)
+                 .filter(models.TrackedItem.item_id.in_(item_ids)).all()) if item_ids else {}
+    return {
+        "realm_ids": arbitrage_index.realm_ids.tolist(),
+        "updated_at": arbitrage_index.updated_at,
+        "items": [{**item, "name": names.get(item["item_id"])} for item in items]
+    }
+
+class QuoteItem(BaseModel):
+    item_id: int
+    quantity: int
+
+class QuoteRequest(BaseModel):
+    items: list[QuoteItem]
+
+@app.post("/api/market/quote")
+def quote_shopping_list(req: QuoteRequest, realm_id: int | None = None, region: str | None = None):
+    """
+    Prices a whole shopping list against the order book of the latest snapshot of `realm_id`
+    (or of a further `region`'s commodities).
+    Each line reports the cost of buying its quantity through the market depth and any shortfall.
+    """
+    snapshot = market_index.view(*resolve_market(realm_id, region))
+    costs, filled = snapshot.quote_many([i.item_id for i in req.items], [i.quantity for i in req.items])
+
+    lines = []
+    for item, cost, fill in zip(req.items, costs.tolist(), filled.tolist()):
+        lines.append({
+            "item_id": item.item_id,
+            "quantity": item.quantity,
+            "filled_quantity": fill,
+            "shortfall": max(item.quantity - fill, 0),
+            "total_cost": cost,
+            "avg_unit_price": cost / fill if fill else 0
+        })
+    return {
+        "total_cost": int(costs.sum()),
+        "complete": all(line["shortfall"] == 0 for line in lines),
+        "items": lines,
+        "generation": snapshot.generation
+    }
+
+class CraftingPlanRequest(BaseModel):
+    budget: int # Copper
+    recipe_ids: list[int] | None = None
+    days: float = 1.0
+    max_crafts: dict[int, int] = {}
+
+@app.post("/api/crafting/plan")
+def create_crafting_plan(req: CraftingPlanRequest, realm_id: int | None = None, region: str | None = None, db: Session = Depends(get_db)):
+    """
+    Plans craft quantities across recipes for a gold budget and returns the consolidated shopping list.
+    Reagents are priced through the current order book; each recipe is capped by its sell-through over `days`.
+    """
+    if req.budget <= 0:
+        raise HTTPException(status_code=400, detail="Budget must be positive")
+    return plan_crafts(db, req.budget, req.recipe_ids, max(req.days, 0), req.max_crafts, *resolve_market(realm_id, region))
+
+@app.get("/api/market/stats")
+def get_market_stats():
+    """ Reports size, age and memory footprint of the in-memory market index and the scanner ring. """
+    realms = market_index.realms
+    return {
+        **market_index.snapshot.stats(),
+        "realms": [{"realm_id": realm_id, **realms[realm_id].stats()} for realm_id in config.realm_ids() if realm_id in realms],
+        "regions": [{"region": region, **snapshot.stats()} for region, snapshot in market_index.regions.items()],
+        "scanner": market_scanner.stats()
+    }
+
+@app.get("/api/market/polling")
+def get_market_polling(db: Session = Depends(get_db)):
+    """ Snapshot publish cadence per auction house and polling metrics: staleness, 304s and wasted downloads. """
+    # Polling happens in the worker, which stores its metrics after every run
+    return publish_tracker.metrics() or job_queue.load_state(db, "publish_cadence", [])
+
+
+# --- Scheduler ---
+
+@app.get("/api/scheduler/jobs")
+def get_scheduler_jobs(db: Session = Depends(get_db)):
+    """ Background jobs of the worker with their schedule, last run, duration, status and next run (UTC). """
+    queued = {kind for (kind,) in db.query(models.QueuedJob.kind).filter(models.QueuedJob.status == "queued")}
+    return [{**job, "queued": job["name"] in queued} for job in scheduler.status(db)]
+
+@app.post("/api/scheduler/jobs/{name}/run")
+def run_scheduler_job(name: str, db: Session = Depends(get_db)):
+    """ Queues a run of a background job for the worker; a job already queued or running is not queued twice. """
+    if name not in job_queue.JOB_KINDS:
+        raise HTTPException(status_code=404, detail='Job not found')
+    job, created = job_queue.enqueue(db, name)
+    return {**job_queue.job_dict(job), "created": created}
+
+@app.get("/api/scheduler/queue")
+def get_job_queue(limit: int = 50, db: Session = Depends(get_db)):
+    """ Most recent queued jobs, newest first. """
+    jobs = db.query(models.QueuedJob).order_by(models.QueuedJob.id.desc()).limit(min(limit, 500)).all()
+    return [job_queue.job_dict(job) for job in jobs]
+
+@app.get("/api/scheduler/queue/{id}")
+def get_queued_job(id: int, db: Session = Depends(get_db)):
+    job = db.query(models.QueuedJob).filter(models.QueuedJob.id == id).first()
+    if not job:
+        raise HTTPException(status_code=404, detail='Job not found')
+    return job_queue.job_dict(job)
+
 
 # --- Auth & Character Endpoints ---
 
@@ -394,7 +797,7 @@ def login(request: Request, tab: str = "settings"):
     return RedirectResponse(url)
 
 @app.get('/api/auth/callback')
-def auth_callback(code: str, state: str, background_tasks: BackgroundTasks, request: Request, db: Session = Depends(get_db)):
+def auth_callback(code: str, state: str, request: Request, db: Session = Depends(get_db)):
     """
     OAuth2 Callback Callback Endpoint: Handles the response from Battle.net.
     Exchanges the authorization code for an access token, triggers a background character sync,
@@ -415,290 +818,225 @@ def auth_callback(code: str, state: str, background_tasks: BackgroundTasks, requ
     user_token = token_data["access_token"]
     expires_in = token_data.get("expires_in", 86400)
 
-    # Save token for automatic background sync
-    db.query(models.UserAccessToken).delete()
-    new_token = models.UserAccessToken(
-        access_token=user_token, 
-        expires_at=int(time.time() + expires_in)
-    )
-    db.add(new_token)
+    # Save the token of this account for automatic background sync; other accounts keep theirs
+    user_info = blizzard_client.get_user_info(user_token) or {}
+    account_id = user_info.get("id")
+    entry = db.query(models.UserAccessToken).filter_by(account_id=account_id).first() if account_id else None
+    if not entry:
+        entry = models.UserAccessToken(account_id=account_id)
+        db.add(entry)
+    entry.battletag = user_info.get("battletag", entry.battletag)
+    entry.access_token = user_token
+    entry.expires_at = int(time.time() + expires_in)
+    entry.sync_requested_at = datetime.utcnow()
     db.commit()
 
-    # Start background sync
-    background_tasks.add_task(sync_user_characters, user_token)
+    # Queue a character sync for the worker
+    job_queue.enqueue(db, "character_sync")
     
     # Redirect immediately to dynamic frontend host
     host = request.headers.get("host", "localhost")
     hostname = host.split(":")[0]
     return RedirectResponse(f"http://{hostname}:5173?connected=true&tab={state}")
 
-def sync_user_characters(user_token: str):
+@app.get('/api/user/accounts')
+def get_user_accounts(db: Session = Depends(get_db)):
     """
-    Background Task: Syncs a user's World of Warcraft characters.
-    Fetches the profile summary, then iterates through all characters to fetch their
-    public/protected profiles (for gold) and achievement statistics (for playtime),
-    updating the local database.
+    Connected Battle.net accounts with their characters, gold and sync state, for the per-account views.
+    Accounts whose login expired stay listed with token_valid false until the user logs in again.
     """
-    print("Starting background character sync...")
-    new_db = SessionLocal()
-    try:
-        # Debug: Log start
-        with open("debug_sync_start.txt", "w") as f:
-            f.write(f"Sync started at {time.time()}\n")
-
-        # Fetch Profile
-        profile = blizzard_client.get_account_profile(user_token)
-        if not profile:
-            print("Failed to fetch profile.")
-            with open("debug_sync_error.txt", "w") as f:
-                f.write("Failed to fetch profile (None returned)")
-            return
-
-        # Fetch Characters
-        chars = profile.get('wow_accounts', [])
-        all_characters = []
-        for account in chars:
-            all_characters.extend(account.get('characters', []))
-
-        print(f"Found {len(all_characters)} characters.")
-        
-        with open("debug_sync_chars.txt", "w") as f:
-            f.write(f"Found {len(all_characters)} characters.\n")
-            import json
-            f.write(json.dumps(all_characters, indent=2))
-            
-    except Exception as e:
-        import traceback
-        err = traceback.format_exc()
-        print(f"Sync Error: {e}")
-        with open("debug_sync_crash.txt", "w") as f:
-            f.write(str(e) + "\n" + err)
-        # DEBUG: Dump account profile
-        import json
-        with open("debug_account.json", "w") as f:
-            json.dump(profile, f, indent=4)
-        return # Exit if main profile fetch failed
-
-    try:
-        timestamp = datetime.utcnow()
-        count = 0
-        
-        for account in profile['wow_accounts']:
-            for char in account.get('characters', []):
-                try:
-                    realm_id = char['realm']['id']
-                    char_id = char['id']
-                    
-                    # Fetch Protected Profile (for Gold)
-                    protected_details = blizzard_client.get_protected_character_profile(user_token, realm_id, char_id)
-                    
-                    # Fetch Public Profile (Fallback)
-                    public_details = blizzard_client.get_character_profile(user_token, char['realm']['slug'], char['name'])
-
-                    # Filter Ghost Characters (Deleted/Transferred) that return 404
-                    if not protected_details and not public_details:
-                        print(f"Skipping ghost character {char['name']}")
-                        # Check if this ghost character exists in our database and remove it
-                        db_ghost = new_db.query(models.Character).filter_by(blizzard_id=char['id']).first()
-                        if db_ghost:
-                            print(f"Removing deleted ghost character from database: {db_ghost.name}")
-                            new_db.delete(db_ghost)
-                            new_db.commit()
-                        continue
-
-                    # Determine Gold
-                    # Only update gold if we successfully retrieved it from the API to avoid wiping data on 404s
-                    gold = None
-                    if protected_details and 'money' in protected_details:
-                        gold = protected_details['money']
-                    elif public_details and 'money' in public_details:
-                        gold = public_details['money']
-                    
-                    # Fetch Achievements Statistics for Playtime
-                    stats = blizzard_client.get_character_statistics(user_token, char['realm']['slug'], char['name'])
-                    
-                    # DEBUG: Dump details
-                    with open(f"debug_char_{char['name']}.json", "w") as f:
-                        json.dump({"protected": protected_details, "public": public_details, "stats": stats}, f, indent=4)
-
-                    # Determine Item Level
-                    item_level = 0
-                    if public_details and 'equipped_item_level' in public_details:
-                        item_level = public_details['equipped_item_level']
-
-                    # Fetch & Parse Equipment
-                    equipment_json = None
-                    try:
-                        raw_equip = blizzard_client.get_character_equipment(user_token, char['realm']['slug'], char['name'])
-                        if raw_equip and 'equipped_items' in raw_equip:
-                            parsed_items = []
-                            for item in raw_equip['equipped_items']:
-                                parsed_items.append({
-                                    "id": item.get('item', {}).get('id'),
-                                    "slot": item.get('slot', {}).get('type'),
-                                    "name": item.get('name', 'Unknown'),
-                                    "quality": item.get('quality', {}).get('type', 'COMMON'),
-                                    "level": item.get('level', {}).get('value', 0)
-                                })
-                            equipment_json = json.dumps(parsed_items)
-                    except Exception as eq_err:
-                        print(f"Failed to fetch equipment for {char['name']}: {eq_err}")
-                        
-                    # Fetch & Parse Professions
-                    professions_json = None
-                    try:
-                        raw_professions = blizzard_client.get_character_professions(user_token, char['realm']['slug'], char['name'])
-                        if raw_professions and 'primaries' in raw_professions:
-                            parsed_professions = []
-                            for prof in raw_professions['primaries']:
-                                prof_data = {
-                                    "name": prof.get('profession', {}).get('name', 'Unknown'),
-                                    "tiers": []
-                                }
-                                for tier in prof.get('tiers', []):
-                                    prof_data["tiers"].append({
-                                        "name": tier.get('tier', {}).get('name', 'Unknown Expansion'),
-                                        "skill_points": tier.get('skill_points', 0),
-                                        "max_skill_points": tier.get('max_skill_points', 0)
-                                    })
-                                parsed_professions.append(prof_data)
-                            professions_json = json.dumps(parsed_professions)
-                    except Exception as prof_err:
-                        print(f"Failed to fetch professions for {char['name']}: {prof_err}")
-
-                    played_time = 0
-                    # Note: Blizzard has completely removed 'Total time played' from the external Web API.
-                    # This information is now only available via the in-game Lua API (/played).
-                    
-                    # Parse Delves statistics
-                    delves_completed = 0
-                    delves_max_tier = 0
-                    if stats and 'categories' in stats:
-                        for cat in stats['categories']:
-                            for s in cat.get('statistics', []):
-                                sid = s.get('id')
-                                quant = int(s.get('quantity', 0))
-                                if sid == 40734:
-                                    delves_completed = quant
-                                # Infer max tier from name e.g. "Tiefen der Stufe 1 abgeschlossen"
-                                name_lower = s.get('name', '').lower()
-                                if 'stufe' in name_lower or 'tier' in name_lower or 'level' in name_lower:
-                                    if 'tiefe' in name_lower or 'delve' in name_lower:
-                                        import re
-                                        match = re.search(r'(?:stufe|tier|level)\s*(\d+)', name_lower)
-                                        if match and quant > 0:
-                                            tier = int(match.group(1))
-                                            if tier > delves_max_tier:
-                                                delves_max_tier = tier
-                    
-                    # Update DB
-                    # Lookup by Blizzard ID (unique), NOT database ID
-                    db_char = new_db.query(models.Character).filter_by(blizzard_id=char['id']).first()
-                    
-                    if not db_char:
-                        db_char = models.Character(
-                            blizzard_id=char['id'],
-                            name=char['name'],
-                            realm=char['realm']['name'],
-                            level=char.get('level', 0),
-                            item_level=item_level,
-                            equipment=equipment_json,
-                            professions=professions_json,
-                            gold=int(gold) if gold is not None else 0,
-                            played_time=int(played_time),
-                            delves_completed=delves_completed,
-                            delves_max_tier=delves_max_tier,
-                            last_updated=timestamp
-                        )
-                        if 'playable_class' in char:
-                            db_char.class_name = char['playable_class']['name']
-                        else:
-                            db_char.class_name = char.get('character_class', {}).get('name', 'Unknown')
-                            
-                        new_db.add(db_char)
-                    else:
-                        db_char.name = char['name']
-                        db_char.realm = char['realm']['name']
-                        db_char.level = char['level']
-                        print(f"Updating existing character {char['name']} with ilvl {item_level} & delves {delves_max_tier}")
-                        db_char.item_level = item_level
-                        db_char.equipment = equipment_json
-                        db_char.professions = professions_json
-                        if gold is not None:
-                            db_char.gold = int(gold)
-                        db_char.played_time = int(played_time)
-                        db_char.delves_completed = delves_completed
-                        db_char.delves_max_tier = delves_max_tier
-                        db_char.last_updated = timestamp
-                    
-                    new_db.commit()
-                    count += 1
-                    print(f"Synced {char['name']}: {gold/10000}g, {played_time/3600}h")
-
-                except Exception as e:
-                    print(f"Failed to sync char {char.get('name')}: {e}")
-                    with open(f"debug_sync_commit_error_{char.get('name')}.txt", "w") as f:
-                         f.write(str(e))
-                    continue
-        
-        print(f"Background sync complete. Processed {count} characters.")
-
-        # Aggregate and save total account gold for history
-        total_account_gold = new_db.query(models.Character).with_entities(sqlalchemy.func.sum(models.Character.gold)).scalar() or 0
-        
-        # Get start of current day for the daily snapshot
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        
-        gold_snapshot = new_db.query(models.AccountGoldHistory).filter(models.AccountGoldHistory.timestamp >= today).first()
-        if gold_snapshot:
-            gold_snapshot.total_gold = total_account_gold
-            gold_snapshot.timestamp = datetime.utcnow()
-        else:
-            gold_snapshot = models.AccountGoldHistory(
-                total_gold=total_account_gold,
-                timestamp=datetime.utcnow()
-            )
-            new_db.add(gold_snapshot)
-        
-        new_db.commit()
-        print(f"Total account gold snapshot updated: {total_account_gold / 10000}g")
-        
-    except Exception as e:
-        print(f"Background sync failed: {e}")
-        import traceback
-        traceback.print_exc()
-    finally:
-        new_db.close()
+    totals = {owner: (count, gold) for owner, count, gold in
+              db.query(models.Character.owner, sqlalchemy.func.count(models.Character.id), sqlalchemy.func.sum(models.Character.gold))
+              .group_by(models.Character.owner).all()}
+    now = time.time()
+    accounts = []
+    for entry in db.query(models.UserAccessToken).order_by(models.UserAccessToken.id.asc()).all():
+        count, gold = totals.get(entry.account_id, (0, 0))
+        accounts.append({
+            "account_id": entry.account_id,
+            "battletag": entry.battletag,
+            "characters": count,
+            "total_gold": gold or 0,
+            "token_valid": entry.expires_at > now,
+            "last_synced_at": entry.last_synced_at,
+            "sync_requested": entry.sync_requested_at is not None
+        })
+    return {"accounts": accounts}
+
+@app.post('/api/user/accounts/{account_id}/sync')
+def request_account_sync(account_id: int, db: Session = Depends(get_db)):
+    """ Moves an account to the front of the character sync and queues a sync run. """
+    entry = db.query(models.UserAccessToken).filter_by(account_id=account_id).first()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Account not connected")
+    if entry.expires_at <= time.time():
+        raise HTTPException(status_code=409, detail="Login expired; log in with Battle.net again")
+    entry.sync_requested_at = entry.sync_requested_at or datetime.utcnow()
+    db.commit()
+    job, created = job_queue.enqueue(db, "character_sync")
+    return {"status": "queued" if created else "already_queued", "job": job_queue.job_dict(job)}
+
+@app.delete('/api/user/accounts/{account_id}')
+def remove_account(account_id: int, db: Session = Depends(get_db)):
+    """ Disconnects an account: removes its token, characters and gold history. """
+    entry = db.query(models.UserAccessToken).filter_by(account_id=account_id).first()
+    if not entry:
+        raise HTTPException(status_code=404, detail="Account not connected")
+    db.delete(entry)
+    characters = db.query(models.Character.id).filter(models.Character.owner == account_id)
+    db.query(models.CharacterEquipment).filter(models.CharacterEquipment.character_id.in_(characters.scalar_subquery()))\
+        .delete(synchronize_session=False)
+    db.query(models.CharacterProfessionTier).filter(models.CharacterProfessionTier.character_id.in_(characters.scalar_subquery()))\
+        .delete(synchronize_session=False)
+    db.query(models.Character).filter(models.Character.owner == account_id).delete(synchronize_session=False)
+    db.query(models.AccountGoldHistory).filter(models.AccountGoldHistory.owner == account_id).delete(synchronize_session=False)
+    db.commit()
+    return {"status": "success"}
 
 @app.get('/api/user/gold-history')
-def get_user_gold_history(db: Session = Depends(get_db)):
+def get_user_gold_history(account: int | None = None, db: Session = Depends(get_db)):
     """
-    Retrieves the chronological history of the user's total account gold.
-    Returns early snapshots for rendering historical charts.
+    Retrieves the chronological history of the total gold of all accounts, or of one
+    Battle.net `account`. Returns early snapshots for rendering historical charts.
     """
-    history = db.query(models.AccountGoldHistory).order_by(models.AccountGoldHistory.timestamp.asc()).all()
+    owner = models.AccountGoldHistory.owner
+    history = db.query(models.AccountGoldHistory).filter(owner.is_(None) if account is None else owner == account)\
+        .order_by(models.AccountGoldHistory.timestamp.asc()).all()
     return {"history": history}
 
+CHARACTER_SUMMARY_COLUMNS = (
+    "id", "blizzard_id", "name", "realm", "class_name", "level", "item_level", "gold",
+    "delves_completed", "delves_max_tier", "icon_url", "owner", "last_updated"
+)
+
+def character_summary(row):
+    return {column: getattr(row, column) for column in CHARACTER_SUMMARY_COLUMNS}
+
 @app.get('/api/user/characters')
-def get_user_characters(db: Session = Depends(get_db)):
+def get_user_characters(account: int | None = None, db: Session = Depends(get_db)):
     """
-    Retrieves the list of locally synced characters for the dashboard and calculates
-    the total combined gold across all characters.
+    Retrieves the list of locally synced characters (of all accounts, or of one Battle.net
+    `account`) for the dashboard and calculates the total combined gold across them.
+    Equipment and professions are loaded per character (see get_character_details).
     """
-    chars = db.query(models.Character).order_by(models.Character.level.desc()).all()
-    total_gold = sum(c.gold for c in chars)
+    query = db.query(*(getattr(models.Character, column) for column in CHARACTER_SUMMARY_COLUMNS))
+    if account is not None:
+        query = query.filter(models.Character.owner == account)
+    chars = [character_summary(row) for row in query.order_by(models.Character.level.desc()).all()]
+    total_gold = sum(c["gold"] or 0 for c in chars)
     return {
         "total_gold": total_gold,
         "characters": chars
     }
 
+@app.get('/api/user/characters/{character_id}')
+def get_character_details(character_id: int, db: Session = Depends(get_db)):
+    """ A character with its equipped items and its professions (skill per expansion tier). """
+    char = db.query(models.Character).filter(models.Character.id == character_id).first()
+    if not char:
+        raise HTTPException(status_code=404, detail="Character not found")
+    equipment = db.query(models.CharacterEquipment).filter(models.CharacterEquipment.character_id == character_id).all()
+    tiers = db.query(models.CharacterProfessionTier).filter(models.CharacterProfessionTier.character_id == character_id)\
+        .order_by(models.CharacterProfessionTier.id.asc()).all()
+    professions = {}
+    for t in tiers:
+        professions.setdefault(t.profession, {"name": t.profession, "profession_id": t.profession_id, "tiers": []})["tiers"].append({
+            "name": t.tier, "tier_id": t.tier_id, "skill_points": t.skill_points, "max_skill_points": t.max_skill_points
+        })
+    return {
+        **character_summary(char),
+        "equipment": [{"id": e.item_id, "slot": e.slot, "name": e.name, "quality": e.quality, "level": e.level} for e in equipment],
+        "professions": list(professions.values())
+    }
+
+@app.get('/api/user/professions')
+def find_profession_characters(profession: str, min_skill: int = 0, tier: str | None = None,
+                               account: int | None = None, db: Session = Depends(get_db)):
+    """
+    Characters with a profession at `min_skill` or more, e.g. the alts with Inscription above 90.
+    `profession` is the (localized) name or the Blizzard profession id; `tier` limits the match to
+    one expansion tier (name or id). Best skill first.
+    """
+    T = models.CharacterProfessionTier
+    query = db.query(T, models.Character.name, models.Character.realm, models.Character.owner)\
+        .join(models.Character, models.Character.id == T.character_id)\
+        .filter(T.profession_id == int(profession) if profession.isdigit() else T.profession == profession,
+                T.skill_points >= min_skill)
+    if tier:
+        query = query.filter(T.tier_id == int(tier) if tier.isdigit() else T.tier == tier)
+    if account is not None:
+        query = query.filter(models.Character.owner == account)
+    rows = query.order_by(T.skill_points.desc()).all()
+    return [{
+        "character_id": t.character_id,
+        "name": name,
+        "realm": realm,
+        "owner": owner,
+        "profession": t.profession,
+        "tier": t.tier,
+        "skill_points": t.skill_points,
+        "max_skill_points": t.max_skill_points
+    } for t, name, realm, owner in rows]
+
+# Cosmetic slots are not upgraded
+IGNORED_UPGRADE_SLOTS = ("SHIRT", "TABARD")
+
+@app.get('/api/user/equipment/lowest')
+def get_lowest_equipment(slot: str | None = None, limit: int = 20, account: int | None = None, db: Session = Depends(get_db)):
+    """
+    Upgrade candidates: the lowest item level slot of every character, or with `slot` the lowest
+    items in that slot across all characters. Lowest item level first.
+    """
+    E = models.CharacterEquipment
+    if slot:
+        items = db.query(E).filter(E.slot == slot.upper())
+    else:
+        # Lowest slot per character: a window over the (character_id, level) index
+        ranked = db.query(E.id, sqlalchemy.func.row_number().over(partition_by=E.character_id, order_by=(E.level.asc(), E.slot.asc())).label("rank"))\
+            .filter(E.slot.notin_(IGNORED_UPGRADE_SLOTS)).subquery()
+        items = db.query(E).join(ranked, (ranked.c.id == E.id) & (ranked.c.rank == 1))
+    query = items.add_columns(models.Character.name, models.Character.realm, models.Character.item_level)\
+        .join(models.Character, models.Character.id == E.character_id)
+    if account is not None:
+        query = query.filter(models.Character.owner == account)
+    rows = query.order_by(E.level.asc()).limit(limit).all()
+    return [{
+        "character_id": e.character_id,
+        "name": name,
+        "realm": realm,
+        "character_item_level": item_level,
+        "slot": e.slot,
+        "item_id": e.item_id,
+        "item_name": e.name,
+        "quality": e.quality,
+        "level": e.level,
+        "below_average": item_level - (e.level or 0) if item_level else None
+    } for e, name, realm, item_level in rows]
+
+
+def history_point(entry, indicator, price_source="min"):
+    market_value = entry.market_value if entry.market_value is not None else entry.buyout
+    return {
+        "price": market_value if price_source == "market" else entry.buyout,
+        "min_price": entry.buyout,
+        "market_value": market_value,
+        "last_updated_timestamp": entry.timestamp.timestamp(),
+        **indicator_fields(indicator)
+    }
 
 @app.get("/api/items/{item_id}/history")
-def get_item_history(item_id: int, range: str = "14d", db: Session = Depends(get_db)):
+def get_item_history(item_id: int, range: str = "14d", price_source: str = "min", realm_id: int | None = None,
+                     variant_key: int | None = None, region: str | None = None, db: Session = Depends(get_db)):
     """
     Retrieves historical price data for a tracked item over a specified time range,
     downsampling data points to ensure efficient frontend rendering.
+    `price` is the minimum buyout, or the market value with price_source="market".
+    Realm-bound items show the prices of `realm_id` (default: the home realm), across all
+    variants or of one `variant_key` (see /api/market/items/{item_id}/variants); commodities
+    also on a further `region`.
     """
+    realm_id, region = resolve_market(realm_id, region)
+    price_source = resolve_price_source(price_source)
     # Find internal ID first
     tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == item_id).first()
     if not tracked:
@@ -724,37 +1062,105 @@ def get_item_history(item_id: int, range: str = "14d", db: Session = Depends(get
 
     start_timestamp = start_time.timestamp()
     
-    query = db.query(models.ItemPriceHistory)\
+    query = db.query(models.ItemPriceHistory, models.SeriesIndicator)\
+        .outerjoin(models.SeriesIndicator, sqlalchemy.and_(
+            models.SeriesIndicator.sample_id == models.ItemPriceHistory.id,
+            models.SeriesIndicator.series == item_series(item_id)))\
         .filter(models.ItemPriceHistory.item_id == tracked.id)\
-        .filter(models.ItemPriceHistory.timestamp >= start_time)\
+        .filter(models.ItemPriceHistory.timestamp >= start_time, analytics.realm_filter(realm_id, variant_key, region))\
         .order_by(models.ItemPriceHistory.timestamp.asc())
         
     results = query.all()
     
     if interval_seconds == 0 or not results:
         # Transform for frontend (needs timestamp field similar to token)
-        return [{"price": r.buyout, "last_updated_timestamp": r.timestamp.timestamp()} for r in results]
+        return [history_point(r, i, price_source) for r, i in results]
 
     downsampled = []
     last_bucket = 0
-    for entry in results:
+    for entry, indicator in results:
         ts = entry.timestamp.timestamp()
         bucket = (ts // interval_seconds) * interval_seconds
         if bucket > last_bucket:
-            downsampled.append({"price": entry.buyout, "last_updated_timestamp": ts})
+            downsampled.append(history_point(entry, indicator, price_source))
             last_bucket = bucket
             
     return downsampled
 
 
+@app.get("/api/items/{item_id}/sell-through")
+def get_item_sell_through(item_id: int, hours: int = 48, db: Session = Depends(get_db)):
+    """
+    Returns the auction-level sell-through intervals of a tracked item: units sold, expired
+    and newly listed between consecutive snapshots, plus totals over the requested window.
+    """
+    tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == item_id).first()
+    if not tracked:
+        raise HTTPException(status_code=404, detail='Item not tracked')
+
+    start_time = datetime.utcnow() - timedelta(hours=hours)
+    rows = db.query(models.ItemSellThrough)\
+        .filter(models.ItemSellThrough.item_id == tracked.id)\
+        .filter(models.ItemSellThrough.interval_end >= start_time)\
+        .order_by(models.ItemSellThrough.interval_end.asc()).all()
+
+    return {
+        "item_id": item_id,
+        "sold_units": sum(r.sold_units for r in rows),
+        "expired_units": sum(r.expired_units for r in rows),
+        "new_units": sum(r.new_units for r in rows),
+        "intervals": [{
+            "start": r.interval_start,
+            "end": r.interval_end,
+            "sold_units": r.sold_units,
+            "sold_auctions": r.sold_auctions,
+            "expired_units": r.expired_units,
+            "new_units": r.new_units
+        } for r in rows]
+    }
+
+@app.get("/api/items/{item_id}/seasonality")
+def get_item_seasonality(item_id: int, db: Session = Depends(get_db)):
+    """
+    Hour-of-week profile of a tracked item: average price, its standard deviation and units
+    sold per hour for each of the 168 hours (0 = Monday 00:00 UTC), weighted towards recent weeks.
+    """
+    tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == item_id).first()
+    if not tracked:
+        raise HTTPException(status_code=404, detail='Item not tracked')
+    return {"item_id": item_id, "name": tracked.name, **seasonality.profile(db, item_series(item_id))}
+
+@app.get("/api/items/{item_id}/correlations")
+def get_item_correlations(item_id: int, limit: int = 10, db: Session = Depends(get_db)):
+    """
+    Tracked items whose hourly price moves go together with this item over the last 30 days.
+    lag_hours > 0 means this item tends to move first. Results are computed once per day.
+    """
+    tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == item_id).first()
+    if not tracked:
+        raise HTTPException(status_code=404, detail='Item not tracked')
+
+    rows = correlation.get_correlations(db, item_id, min(max(limit, 1), correlation.TOP_PAIRS))
+    names = dict(db.query(models.TrackedItem.item_id, models.TrackedItem.name)
+                 .filter(models.TrackedItem.item_id.in_([r.other_item_id for r in rows])).all()) if rows else {}
+    return {
+        "item_id": item_id,
+        "pairs": [{
+            "item_id": r.other_item_id,
+            "name": names.get(r.other_item_id),
+            "correlation": round(r.correlation, 4),
+            "lag_hours": r.lag_hours,
+            "lagged_correlation": round(r.lagged_correlation, 4),
+            "samples": r.samples
+        } for r in rows]
+    }
+
+
 @app.post('/api/backup')
-def trigger_backup():
-    """ Trigger a manual SQLite database backup. """
-    success = backup.create_backup()
-    if success:
-        return {'status': 'success', 'message': 'Backup created'}
-    else:
-        raise HTTPException(status_code=500, detail='Backup failed')
+def trigger_backup(db: Session = Depends(get_db)):
+    """ Queue a manual SQLite database backup; the worker runs it (see GET /api/scheduler/queue/{id}). """
+    job, created = job_queue.enqueue(db, "backup")
+    return {'status': 'queued', 'message': 'Backup queued', 'job': job_queue.job_dict(job)}
 
 
 # --- Item Tracking Endpoints ---
@@ -804,18 +1210,8 @@ def search_items(q: str):
 class ItemRequest(pydantic.BaseModel):
     item_id: int
 
-from fastapi import BackgroundTasks
-
-async def background_commodity_update():
-    # Helper to run update in background with its own DB session
-    db = next(get_db()) # Assuming get_db provides a SessionLocal equivalent
-    try:
-        await update_commodity_prices(db)
-    finally:
-        db.close()
-
 @app.post('/api/items')
-def add_tracked_item(item_req: ItemRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def add_tracked_item(item_req: ItemRequest, db: Session = Depends(get_db)):
     """
     Adds a new World of Warcraft item to the watchlist.
     Fetches the item's static details and icon from the Blizzard API before saving.
@@ -846,22 +1242,24 @@ def add_tracked_item(item_req: ItemRequest, background_tasks: BackgroundTasks, d
     
     db.add(new_item)
     db.commit()
-    db.refresh(new_item)
-    
+
     # Trigger immediate price update
-    background_tasks.add_task(background_commodity_update)
+    job_queue.enqueue(db, "commodity_prices")
+    db.refresh(new_item)
     
     return new_item
 
 @app.get('/api/items')
-def get_tracked_items(db: Session = Depends(get_db)):
-    """ Retrieves all currently tracked items and their latest logged price for the Watchlist. """
+def get_tracked_items(price_source: str = "min", realm_id: int | None = None, region: str | None = None, db: Session = Depends(get_db)):
+    """ Retrieves all currently tracked items and their latest logged price (on `realm_id` or `region`) for the Watchlist. """
+    realm_id, region = resolve_market(realm_id, region)
+    price_source = resolve_price_source(price_source)
     items = db.query(models.TrackedItem).all()
     result = []
     for item in items:
         # Get latest price
         latest = db.query(models.ItemPriceHistory)\
-            .filter(models.ItemPriceHistory.item_id == item.id)\
+            .filter(models.ItemPriceHistory.item_id == item.id, analytics.realm_filter(realm_id, region=region))\
             .order_by(models.ItemPriceHistory.timestamp.desc())\
             .first()
         
@@ -871,7 +1269,8 @@ def get_tracked_items(db: Session = Depends(get_db)):
             "name": item.name,
             "icon_url": item.icon_url,
             "quality": item.quality,
-            "current_price": latest.buyout if latest else 0,
+            "current_price": (latest.market_value or latest.buyout if price_source == "market" else latest.buyout) if latest else 0,
+            "market_value": (latest.market_value or latest.buyout) if latest else 0,
             "last_updated": latest.timestamp if latest else None
         }
         result.append(item_data)
@@ -894,7 +1293,7 @@ class RecipeRequestBase(pydantic.BaseModel):
     crafted_item_id: int
 
 @app.post('/api/recipes')
-def add_recipe(req: RecipeRequestBase, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def add_recipe(req: RecipeRequestBase, db: Session = Depends(get_db)):
     # Check if exists
     exists = db.query(models.Recipe).filter(models.Recipe.crafted_item_id == req.crafted_item_id).first()
     if exists:
@@ -929,8 +1328,10 @@ def add_recipe(req: RecipeRequestBase, background_tasks: BackgroundTasks, db: Se
         db.add(new_tracked)
 
     db.commit()
+    liquidity_tracker.invalidate_recipes()
+    crafting_graph.invalidate()
+    job_queue.enqueue(db, "commodity_prices")
     db.refresh(new_recipe)
-    background_tasks.add_task(background_commodity_update)
     return new_recipe
 
 class ReagentRequest(pydantic.BaseModel):
@@ -938,7 +1339,7 @@ class ReagentRequest(pydantic.BaseModel):
     quantity: int
 
 @app.post('/api/recipes/{recipe_id}/reagents')
-def add_reagent(recipe_id: int, req: ReagentRequest, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+def add_reagent(recipe_id: int, req: ReagentRequest, db: Session = Depends(get_db)):
     recipe = db.query(models.Recipe).filter(models.Recipe.id == recipe_id).first()
     if not recipe:
         raise HTTPException(status_code=404, detail="Recipe not found")
@@ -949,6 +1350,8 @@ def add_reagent(recipe_id: int, req: ReagentRequest, background_tasks: Backgroun
          # Update quantity
          exists.quantity = req.quantity
          db.commit()
+         liquidity_tracker.invalidate_recipes()
+         crafting_graph.invalidate()
          return exists
 
     item_data = blizzard_client.get_item_details(req.item_id)
@@ -977,7 +1380,9 @@ def add_reagent(recipe_id: int, req: ReagentRequest, background_tasks: Backgroun
         db.add(new_tracked)
 
     db.commit()
-    background_tasks.add_task(background_commodity_update)
+    liquidity_tracker.invalidate_recipes()
+    crafting_graph.invalidate()
+    job_queue.enqueue(db, "commodity_prices")
     return new_reagent
 
 @app.delete('/api/recipes/{recipe_id}/reagents/{item_id}')
@@ -987,58 +1392,93 @@ def delete_reagent(recipe_id: int, item_id: int, db: Session = Depends(get_db)):
          raise HTTPException(status_code=404, detail="Reagent not found")
     db.delete(reagent)
     db.commit()
+    liquidity_tracker.invalidate_recipes()
+    crafting_graph.invalidate()
     return {"message": "Reagent deleted"}
 @app.get('/api/recipes')
-def get_recipes(db: Session = Depends(get_db)):
+def get_recipes(crafts: int = 1, pricing: str = "min", price_source: str = "min", realm_id: int | None = None,
+                region: str | None = None, db: Session = Depends(get_db)):
+    """
+    Lists all recipes with revenue, reagent cost and profit for a batch of `crafts`.
+    With pricing="depth" reagents are priced through the order book of the current snapshot
+    instead of at the cheapest auction, with pricing="market" at their market value.
+    price_source="market" values the crafted items at their market value.
+    Prices are those of `realm_id` (default: the home realm) or of a further `region`.
+    """
+    crafts = max(crafts, 1)
+    realm_id, region = resolve_market(realm_id, region)
+    pricing, price_source = resolve_pricing(pricing), resolve_price_source(price_source)
     recipes = db.query(models.Recipe).all()
+
+    # Price the reagents of every recipe in a single batch
+    purchases = [(reg.item_id, reg.quantity * crafts) for r in recipes for reg in r.reagents]
+    quotes = iter(analytics.get_reagent_costs(db, purchases, pricing, realm_id, region))
+    target_prices = analytics.get_latest_prices(db, [r.crafted_item_id for r in recipes], price_source, realm_id, region)
+    # Cheapest cost when craftable reagents may be crafted instead of bought (not for depth pricing)
+    graph = crafting_graph.get(db, pricing, realm_id, region) if pricing in analytics.PRICE_SOURCES else None
+
     results = []
-    
     for r in recipes:
         # Get target item price
-        target_tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == r.crafted_item_id).first()
-        target_price = 0
-        if target_tracked:
-             latest = db.query(models.ItemPriceHistory).filter(models.ItemPriceHistory.item_id == target_tracked.id).order_by(models.ItemPriceHistory.timestamp.desc()).first()
-             if latest:
-                 target_price = latest.buyout
+        target_price = target_prices[r.crafted_item_id]
 
         # Calculate reagents cost
         total_cost = 0
         reagents_data = []
         for reg in r.reagents:
-            reg_price = 0
-            reg_tracked = db.query(models.TrackedItem).filter(models.TrackedItem.item_id == reg.item_id).first()
-            if reg_tracked:
-                 latest = db.query(models.ItemPriceHistory).filter(models.ItemPriceHistory.item_id == reg_tracked.id).order_by(models.ItemPriceHistory.timestamp.desc()).first()
-                 if latest:
-                     reg_price = latest.buyout
-            
-            cost = reg_price * reg.quantity
+            cost, filled = next(quotes)
             total_cost += cost
             reagents_data.append({
                 "item_id": reg.item_id,
                 "name": reg.name,
-                "quantity": reg.quantity,
-                "unit_price": reg_price,
-                "total_price": cost
+                "quantity": reg.quantity * crafts,
+                "unit_price": cost / filled if filled else 0,
+                "total_price": cost,
+                "filled_quantity": filled
             })
             
-        profit = (target_price * r.crafted_quantity) - total_cost
+        revenue = target_price * r.crafted_quantity * crafts
+        profit = revenue - total_cost
+        optimal_cost = graph.tree(r.crafted_item_id, r.crafted_quantity * crafts, force_craft=True)["total_cost"] if graph else None
 
         results.append({
             "id": r.id,
             "name": r.name,
             "crafted_item_id": r.crafted_item_id,
             "crafted_quantity": r.crafted_quantity,
+            "crafts": crafts,
             "icon_url": r.icon_url,
             "target_price": target_price,
-            "revenue": target_price * r.crafted_quantity,
+            "revenue": revenue,
             "total_cost": total_cost,
             "profit": profit,
+            "optimal_cost": optimal_cost,
+            "optimal_profit": revenue - optimal_cost if optimal_cost is not None else None,
             "reagents": reagents_data
         })
     return results
 
+@app.get('/api/recipes/{id}/tree')
+def get_recipe_tree(id: int, crafts: int = 1, price_source: str = "min", realm_id: int | None = None, region: str | None = None,
+                    db: Session = Depends(get_db)):
+    """
+    Optimal crafting tree of a recipe: every reagent that is itself craftable is crafted
+    whenever that is cheaper than buying it, recursively.
+    """
+    price_source = resolve_price_source(price_source)
+    recipe = db.query(models.Recipe).filter(models.Recipe.id == id).first()
+    if not recipe:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    graph = crafting_graph.get(db, price_source, *resolve_market(realm_id, region))
+    tree = graph.tree(recipe.crafted_item_id, recipe.crafted_quantity * max(crafts, 1), force_craft=True)
+    return {
+        "recipe_id": recipe.id,
+        "crafts": max(crafts, 1),
+        "market_price": graph.prices.get(recipe.crafted_item_id),
+        "tree": tree,
+        "cycles": [{"item_id": a, "reagent_id": b} for a, b in graph.cycles()]
+    }
+
 @app.delete('/api/recipes/{id}')
 def delete_recipe(id: int, db: Session = Depends(get_db)):
     recipe = db.query(models.Recipe).filter(models.Recipe.id == id).first()
@@ -1046,8 +1486,110 @@ def delete_recipe(id: int, db: Session = Depends(get_db)):
          raise HTTPException(status_code=404, detail="Recipe not found")
     db.delete(recipe)
     db.commit()
+    liquidity_tracker.invalidate_recipes()
+    crafting_graph.invalidate()
     return {"message": "Recipe deleted"}
 
+# --- Alert Endpoints ---
+from fastapi.responses import StreamingResponse
+
+class AlertRuleCreate(BaseModel):
+    item_id: int
+    kind: str # See alerts.RULE_KINDS
+    threshold: float
+    window_hours: int = 24
+    cooldown_minutes: int = 60
+    sink: str = "log"
+    enabled: bool = True
+
+@app.get('/api/alerts/rules')
+def get_alert_rules(db: Session = Depends(get_db)):
+    return db.query(models.AlertRule).order_by(models.AlertRule.item_id, models.AlertRule.kind).all()
+
+@app.post('/api/alerts/rules')
+def create_alert_rule(req: AlertRuleCreate, db: Session = Depends(get_db)):
+    """ Adds a price alert rule; it is evaluated from the next ingestion run on. """
+    if req.kind not in RULE_KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown rule kind, expected one of {', '.join(RULE_KINDS)}")
+    if req.sink not in SINKS:
+        raise HTTPException(status_code=400, detail=f"Unknown sink, expected one of {', '.join(SINKS)}")
+    if req.kind in ("pct_change", "quantity_drop") and req.window_hours <= 0:
+        raise HTTPException(status_code=400, detail="window_hours must be positive")
+    rule = models.AlertRule(**req.dict())
+    db.add(rule)
+    db.commit()
+    db.refresh(rule)
+    alert_engine.invalidate()
+    return rule
+
+@app.put('/api/alerts/rules/{id}')
+def update_alert_rule(id: int, req: AlertRuleCreate, db: Session = Depends(get_db)):
+    rule = db.query(models.AlertRule).filter(models.AlertRule.id == id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    if req.kind not in RULE_KINDS or req.sink not in SINKS:
+        raise HTTPException(status_code=400, detail="Unknown rule kind or sink")
+    for key, value in req.dict().items():
+        setattr(rule, key, value)
+    db.commit()
+    db.refresh(rule)
+    alert_engine.invalidate()
+    return rule
+
+@app.delete('/api/alerts/rules/{id}')
+def delete_alert_rule(id: int, db: Session = Depends(get_db)):
+    rule = db.query(models.AlertRule).filter(models.AlertRule.id == id).first()
+    if not rule:
+        raise HTTPException(status_code=404, detail="Alert rule not found")
+    db.query(models.AlertEvent).filter(models.AlertEvent.rule_id == id).delete()
+    db.delete(rule)
+    db.commit()
+    alert_engine.invalidate()
+    return {"message": "Alert rule deleted"}
+
+@app.get('/api/alerts/events')
+def get_alert_events(limit: int = 50, rule_id: int | None = None, db: Session = Depends(get_db)):
+    """ Most recent alert firings, newest first. """
+    query = db.query(models.AlertEvent)
+    if rule_id is not None:
+        query = query.filter(models.AlertEvent.rule_id == rule_id)
+    return query.order_by(models.AlertEvent.fired_at.desc(), models.AlertEvent.id.desc()).limit(min(limit, 500)).all()
+
+STREAM_POLL_SECONDS = 2
+
+def stream_events_after(last_id):
+    """ Firings of "stream" rules stored by the worker since event `last_id`. """
+    db = SessionLocal()
+    try:
+        query = db.query(models.AlertEvent).join(models.AlertRule, models.AlertRule.id == models.AlertEvent.rule_id)\
+            .filter(models.AlertRule.sink == "stream")
+        if last_id is None:
+            # Start after the newest event; a new client does not replay the history
+            newest = query.order_by(models.AlertEvent.id.desc()).first()
+            return newest.id if newest else 0, []
+        events = query.filter(models.AlertEvent.id > last_id).order_by(models.AlertEvent.id.asc()).limit(100).all()
+        return (events[-1].id if events else last_id), [event_dict(event) for event in events]
+    finally:
+        db.close()
+
+@app.get('/api/alerts/stream')
+async def stream_alerts(request: Request):
+    """ Server-sent events feed of the firings of rules using the "stream" sink. """
+    async def events():
+        last_id, _ = await asyncio.to_thread(stream_events_after, None)
+        idle = 0
+        while not await request.is_disconnected():
+            last_id, new_events = await asyncio.to_thread(stream_events_after, last_id)
+            for event in new_events:
+                yield f"event: alert\ndata: {json.dumps(event)}\n\n"
+            idle = 0 if new_events else idle + STREAM_POLL_SECONDS
+            if idle >= 15:
+                idle = 0
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(STREAM_POLL_SECONDS)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
 # --- Task Management Endpoints ---
 @app.get('/api/user/tasks')
 def get_user_tasks(db: Session = Depends(get_db)):
@@ -0,0 +1,522 @@
+"""
+market_index.py
+In-memory, array-backed index of the latest auction house state.
+Every ingestion run collapses the commodity and realm snapshots into sorted price levels
+per item, so min price, cost of buying N units and market depth can be answered for any
+item id without touching the database or waiting for the next ingestion.
+
+Commodities are traded region-wide, everything else per connected realm, so there is one
+view per tracked realm: its own auctions plus the commodities. The home realm's view is
+``market_index.snapshot``. Further regions only have their commodities tracked, one snapshot
+each in ``market_index.regions``.
+
+Realm auctions of gear come in variants (bonus ids for item level, sockets, tertiary stats and
+modifiers such as the drop level or crafted stats). Each auction gets a variant key hashing
+its item id, bonus ids and relevant modifiers (0 for plain items); snapshots keep the per-item
+price levels across all variants and, next to them, the price levels per variant key.
+"""
+import threading
+import time
+from itertools import chain
+import numpy as np
+
+
+# Blizzard's coarse remaining-duration buckets, ordered from shortest to longest
+TIME_LEFT_CODES = {"SHORT": 0, "MEDIUM": 1, "LONG": 2, "VERY_LONG": 3}
+
+# Market value: share of the cheapest supply that is averaged, and how far (as a factor) a price
+# level may sit from the median price of the item's whole supply before it is rejected as an
+# outlier. Books with fewer units than MARKET_VALUE_MIN_UNITS are too thin to tell and are kept.
+MARKET_VALUE_SHARE = 0.15
+MARKET_VALUE_MAX_RATIO = 5.0
+MARKET_VALUE_MIN_UNITS = 4
+
+# Modifier types that change what an item is worth: the player level it dropped at (scales its
+# item level) and the two crafted secondary stats. Others (e.g. the crafter) are ignored.
+VARIANT_MODIFIER_TYPES = (9, 29, 30)
+_MODIFIER_SALT = np.uint64(0x5EED0F7A11C0FFEE)
+
+
+def describe_variant(info):
+    """ (bonus ids, [[modifier type, value], ...]) of a variant_info entry, both sorted. """
+    _, bonus_ids, modifiers = info
+    return sorted(bonus_ids), sorted([m['type'], m['value']] for m in modifiers if m.get('type') in VARIANT_MODIFIER_TYPES)
+
+
+def _mix(values):
+    """ splitmix64 finalizer over a uint64 array (wrapping arithmetic). """
+    with np.errstate(over="ignore"):
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+def _segment_sums(values, counts):
+    """ Wrapping uint64 sum of consecutive segments of `values` with the given lengths. """
+    ends = np.cumsum(counts)
+    with np.errstate(over="ignore"):
+        cumulative = np.concatenate(([np.uint64(0)], np.cumsum(values, dtype=np.uint64)))
+        return cumulative[ends] - cumulative[ends - counts]
+
+
+def variant_keys(item_ids, bonus_counts, bonus_ids, modifier_counts, modifier_types, modifier_values):
+    """
+    Variant key per auction from its flattened bonus ids and modifiers (`*_counts` entries per
+    auction). The bonus ids and modifiers are combined by a sum of their hashes, so their order
+    does not matter and no per-auction sorting is needed. Auctions without bonus ids or relevant
+    modifiers get 0; keys are positive 63-bit integers (they fit SQLite's INTEGER).
+    """
+    relevant = np.isin(modifier_types, VARIANT_MODIFIER_TYPES)
+    modifier_hashes = _mix((modifier_types.astype(np.uint64) << np.uint64(32)) | modifier_values.astype(np.uint64)) ^ _MODIFIER_SALT
+    combined = _segment_sums(_mix(bonus_ids.astype(np.uint64)), bonus_counts)
+    with np.errstate(over="ignore"):
+        combined += _segment_sums(np.where(relevant, modifier_hashes, np.uint64(0)), modifier_counts)
+    keys = (_mix(combined ^ _mix(item_ids.astype(np.uint64))) >> np.uint64(1)).astype(np.int64)
+    has_variant = (bonus_counts > 0) | (_segment_sums(relevant.astype(np.uint64), modifier_counts) > 0)
+    return np.where(has_variant, np.maximum(keys, 1), 0)
+
+
+class AuctionFrame:
+    """
+    Columnar copy of one auction snapshot (one row per auction), sorted by auction id.
+    Parsing the JSON auctions into arrays once lets the market index, the sell-through
+    diff and the archive share the same data without keeping the dicts around.
+    ``variant_info`` holds each variant key's item id, bonus ids and modifiers as listed (see describe_variant).
+    """
+
+    def __init__(self, auction_ids, item_ids, prices, quantities, time_left, captured_at=None, variants=None, variant_info=None):
+        order = np.argsort(auction_ids, kind="stable")
+        self.auction_ids = auction_ids[order]
+        self.item_ids = item_ids[order]
+        self.prices = prices[order]
+        self.quantities = quantities[order]
+        self.time_left = time_left[order]
+        self.variants = variants[order] if variants is not None else np.zeros(len(order), dtype=np.int64)
+        self.variant_info = variant_info or {}
+        self.captured_at = captured_at if captured_at is not None else time.time()
+
+    def __len__(self):
+        return len(self.auction_ids)
+
+    @classmethod
+    def from_auctions(cls, auctions, captured_at=None):
+        auctions = auctions or []
+        n = len(auctions)
+        item_ids = np.fromiter((a['item']['id'] for a in auctions), dtype=np.int64, count=n)
+        variants, variant_info = cls._parse_variants([a['item'] for a in auctions], item_ids)
+        return cls(
+            np.fromiter((a.get('id', 0) for a in auctions), dtype=np.int64, count=n),
+            item_ids,
+            np.fromiter((a.get('unit_price', a.get('buyout', 0)) or 0 for a in auctions), dtype=np.int64, count=n),
+            np.fromiter((a.get('quantity', 1) for a in auctions), dtype=np.int64, count=n),
+            np.fromiter((TIME_LEFT_CODES.get(a.get('time_left'), 3) for a in auctions), dtype=np.int8, count=n),
+            captured_at,
+            variants,
+            variant_info
+        )
+
+    @staticmethod
+    def _parse_variants(items, item_ids):
+        """ Variant keys of the auctioned items and the description of every distinct key. """
+        n = len(items)
+        # Commodities carry neither bonus ids nor modifiers
+        bonus_counts = np.fromiter((len(i.get('bonus_lists', ())) for i in items), dtype=np.int64, count=n)
+        modifier_counts = np.fromiter((len(i.get('modifiers', ())) for i in items), dtype=np.int64, count=n)
+        if not bonus_counts.any() and not modifier_counts.any():
+            return np.zeros(n, dtype=np.int64), {}
+        modifiers = list(chain.from_iterable(i.get('modifiers', ()) for i in items))
+        keys = variant_keys(
+            item_ids,
+            bonus_counts,
+            np.fromiter(chain.from_iterable(i.get('bonus_lists', ()) for i in items), dtype=np.int64, count=int(bonus_counts.sum())),
+            modifier_counts,
+            np.fromiter((m.get('type', 0) for m in modifiers), dtype=np.int64, count=len(modifiers)),
+            np.fromiter((m.get('value', 0) for m in modifiers), dtype=np.int64, count=len(modifiers))
+        )
+        # One raw description per distinct variant; it is normalized only when read (describe_variant)
+        unique, first = np.unique(keys, return_index=True)
+        info = {}
+        for key, index in zip(unique.tolist(), first.tolist()):
+            if key:
+                item = items[index]
+                info[key] = (item['id'], item.get('bonus_lists', []), item.get('modifiers', []))
+        return keys, info
+
+    def filter_items(self, item_ids):
+        """ Returns a new frame holding only the auctions of the given item ids. """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        mask = np.isin(self.item_ids, item_ids)
+        wanted = set(item_ids.tolist())
+        return AuctionFrame(
+            self.auction_ids[mask], self.item_ids[mask], self.prices[mask],
+            self.quantities[mask], self.time_left[mask], self.captured_at,
+            self.variants[mask], {key: info for key, info in self.variant_info.items() if info[0] in wanted}
+        )
+
+    @classmethod
+    def concat(cls, frames):
+        frames = [f for f in frames if f is not None]
+        return cls(
+            np.concatenate([f.auction_ids for f in frames] or [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([f.item_ids for f in frames] or [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([f.prices for f in frames] or [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([f.quantities for f in frames] or [np.zeros(0, dtype=np.int64)]),
+            np.concatenate([f.time_left for f in frames] or [np.zeros(0, dtype=np.int8)]),
+            max((f.captured_at for f in frames), default=None),
+            np.concatenate([f.variants for f in frames] or [np.zeros(0, dtype=np.int64)]),
+            {key: info for f in frames for key, info in f.variant_info.items()}
+        )
+
+
+class MarketSnapshot:
+    """
+    Immutable view of one ingestion run.
+    The price levels of ``item_ids[i]`` are ``prices[offsets[i]:offsets[i + 1]]`` (ascending)
+    with the summed auction quantity of each level in ``quantities``.
+    ``variants`` is a MarketSnapshot of the same kind keyed by variant key instead of item id
+    (None without variants); ``variant_items`` holds the item id of each of its keys.
+    """
+
+    def __init__(self, item_ids, offsets, prices, quantities, auction_count=0, build_seconds=0.0):
+        self.item_ids = item_ids
+        self.offsets = offsets
+        self.prices = prices
+        self.quantities = quantities
+        # Running totals over all levels with a leading zero: cum_quantity[k] is the supply
+        # of all levels before level k. Per-item values are differences of two entries.
+        self.cum_quantity = np.concatenate(([0], np.cumsum(quantities, dtype=np.int64)))
+        self.cum_cost = np.concatenate(([0], np.cumsum(prices * quantities, dtype=np.int64)))
+        self.auction_count = auction_count
+        self.build_seconds = build_seconds
+        self.created_at = time.time()
+        self.generation = 0
+        self._market_values = None
+        self.variants = None
+        self.variant_items = np.zeros(0, dtype=np.int64)
+        self.variant_info = {}
+        self._variants_by_item = None
+
+    @classmethod
+    def empty(cls):
+        empty = np.zeros(0, dtype=np.int64)
+        return cls(empty, np.zeros(1, dtype=np.int64), empty, empty)
+
+    @classmethod
+    def from_auctions(cls, *auction_lists):
+        """ Builds a snapshot from raw Blizzard auction lists (commodity and/or realm). """
+        started = time.perf_counter()
+        frame = AuctionFrame.concat([AuctionFrame.from_auctions(lst) for lst in auction_lists])
+        snapshot = cls.from_frame(frame)
+        snapshot.build_seconds = time.perf_counter() - started
+        return snapshot
+
+    @classmethod
+    def from_frame(cls, frame):
+        started = time.perf_counter()
+        snapshot = cls.from_arrays(frame.item_ids, frame.prices, frame.quantities)
+        snapshot.with_variants(frame.variants, frame.item_ids, frame.prices, frame.quantities, frame.variant_info)
+        snapshot.auction_count = len(frame)
+        snapshot.build_seconds = time.perf_counter() - started
+        return snapshot
+
+    @classmethod
+    def merge(cls, snapshots):
+        """ Combines snapshots (e.g. commodities and one realm) by collapsing their price levels again. """
+        started = time.perf_counter()
+        snapshot = cls.from_arrays(
+            np.concatenate([np.repeat(s.item_ids, np.diff(s.offsets)) for s in snapshots]),
+            np.concatenate([s.prices for s in snapshots]),
+            np.concatenate([s.quantities for s in snapshots])
+        )
+        variants = [(s.variants, s.variant_items) for s in snapshots if s.variants is not None]
+        if variants:
+            levels = [np.diff(v.offsets) for v, _ in variants]
+            snapshot.with_variants(
+                np.concatenate([np.repeat(v.item_ids, n) for (v, _), n in zip(variants, levels)]),
+                np.concatenate([np.repeat(items, n) for (_, items), n in zip(variants, levels)]),
+                np.concatenate([v.prices for v, _ in variants]),
+                np.concatenate([v.quantities for v, _ in variants]),
+                {key: info for s in snapshots for key, info in s.variant_info.items()}
+            )
+        snapshot.auction_count = sum(s.auction_count for s in snapshots)
+        snapshot.build_seconds = time.perf_counter() - started
+        return snapshot
+
+    @classmethod
+    def from_arrays(cls, item_ids, prices, quantities):
+        """ Collapses per-auction columns into sorted, de-duplicated price levels per item. """
+        # Auctions without a buyout (bid only) cannot be bought instantly and are ignored
+        mask = prices > 0
+        item_ids, prices, quantities = item_ids[mask], prices[mask], quantities[mask]
+        if len(item_ids) == 0:
+            return cls.empty()
+
+        order = np.lexsort((prices, item_ids))
+        item_ids, prices, quantities = item_ids[order], prices[order], quantities[order]
+
+        # A new level starts wherever the item or the price changes
+        level_start = np.ones(len(item_ids), dtype=bool)
+        level_start[1:] = (item_ids[1:] != item_ids[:-1]) | (prices[1:] != prices[:-1])
+        level_idx = np.flatnonzero(level_start)
+
+        level_items = item_ids[level_idx]
+        level_prices = prices[level_idx]
+        level_quantities = np.add.reduceat(quantities, level_idx)
+
+        item_start = np.ones(len(level_items), dtype=bool)
+        item_start[1:] = level_items[1:] != level_items[:-1]
+        item_idx = np.flatnonzero(item_start)
+        offsets = np.append(item_idx, len(level_items)).astype(np.int64)
+
+        return cls(level_items[item_idx], offsets, level_prices, level_quantities)
+
+    def with_variants(self, keys, item_ids, prices, quantities, variant_info):
+        """ Adds the price levels per variant key from per-auction (or per-level) columns; key 0 is left out. """
+        mask = keys != 0
+        if mask.any():
+            self.variants = MarketSnapshot.from_arrays(keys[mask], prices[mask], quantities[mask])
+            unique, first = np.unique(keys[mask], return_index=True)
+            self.variant_items = item_ids[mask][first][np.searchsorted(unique, self.variants.item_ids)]
+        self.variant_info = variant_info
+        return self
+
+    # --- Queries ---
+
+    def _locate(self, item_id):
+        pos = int(np.searchsorted(self.item_ids, item_id))
+        if pos >= len(self.item_ids) or self.item_ids[pos] != item_id:
+            return None
+        return int(self.offsets[pos]), int(self.offsets[pos + 1])
+
+    def contains(self, item_id):
+        return self._locate(item_id) is not None
+
+    def min_price(self, item_id):
+        """ Cheapest unit price of the item, or None if it is not listed. """
+        span = self._locate(item_id)
+        if span is None:
+            return None
+        return int(self.prices[span[0]])
+
+    def total_quantity(self, item_id):
+        span = self._locate(item_id)
+        if span is None:
+            return 0
+        start, end = span
+        return int(self.cum_quantity[end] - self.cum_quantity[start])
+
+    def depth(self, item_id, max_levels=None):
+        """ Returns the item's price levels as a list of (unit_price, quantity), cheapest first. """
+        span = self._locate(item_id)
+        if span is None:
+            return []
+        start, end = span
+        if max_levels is not None:
+            end = min(end, start + max_levels)
+        return list(zip(self.prices[start:end].tolist(), self.quantities[start:end].tolist()))
+
+    def cost_for_quantity(self, item_id, quantity):
+        """
+        Cost of buying ``quantity`` units by walking the price levels from the cheapest up.
+        Returns (total_cost, filled_quantity); filled_quantity is lower than requested when
+        the market does not hold enough supply.
+        """
+        span = self._locate(item_id)
+        if span is None or quantity <= 0:
+            return 0, 0
+        start, end = span
+        base_qty, base_cost = int(self.cum_quantity[start]), int(self.cum_cost[start])
+        available = int(self.cum_quantity[end]) - base_qty
+        if quantity >= available:
+            return int(self.cum_cost[end]) - base_cost, available
+
+        # Level whose running total first covers the requested amount
+        target = base_qty + quantity
+        level = start + int(np.searchsorted(self.cum_quantity[start + 1:end + 1], target))
+        remainder = target - int(self.cum_quantity[level])
+        return int(self.cum_cost[level]) - base_cost + remainder * int(self.prices[level]), quantity
+
+    def quote_many(self, item_ids, quantities):
+        """
+        Vectorized cost_for_quantity for a whole shopping list.
+        Returns two int64 arrays (total_cost, filled_quantity) aligned with the input;
+        items that are not listed get a cost and fill of 0.
+        """
+        item_ids = np.asarray(item_ids, dtype=np.int64)
+        quantities = np.asarray(quantities, dtype=np.int64)
+        if len(self.item_ids) == 0 or len(item_ids) == 0:
+            return np.zeros(len(item_ids), dtype=np.int64), np.zeros(len(item_ids), dtype=np.int64)
+
+        pos = np.minimum(np.searchsorted(self.item_ids, item_ids), len(self.item_ids) - 1)
+        found = self.item_ids[pos] == item_ids
+        start, end = self.offsets[pos], self.offsets[pos + 1]
+
+        base_qty, base_cost = self.cum_quantity[start], self.cum_cost[start]
+        filled = np.where(found, np.clip(quantities, 0, self.cum_quantity[end] - base_qty), 0)
+        target = base_qty + filled
+
+        # The running totals increase strictly across all items, so one global search
+        # finds the covering level of every request at once.
+        level = np.clip(np.searchsorted(self.cum_quantity[1:], target), start, end - 1)
+        cost = self.cum_cost[level] - base_cost + (target - self.cum_quantity[level]) * self.prices[level]
+        cost = np.where(filled > 0, cost, 0)
+        return cost.astype(np.int64), filled.astype(np.int64)
+
+    def market_values(self):
+        """
+        Robust per-item price aligned with ``item_ids``, computed for all items in one pass:
+        price levels more than MARKET_VALUE_MAX_RATIO times below or above the median price of
+        the item's whole supply are dropped, then the quantity-weighted mean of the cheapest
+        MARKET_VALUE_SHARE of the remaining supply is taken. The reference comes from the whole
+        book, so a troll auction far below the market does not set the price even when it makes
+        up most of the cheapest share.
+        """
+        if self._market_values is not None:
+            return self._market_values
+        n_items = len(self.item_ids)
+        if n_items == 0:
+            self._market_values = np.zeros(0, dtype=np.int64)
+            return self._market_values
+
+        counts = np.diff(self.offsets)
+        level_item = np.repeat(np.arange(n_items), counts)
+        start, end = self.offsets[:-1], self.offsets[1:]
+        supply = self.cum_quantity[end] - self.cum_quantity[start]
+        prices = self.prices.astype(np.float64)
+
+        # Median of the whole supply: the level holding its middle unit. The running totals
+        # increase strictly across all items, so one global search finds it for every item.
+        middle = self.cum_quantity[start] + (supply + 1) // 2
+        median = prices[np.clip(np.searchsorted(self.cum_quantity[1:], middle), start, end - 1)]
+        ratio = prices / median[level_item]
+        keep = ((ratio >= 1 / MARKET_VALUE_MAX_RATIO) & (ratio <= MARKET_VALUE_MAX_RATIO)) | (supply < MARKET_VALUE_MIN_UNITS)[level_item]
+
+        # Units each kept level contributes to the cheapest share of the kept supply
+        kept = np.where(keep, self.quantities, 0)
+        cum_kept = np.concatenate(([0], np.cumsum(kept)))
+        kept_supply = cum_kept[end] - cum_kept[start]
+        target = np.maximum(np.ceil(kept_supply * MARKET_VALUE_SHARE), 1)
+        before = cum_kept[:-1] - cum_kept[start][level_item]
+        taken = np.clip(target[level_item] - before, 0, kept).astype(np.float64)
+
+        weight = np.bincount(level_item, weights=taken, minlength=n_items)
+        total = np.bincount(level_item, weights=taken * prices, minlength=n_items)
+        # The median level is always kept, so every listed item has weight
+        self._market_values = np.round(total / np.maximum(weight, 1e-12)).astype(np.int64)
+        return self._market_values
+
+    def market_value(self, item_id):
+        """ Robust price of the item (see market_values), or None if it is not listed. """
+        pos = int(np.searchsorted(self.item_ids, item_id))
+        if pos >= len(self.item_ids) or self.item_ids[pos] != item_id:
+            return None
+        return int(self.market_values()[pos])
+
+    def item_variants(self, item_id):
+        """ Variant keys of the item listed in this snapshot, ascending. """
+        if self.variants is None:
+            return np.zeros(0, dtype=np.int64)
+        if self._variants_by_item is None:
+            order = np.argsort(self.variant_items, kind="stable")
+            self._variants_by_item = (self.variant_items[order], self.variants.item_ids[order])
+        items, keys = self._variants_by_item
+        return keys[np.searchsorted(items, item_id, "left"):np.searchsorted(items, item_id, "right")]
+
+    def variant_item(self, key):
+        """ Item id of a listed variant key, or None. """
+        if self.variants is None:
+            return None
+        pos = int(np.searchsorted(self.variants.item_ids, key))
+        if pos >= len(self.variant_items) or self.variants.item_ids[pos] != key:
+            return None
+        return int(self.variant_items[pos])
+
+    # --- Reporting ---
+
+    @property
+    def nbytes(self):
+        own = sum(a.nbytes for a in (self.item_ids, self.offsets, self.prices, self.quantities, self.cum_quantity, self.cum_cost))
+        return own + (self.variants.nbytes + self.variant_items.nbytes if self.variants is not None else 0)
+
+    def stats(self):
+        return {
+            "generation": self.generation,
+            "created_at": self.created_at,
+            "auctions": self.auction_count,
+            "items": int(len(self.item_ids)),
+            "variants": int(len(self.variant_items)),
+            "price_levels": int(len(self.prices)),
+            "memory_bytes": int(self.nbytes),
+            "build_seconds": round(self.build_seconds, 4)
+        }
+
+
+def realm_source(realm_id):
+    """ Publish-tracking and archive source name of a connected realm's auction house. """
+    return f"realm:{realm_id}"
+
+
+def source_realm(source):
+    """ Connected realm id of a source, or None for the region-wide commodities. """
+    return int(source.split(":", 1)[1]) if source.startswith("realm:") else None
+
+
+def region_source(region):
+    """ Source name of the commodity auction house of a further region; the primary region's is "commodities". """
+    return f"commodities:{region}"
+
+
+def source_region(source):
+    """ Region of a further region's commodity source, or None. """
+    return source.split(":", 1)[1] if source.startswith("commodities:") else None
+
+
+def build_views(source_snapshots, realm_ids):
+    """ One view per realm from the latest snapshot of every source ({source: MarketSnapshot}). """
+    commodities = source_snapshots.get("commodities") or MarketSnapshot.empty()
+    return {
+        realm_id: MarketSnapshot.merge([commodities, source_snapshots.get(realm_source(realm_id)) or MarketSnapshot.empty()])
+        for realm_id in realm_ids
+    }
+
+
+class MarketIndex:
+    """
+    Holds the current MarketSnapshot of every realm. New snapshots are fully built before they are
+    published, so readers always see either the previous or the new state, never a partial one.
+    Readers should take ``market_index.snapshot`` (or ``view(realm_id)``) once and run all their
+    queries against it.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.snapshot = MarketSnapshot.empty()
+        self.realms = {} # realm id -> MarketSnapshot; the home realm's is also self.snapshot
+        self.regions = {} # further region -> MarketSnapshot of its commodities
+
+    def publish(self, snapshot, realms=None, regions=None):
+        """ Publishes the home realm's snapshot, optionally together with the views of all realms and further regions. """
+        with self._lock:
+            self._generation += 1
+            for view in {id(s): s for s in [snapshot, *(realms or {}).values(), *(regions or {}).values()]}.values():
+                view.generation = self._generation
+            self.snapshot = snapshot
+            self.realms = dict(realms or {})
+            self.regions = dict(regions or {})
+        return snapshot
+
+    def view(self, realm_id=None, region=None):
+        """
+        Snapshot priced for a tracked realm (default: the home realm), or the commodities of a
+        further `region`; empty until its first ingestion.
+        """
+        if region is not None:
+            return self.regions.get(region) or MarketSnapshot.empty()
+        if realm_id is None:
+            return self.snapshot
+        return self.realms.get(realm_id) or MarketSnapshot.empty()
+
+
+market_index = MarketIndex()
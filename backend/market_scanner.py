@@ -0,0 +1,119 @@
+"""
+market_scanner.py
+Top movers across the whole auction house, not just the tracked items.
+Every published market snapshot is reduced to one aggregate row per item (market value and
+listed quantity) and kept in an hourly ring covering the last MAX_HOURS; the latest snapshot
+of each hour wins. "Largest price drop / rise / supply change over N hours" then compares the
+current aggregates against the ring slot N hours back. The per-item deltas are computed once
+per snapshot and window with array operations, and queries pick their top-K with a heap.
+"""
+import heapq
+import threading
+import time
+import numpy as np
+
+MAX_HOURS = 48
+METRICS = ("price_drop", "price_rise", "supply_drop", "supply_rise")
+
+
+class ScanSlot:
+    """ Aggregates of one snapshot, sorted by item id. """
+    __slots__ = ("hour", "observed_at", "item_ids", "prices", "quantities")
+
+    def __init__(self, hour, observed_at, item_ids, prices, quantities):
+        self.hour = hour
+        self.observed_at = observed_at
+        self.item_ids = item_ids
+        self.prices = prices
+        self.quantities = quantities
+
+
+class WindowDeltas:
+    """ Changes of every item listed both now and at the reference slot. """
+    __slots__ = ("reference", "item_ids", "prices", "quantities", "ref_prices", "ref_quantities", "price_pct", "supply_pct")
+
+    def __init__(self, current, reference):
+        self.reference = reference
+        pos = np.minimum(np.searchsorted(reference.item_ids, current.item_ids), max(len(reference.item_ids) - 1, 0))
+        found = reference.item_ids[pos] == current.item_ids if len(reference.item_ids) else np.zeros(len(current.item_ids), dtype=bool)
+        pos = pos[found]
+        self.item_ids = current.item_ids[found]
+        self.prices = current.prices[found]
+        self.quantities = current.quantities[found]
+        self.ref_prices = reference.prices[pos]
+        self.ref_quantities = reference.quantities[pos]
+        self.price_pct = np.divide((self.prices - self.ref_prices) * 100.0, self.ref_prices,
+                                   out=np.zeros(len(pos)), where=self.ref_prices > 0)
+        self.supply_pct = np.divide((self.quantities - self.ref_quantities) * 100.0, self.ref_quantities,
+                                    out=np.zeros(len(pos)), where=self.ref_quantities > 0)
+
+
+class MarketScanner:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.slots = {} # hour number (epoch hours) -> ScanSlot
+        self.current = None
+        self._deltas = {} # hours -> WindowDeltas of the current slot
+
+    def observe(self, snapshot, observed_at=None):
+        """ Adds the per-item aggregates of a published MarketSnapshot. """
+        observed_at = observed_at or time.time()
+        hour = int(observed_at // 3600)
+        quantities = snapshot.cum_quantity[snapshot.offsets[1:]] - snapshot.cum_quantity[snapshot.offsets[:-1]]
+        # Item ids and quantities fit 32 bits, which halves the ring for them
+        slot = ScanSlot(hour, observed_at, snapshot.item_ids.astype(np.int32), snapshot.market_values(), quantities.astype(np.int32))
+        with self._lock:
+            self.slots[hour] = slot
+            for old in [h for h in self.slots if h < hour - MAX_HOURS]:
+                del self.slots[old]
+            self.current = slot
+            self._deltas = {}
+
+    def deltas(self, hours):
+        """ Deltas of the current snapshot against the latest slot at least `hours` old (None if the ring is too short). """
+        with self._lock:
+            current = self.current
+            if current is None:
+                return None
+            cached = self._deltas.get(hours)
+            if cached is not None:
+                return cached
+            candidates = [h for h in self.slots if h <= current.hour - hours]
+            if not candidates:
+                return None
+            deltas = WindowDeltas(current, self.slots[max(candidates)])
+            self._deltas[hours] = deltas
+            return deltas
+
+    def top_movers(self, metric="price_drop", hours=24, limit=20, min_quantity=0, min_price=0):
+        """ Returns (deltas, indices of the top `limit` items by `metric`), or (None, []) without history. """
+        deltas = self.deltas(hours)
+        if deltas is None:
+            return None, []
+        if metric == "price_drop":
+            scores = -deltas.price_pct
+        elif metric == "price_rise":
+            scores = deltas.price_pct
+        elif metric == "supply_drop":
+            scores = -deltas.supply_pct
+        else:
+            scores = deltas.supply_pct
+
+        # Thin markets swing wildly in percent; filter them before ranking
+        eligible = np.flatnonzero(
+            (deltas.quantities >= min_quantity) & (deltas.ref_quantities >= min_quantity) &
+            (deltas.prices >= min_price) & (deltas.ref_prices >= min_price) & (scores > 0)
+        )
+        ranked = heapq.nlargest(limit, zip(scores[eligible].tolist(), eligible.tolist()))
+        return deltas, [i for _, i in ranked]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hours": sorted(self.slots),
+                "items": int(len(self.current.item_ids)) if self.current else 0,
+                "memory_bytes": int(sum(s.item_ids.nbytes + s.prices.nbytes + s.quantities.nbytes for s in self.slots.values()))
+            }
+
+
+market_scanner = MarketScanner()
@@ -0,0 +1,81 @@
+"""
+market_state.py
+Hands the latest auction snapshots from the worker process to the API processes.
+The worker writes every new snapshot frame to MARKET_STATE_DIR in the archive format
+(snapshot_archive.py, written atomically); each API process checks the directory every few
+seconds and rebuilds its in-memory market index and top-movers ring when a newer set of
+snapshots appears. Only the latest files per source are kept. The cross-realm arbitrage
+index is saved next to them (see arbitrage.py).
+"""
+import os
+import threading
+import snapshot_archive
+from config import config
+from market_index import market_index, MarketSnapshot, build_views, source_region
+from market_scanner import market_scanner
+from liquidity_tracker import liquidity_tracker
+from arbitrage import arbitrage_index
+
+KEEP_PER_SOURCE = 2 # The previous file stays until readers have moved on
+REFRESH_SECONDS = 10
+
+
+def save(directory, frames):
+    """ Worker: writes the new frames ({source: AuctionFrame}) and prunes older files of their sources. """
+    for source, frame in frames.items():
+        snapshot_archive.write_archive(directory, source, frame)
+        for path in snapshot_archive.list_archives(directory, source)[:-KEEP_PER_SOURCE]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def latest_files(directory):
+    """ Newest archive path per source. """
+    latest = {}
+    for path in snapshot_archive.list_archives(directory):
+        prefix, published_at = snapshot_archive.parse_archive_filename(path)
+        if prefix not in latest or published_at > latest[prefix][0]:
+            latest[prefix] = (published_at, path)
+    return {prefix: path for prefix, (_, path) in latest.items()}
+
+
+class MarketStateReader:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.loaded = None # Sorted paths of the loaded snapshot set
+
+    def refresh(self, directory):
+        """ API: reloads the market index if the worker published newer snapshots. Returns True if it did. """
+        if not os.path.isdir(directory):
+            return False
+        arbitrage_index.refresh(directory)
+        with self._lock:
+            files = latest_files(directory)
+            key = tuple(sorted(files.values()))
+            if not files or key == self.loaded:
+                return False
+            snapshots = {}
+            for path in key:
+                try:
+                    with snapshot_archive.open_archive(path) as archive:
+                        snapshots[archive.source] = MarketSnapshot.from_frame(archive.to_frame())
+                except (OSError, ValueError) as e:
+                    # Pruned by the worker between listing and opening; the next refresh picks up the new set
+                    print(f"Could not load market state {path}: {e}")
+                    return False
+            realm_ids = config.realm_ids()
+            views = build_views(snapshots, realm_ids)
+            regions = {source_region(s): snap for s, snap in snapshots.items() if source_region(s)}
+            snapshot = market_index.publish(views[realm_ids[0]], views, regions)
+            market_scanner.observe(snapshot)
+            # The worker saves the snapshots after committing their rollups; rebuild the ranking from them
+            liquidity_tracker.loaded = False
+            self.loaded = key
+            stats = snapshot.stats()
+            print(f"Market index reloaded from the worker: {len(views)} realm(s), {stats['items']} items on the home realm")
+            return True
+
+
+market_state_reader = MarketStateReader()
@@ -0,0 +1,88 @@
+import sqlite3
+import json
+import os
+
+db_file = 'realmguardian.db'
+
+def run_migration():
+    """
+    Creates character_equipment and character_profession_tiers and fills them from the
+    equipment and professions JSON of the characters. The JSON columns are no longer read or
+    written afterwards; they stay in the table.
+    """
+    if not os.path.exists(db_file):
+        print("Database not found.")
+        return
+
+    conn = sqlite3.connect(db_file)
+    cursor = conn.cursor()
+
+    try:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS character_equipment (
+                id INTEGER PRIMARY KEY,
+                character_id INTEGER NOT NULL REFERENCES characters (id),
+                slot VARCHAR NOT NULL,
+                item_id INTEGER,
+                name VARCHAR,
+                quality VARCHAR,
+                level INTEGER,
+                CONSTRAINT uq_character_equipment_slot UNIQUE (character_id, slot)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_equipment_id ON character_equipment (id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_equipment_item_id ON character_equipment (item_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_equipment_slot_level ON character_equipment (slot, level)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_equipment_character_level ON character_equipment (character_id, level)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS character_profession_tiers (
+                id INTEGER PRIMARY KEY,
+                character_id INTEGER NOT NULL REFERENCES characters (id),
+                profession VARCHAR NOT NULL,
+                profession_id INTEGER,
+                tier VARCHAR NOT NULL,
+                tier_id INTEGER,
+                skill_points INTEGER,
+                max_skill_points INTEGER,
+                CONSTRAINT uq_character_profession_tier UNIQUE (character_id, profession, tier)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_profession_tiers_id ON character_profession_tiers (id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_profession_tiers_skill ON character_profession_tiers (profession, skill_points)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS ix_character_profession_tiers_id_skill ON character_profession_tiers (profession_id, skill_points)")
+        print("Ensured character_equipment and character_profession_tiers exist")
+
+        cursor.execute("PRAGMA table_info(characters)")
+        columns = [info[1] for info in cursor.fetchall()]
+        if 'equipment' not in columns or 'professions' not in columns:
+            print("No equipment/professions JSON to migrate.")
+            conn.commit()
+            return
+
+        equipment_rows, tier_rows = [], []
+        cursor.execute("SELECT id, equipment, professions FROM characters")
+        for character_id, equipment, professions in cursor.fetchall():
+            try:
+                for item in json.loads(equipment) if equipment else []:
+                    if item.get("slot"):
+                        equipment_rows.append((character_id, item["slot"], item.get("id"), item.get("name"), item.get("quality"), item.get("level", 0)))
+                for prof in json.loads(professions) if professions else []:
+                    for tier in prof.get("tiers", []):
+                        tier_rows.append((character_id, prof.get("name", "Unknown"), tier.get("name", "Unknown Expansion"),
+                                          tier.get("skill_points", 0), tier.get("max_skill_points", 0)))
+            except (ValueError, AttributeError) as e:
+                print(f"Skipping unreadable JSON of character {character_id}: {e}")
+
+        # OR IGNORE: rows written by a sync since the tables exist are newer than the JSON
+        cursor.executemany("INSERT OR IGNORE INTO character_equipment (character_id, slot, item_id, name, quality, level) VALUES (?, ?, ?, ?, ?, ?)", equipment_rows)
+        cursor.executemany("INSERT OR IGNORE INTO character_profession_tiers (character_id, profession, tier, skill_points, max_skill_points) VALUES (?, ?, ?, ?, ?)", tier_rows)
+        conn.commit()
+        print(f"Migrated {len(equipment_rows)} equipped items and {len(tier_rows)} profession tiers.")
+    except Exception as e:
+        print(f"Migration error: {e}")
+        conn.rollback()
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    run_migration()
@@ -3,7 +3,7 @@ models.py
 Defines the SQLAlchemy ORM models representing the database schema.
 Includes models for WoW Tokens, Characters, Tracked Items, and Price History.
 """
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Boolean
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, ForeignKey, Boolean, UniqueConstraint, Index, text
 from sqlalchemy.orm import relationship
 from database import Base
 import datetime
@@ -30,10 +30,15 @@ class TrackedItem(Base):
 
 class ItemPriceHistory(Base):
     __tablename__ = "item_price_history"
+    __table_args__ = (Index("ix_item_price_history_item_time", "item_id", "timestamp"),)
 
     id = Column(Integer, primary_key=True, index=True)
     item_id = Column(Integer, ForeignKey("tracked_items.id"))
     buyout = Column(Integer, nullable=False) # Gold value or copper? Usually copper in API
+    market_value = Column(Integer, nullable=True) # Trimmed, outlier-robust price (see MarketSnapshot.market_values)
+    realm_id = Column(Integer, nullable=True) # Connected realm; NULL for region-wide commodities (and rows before realm tracking)
+    variant_key = Column(BigInteger, nullable=True) # One item variant (see ItemVariant); NULL for the price across all variants
+    region = Column(String, nullable=True) # Further region ('us', 'kr', ...); NULL for the primary region (config.region)
     quantity = Column(Integer, default=1)
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
@@ -49,16 +54,55 @@ class Character(Base):
     class_name = Column(String, nullable=True)
     level = Column(Integer, nullable=True)
     item_level = Column(Integer, default=0)
-    equipment = Column(String, nullable=True) # Will store compressed JSON
-    professions = Column(String, nullable=True) # Will store compressed JSON for professions
     reputations = Column(String, nullable=True) # Will store JSON of factions and renown
     gold = Column(Integer, default=0) # Stored in copper
     played_time = Column(Integer, default=0) # Seconds
     delves_completed = Column(Integer, default=0)
     delves_max_tier = Column(Integer, default=0)
     icon_url = Column(String, nullable=True)
+    owner = Column(Integer, nullable=True, index=True) # Battle.net account id (UserAccessToken.account_id); NULL before multi-account support
+    last_login = Column(BigInteger, nullable=True) # last_login_timestamp of the profile (ms); unchanged characters are not fetched again
+    profile_modified_at = Column(Integer, nullable=True) # Last-Modified of the profile summary (epoch seconds), sent as If-Modified-Since
     last_updated = Column(DateTime, default=datetime.datetime.utcnow)
 
+    equipment = relationship("CharacterEquipment", cascade="all, delete-orphan")
+    profession_tiers = relationship("CharacterProfessionTier", cascade="all, delete-orphan")
+
+class CharacterEquipment(Base):
+    """ One equipped item per character and slot (replaces the equipment JSON of characters). """
+    __tablename__ = "character_equipment"
+    __table_args__ = (
+        UniqueConstraint("character_id", "slot", name="uq_character_equipment_slot"),
+        Index("ix_character_equipment_slot_level", "slot", "level"), # Lowest items of a slot across characters
+        Index("ix_character_equipment_character_level", "character_id", "level"), # Lowest slot of a character
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    slot = Column(String, nullable=False) # e.g. "HEAD", "FINGER_1"
+    item_id = Column(Integer, nullable=True, index=True)
+    name = Column(String, nullable=True)
+    quality = Column(String, nullable=True) # e.g. "EPIC"
+    level = Column(Integer, default=0)
+
+class CharacterProfessionTier(Base):
+    """ Skill of a character in one expansion tier of a profession (replaces the professions JSON of characters). """
+    __tablename__ = "character_profession_tiers"
+    __table_args__ = (
+        UniqueConstraint("character_id", "profession", "tier", name="uq_character_profession_tier"),
+        Index("ix_character_profession_tiers_skill", "profession", "skill_points"), # e.g. Inscription above 90
+        Index("ix_character_profession_tiers_id_skill", "profession_id", "skill_points"), # The same by profession id
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    character_id = Column(Integer, ForeignKey("characters.id"), nullable=False)
+    profession = Column(String, nullable=False) # Localized name, as shown in the dashboard
+    profession_id = Column(Integer, nullable=True)
+    tier = Column(String, nullable=False) # Expansion tier, e.g. "Khaz Algar Inscription"
+    tier_id = Column(Integer, nullable=True)
+    skill_points = Column(Integer, default=0)
+    max_skill_points = Column(Integer, default=0)
+
 class UserTask(Base):
     __tablename__ = "user_tasks"
 
@@ -74,6 +118,7 @@ class AccountGoldHistory(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     total_gold = Column(Integer, nullable=False) # Stored in copper
+    owner = Column(Integer, nullable=True, index=True) # Battle.net account id; NULL for the total of all accounts
     timestamp = Column(DateTime, default=datetime.datetime.utcnow)
 
 class Recipe(Base):
@@ -104,5 +149,185 @@ class UserAccessToken(Base):
     __tablename__ = "user_access_tokens"
     
     id = Column(Integer, primary_key=True, index=True)
+    account_id = Column(Integer, unique=True, nullable=True) # Battle.net account id; NULL for a token stored before multi-account support
+    battletag = Column(String, nullable=True)
     access_token = Column(String, nullable=False)
     expires_at = Column(Integer, nullable=False)
+    last_synced_at = Column(DateTime, nullable=True) # Last complete character sync of the account
+    sync_requested_at = Column(DateTime, nullable=True) # Set by a login or "sync now"; served before the periodic syncs
+
+class ItemSellThrough(Base):
+    __tablename__ = "item_sell_through"
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("tracked_items.id"), index=True)
+    interval_start = Column(DateTime, nullable=False)
+    interval_end = Column(DateTime, nullable=False, index=True)
+    sold_units = Column(Integer, default=0) # Units bought out (or cancelled, indistinguishable in the API)
+    sold_auctions = Column(Integer, default=0)
+    expired_units = Column(Integer, default=0) # Units on auctions that ran out of time
+    new_units = Column(Integer, default=0) # Units newly listed during the interval
+
+class ItemPriceRollup(Base):
+    __tablename__ = "item_price_rollups"
+    __table_args__ = (UniqueConstraint("item_id", "bucket_start", name="uq_item_price_rollup_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, ForeignKey("tracked_items.id"), index=True)
+    bucket_start = Column(DateTime, nullable=False, index=True) # Start of the hour (UTC)
+    samples = Column(Integer, default=0)
+    min_buyout = Column(Integer, nullable=False)
+    max_buyout = Column(Integer, nullable=False)
+    sum_buyout = Column(BigInteger, default=0) # avg = sum_buyout / samples
+    open_buyout = Column(Integer, nullable=False)
+    close_buyout = Column(Integer, nullable=False)
+    close_quantity = Column(Integer, default=0)
+    sold_units = Column(Integer, default=0) # Estimated from quantity drops at an unchanged price
+    price_changes = Column(Integer, default=0)
+    measured_sold_units = Column(Integer, nullable=True) # Auction-level sell-through, if diffed
+
+class AlertRule(Base):
+    __tablename__ = "alert_rules"
+    __table_args__ = (Index("ix_alert_rules_kind_item", "kind", "item_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    item_id = Column(Integer, nullable=False) # Blizzard item id (crafted item id for margin rules)
+    kind = Column(String, nullable=False) # 'price_below', 'price_above', 'pct_change', 'quantity_drop', 'margin_above'
+    threshold = Column(Float, nullable=False) # Copper for price rules, percent otherwise
+    window_hours = Column(Integer, default=24) # Look-back of pct_change / quantity_drop
+    cooldown_minutes = Column(Integer, default=60)
+    sink = Column(String, default="log")
+    enabled = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_fired_at = Column(DateTime, nullable=True)
+
+class AlertEvent(Base):
+    __tablename__ = "alert_events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    rule_id = Column(Integer, ForeignKey("alert_rules.id", ondelete="CASCADE"), index=True)
+    item_id = Column(Integer, nullable=False)
+    kind = Column(String, nullable=False)
+    threshold = Column(Float, nullable=False)
+    value = Column(Float, nullable=False) # Observed price / percentage that triggered the rule
+    fired_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+    message = Column(String, nullable=False)
+
+class SeriesIndicator(Base):
+    __tablename__ = "series_indicators"
+    __table_args__ = (
+        UniqueConstraint("series", "sample_id", name="uq_series_indicator_sample"),
+        Index("ix_series_indicators_series_time", "series", "timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    series = Column(String, nullable=False) # 'item:<blizzard item id>' or 'token:<region>'
+    sample_id = Column(Integer, nullable=False) # Row id in item_price_history / wow_token_history
+    timestamp = Column(Integer, nullable=False) # Epoch seconds of the sample
+    value = Column(BigInteger, nullable=False)
+    sma = Column(Float, nullable=False)
+    ema = Column(Float, nullable=False)
+    std = Column(Float, nullable=False)
+    rolling_min = Column(BigInteger, nullable=False)
+    rolling_max = Column(BigInteger, nullable=False)
+    upper_band = Column(Float, nullable=False)
+    lower_band = Column(Float, nullable=False)
+
+class ItemCorrelation(Base):
+    __tablename__ = "item_correlations"
+    __table_args__ = (Index("ix_item_correlations_day_item", "day", "item_id"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    day = Column(String, nullable=False) # UTC date (YYYY-MM-DD) the result was computed for
+    item_id = Column(Integer, nullable=False) # Blizzard item id
+    other_item_id = Column(Integer, nullable=False)
+    correlation = Column(Float, nullable=False) # Of hourly log returns, same hour
+    lag_hours = Column(Integer, nullable=False) # Lag of the strongest lagged correlation; > 0: item leads
+    lagged_correlation = Column(Float, nullable=False)
+    samples = Column(Integer, nullable=False) # Hourly returns both items had data for
+
+class SeriesSeasonality(Base):
+    __tablename__ = "series_seasonality"
+    __table_args__ = (UniqueConstraint("series", "hour_of_week", name="uq_series_seasonality_bucket"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    series = Column(String, nullable=False, index=True) # 'item:<blizzard item id>' or 'token:<region>'
+    hour_of_week = Column(Integer, nullable=False) # 0 = Monday 00:00 UTC
+    price_weight = Column(Float, nullable=False, default=0) # Decayed number of price samples
+    price_mean = Column(Float, nullable=False, default=0)
+    price_m2 = Column(Float, nullable=False, default=0) # Decayed sum of squared deviations (Welford)
+    sold_weight = Column(Float, nullable=False, default=0)
+    sold_mean = Column(Float, nullable=False, default=0) # Average units sold per hour
+    last_updated = Column(Integer, nullable=False, default=0) # Epoch seconds of the last observation
+
+class SchedulerJob(Base):
+    __tablename__ = "scheduler_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, nullable=False)
+    schedule = Column(String) # Human readable schedule of the last server start
+    last_run_at = Column(DateTime) # UTC
+    last_finished_at = Column(DateTime)
+    last_duration = Column(Float) # Seconds
+    last_status = Column(String) # running, ok, failed, timeout
+    last_error = Column(String)
+    next_run_at = Column(DateTime) # UTC; used to detect runs missed while the server was down
+    run_count = Column(Integer, default=0)
+    failure_count = Column(Integer, default=0)
+    skipped_count = Column(Integer, default=0) # Due runs skipped because the previous run was still going
+
+class SnapshotPublish(Base):
+    __tablename__ = "snapshot_publishes"
+    __table_args__ = (UniqueConstraint("source", "published_at", name="uq_snapshot_publish"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source = Column(String, nullable=False, index=True) # 'commodities' or 'realm:<connected realm id>'
+    published_at = Column(Integer, nullable=False) # Epoch seconds from the Last-Modified header
+    fetched_at = Column(Integer, nullable=False) # Epoch seconds the snapshot was downloaded
+
+class QueuedJob(Base):
+    __tablename__ = "job_queue"
+    __table_args__ = (
+        # At most one queued or running job per dedupe key (see job_queue.enqueue)
+        Index("uq_job_queue_active", "dedupe_key", unique=True, sqlite_where=text("status IN ('queued', 'running')")),
+        Index("ix_job_queue_status_available", "status", "available_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False) # Name of the worker job, e.g. 'commodity_prices'
+    payload = Column(String, nullable=True) # JSON
+    status = Column(String, nullable=False, default="queued") # queued, running, done, failed, skipped
+    dedupe_key = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    available_at = Column(DateTime, default=datetime.datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    worker_id = Column(String, nullable=True)
+    lease_until = Column(DateTime, nullable=True) # A running job whose lease ran out is requeued
+    heartbeat_at = Column(DateTime, nullable=True)
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    error = Column(String, nullable=True)
+
+class WorkerLease(Base):
+    __tablename__ = "worker_leases"
+
+    name = Column(String, primary_key=True) # e.g. 'scheduler'
+    owner = Column(String, nullable=False) # '<host>:<pid>' of the worker holding it
+    lease_until = Column(DateTime, nullable=False)
+
+class WorkerState(Base):
+    __tablename__ = "worker_state"
+
+    name = Column(String, primary_key=True) # e.g. 'publish_cadence'
+    data = Column(String, nullable=False) # JSON written by the worker for the API to read
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+class ItemVariant(Base):
+    __tablename__ = "item_variants"
+
+    variant_key = Column(BigInteger, primary_key=True) # Hash of item id, bonus ids and relevant modifiers (see market_index.variant_keys)
+    item_id = Column(Integer, nullable=False, index=True) # Blizzard Item ID
+    bonus_ids = Column(String, nullable=False, default="") # Comma-separated, ascending
+    modifiers = Column(String, nullable=True) # JSON list of [type, value]
+    first_seen_at = Column(DateTime, default=datetime.datetime.utcnow)
@@ -0,0 +1,224 @@
+"""
+publish_cadence.py
+Adaptive polling of the auction snapshots.
+Blizzard publishes a new snapshot per auction house roughly hourly, at an offset that drifts.
+The publish times (Last-Modified) of every source are kept in snapshot_publishes; the median
+interval between recent publishes predicts the next one, and the next download is planned
+shortly after it. If the snapshot is not out yet, conditional requests (If-Modified-Since,
+answered with an empty 304) retry with a growing delay until it is.
+
+Per source the tracker counts polls, 304s and wasted downloads (full downloads of a snapshot
+that was already ingested) and measures staleness, the time from publish to ingestion.
+
+The due sources of a run (commodities and every tracked realm) are polled concurrently.
+"""
+import asyncio
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+import models
+import snapshot_worker
+
+HISTORY = 24 # Publishes kept per source
+DEFAULT_INTERVAL = 3600
+MIN_INTERVAL = 600 # Shorter gaps between publishes are treated as re-publishes, not cadence
+PUBLISH_DELAY = 30 # Seconds after the predicted publish before the first request
+RETRY_DELAYS = (60, 120, 240, 480) # Conditional polls while a publish is late, then every 480s
+FALLBACK_POLL = 300 # Until a source has two publishes to learn from
+MIN_GAP = 15 # Never poll a source more often than this
+PARALLEL_FETCHES = 4 # Concurrent downloads; the client's rate limiter keeps them within the API quota
+
+
+class SourceCadence:
+    def __init__(self, source, publishes=()):
+        self.source = source
+        self.publishes = deque(publishes, maxlen=HISTORY) # Epoch seconds, ascending
+        self.next_poll = 0 # Due immediately after startup
+        self.predicted = None
+        self.misses = 0 # Polls since the last new snapshot
+        self.polls = 0
+        self.not_modified = 0
+        self.downloads = 0
+        self.wasted_downloads = 0
+        self.errors = 0
+        self.staleness = deque(maxlen=HISTORY) # Seconds from publish to ingestion
+        self.prediction_errors = deque(maxlen=HISTORY) # Actual minus predicted publish time
+        self.last_poll_at = None
+
+    @property
+    def last_published(self):
+        return self.publishes[-1] if self.publishes else None
+
+    def interval(self):
+        gaps = [b - a for a, b in zip(self.publishes, list(self.publishes)[1:]) if b - a >= MIN_INTERVAL]
+        return statistics.median(gaps) if gaps else DEFAULT_INTERVAL
+
+    def plan(self, now):
+        """ Sets next_poll: just after the predicted publish, or a retry if the publish is late. """
+        if len(self.publishes) < 2:
+            self.predicted = None
+            self.next_poll = now + FALLBACK_POLL
+            return
+        self.predicted = self.last_published + self.interval()
+        if self.predicted + PUBLISH_DELAY > now:
+            self.next_poll = self.predicted + PUBLISH_DELAY
+        else:
+            self.next_poll = now + RETRY_DELAYS[min(self.misses, len(RETRY_DELAYS) - 1)]
+        self.next_poll = max(self.next_poll, now + MIN_GAP)
+
+    def is_known(self, published_at):
+        return published_at is not None and published_at in self.publishes
+
+    def record(self, now, outcome, published_at=None):
+        """ Records one poll ("new", "not_modified", "wasted" or "error") and plans the next one. """
+        self.polls += 1
+        self.last_poll_at = now
+        if outcome == "new":
+            self.downloads += 1
+            if self.predicted is not None:
+                self.prediction_errors.append(published_at - self.predicted)
+            self.publishes.append(published_at)
+            self.staleness.append(max(now - published_at, 0))
+            self.misses = 0
+        else:
+            self.misses += 1
+            if outcome == "not_modified":
+                self.not_modified += 1
+            elif outcome == "wasted":
+                self.downloads += 1
+                self.wasted_downloads += 1
+            else:
+                self.errors += 1
+        self.plan(now)
+
+    def metrics(self, now):
+        return {
+            "source": self.source,
+            "interval_seconds": round(self.interval(), 1),
+            "last_published": self.last_published,
+            "predicted_publish": self.predicted,
+            "next_poll": self.next_poll,
+            "data_age_seconds": round(now - self.last_published, 1) if self.publishes else None,
+            "polls": self.polls,
+            "not_modified": self.not_modified,
+            "downloads": self.downloads,
+            "wasted_downloads": self.wasted_downloads,
+            "errors": self.errors,
+            "staleness_last": round(self.staleness[-1], 1) if self.staleness else None,
+            "staleness_avg": round(statistics.mean(self.staleness), 1) if self.staleness else None,
+            "staleness_max": round(max(self.staleness), 1) if self.staleness else None,
+            "prediction_error_avg": round(statistics.mean(self.prediction_errors), 1) if self.prediction_errors else None
+        }
+
+
+class PublishTracker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sources = {}
+        self._warm = False
+
+    def warm(self, db):
+        """ Loads the recent publish times of all sources once, so the cadence survives restarts. """
+        with self._lock:
+            if self._warm:
+                return
+            rows = db.query(models.SnapshotPublish.source, models.SnapshotPublish.published_at)\
+                .order_by(models.SnapshotPublish.published_at.asc()).all()
+            history = {}
+            for source, published_at in rows:
+                history.setdefault(source, deque(maxlen=HISTORY)).append(published_at)
+            now = time.time()
+            for source, publishes in history.items():
+                cadence = self.sources[source] = SourceCadence(source, publishes)
+                cadence.plan(now)
+                # A publish that happened while the server was down is fetched right away
+                if cadence.predicted is not None and cadence.predicted < now:
+                    cadence.next_poll = now
+            self._warm = True
+
+    def source(self, name):
+        with self._lock:
+            cadence = self.sources.get(name)
+            if cadence is None:
+                cadence = self.sources[name] = SourceCadence(name)
+            return cadence
+
+    def record(self, db, source, now, outcome, published_at=None):
+        """ Records a poll of `source`; new publishes are added to snapshot_publishes. The caller commits. """
+        cadence = self.source(source)
+        with self._lock:
+            cadence.record(now, outcome, published_at)
+        if outcome == "new":
+            db.add(models.SnapshotPublish(source=source, published_at=int(published_at), fetched_at=int(now)))
+
+    def next_poll(self):
+        with self._lock:
+            return min((c.next_poll for c in self.sources.values()), default=None)
+
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            return [c.metrics(now) for c in self.sources.values()]
+
+
+async def poll_sources(db, fetchers, tracker=None, parallel=PARALLEL_FETCHES):
+    """
+    Polls the due sources of `fetchers` ({source: (client, fetch(if_modified_since) -> spooled file path)})
+    concurrently: downloads run in threads, parsing in the snapshot worker processes. Each client
+    (one per region) reports the source's Last-Modified and status under the source name.
+    Records every poll and returns the new AuctionFrames by source. The caller commits.
+    """
+    tracker = tracker or publish_tracker
+    slots = asyncio.Semaphore(parallel)
+    new_frames = {}
+
+    async def poll(source, client, fetch):
+        cadence = tracker.source(source)
+        now = time.time()
+        try:
+            async with slots:
+                path = await asyncio.to_thread(fetch, cadence.last_published)
+            published_at = client.last_modified.get(source)
+            if not path:
+                # The request is conditional, so a snapshot that is not published yet costs an empty 304
+                tracker.record(db, source, now, "not_modified" if client.last_status.get(source) == 304 else "error")
+                return
+            if cadence.is_known(published_at):
+                os.remove(path)
+                print(f"{source}: snapshot of {datetime.utcfromtimestamp(published_at):%H:%M} was already ingested.")
+                tracker.record(db, source, now, "wasted", published_at)
+                return
+            frame = await snapshot_worker.parse_snapshot(path, published_at)
+        except Exception as e:
+            print(f"Error polling {source}: {e}")
+            frame = None
+        if frame is None:
+            tracker.record(db, source, now, "error")
+            return
+        print(f"Processing {len(frame)} auctions from {source}...")
+        new_frames[source] = frame
+        tracker.record(db, source, now, "new", published_at or now)
+
+    due = [(source, client, fetch) for source, (client, fetch) in fetchers.items() if time.time() >= tracker.source(source).next_poll]
+    await asyncio.gather(*(poll(source, client, fetch) for source, client, fetch in due))
+    return new_frames
+
+
+class AdaptiveSchedule:
+    """ Scheduler schedule that runs the auction poll when the first source is due. """
+    after_run = True
+
+    def next_after(self, ts):
+        due = publish_tracker.next_poll()
+        if due is None:
+            return ts + FALLBACK_POLL
+        return max(due, ts + MIN_GAP)
+
+    def __str__(self):
+        return "adaptive (snapshot publish cadence)"
+
+
+publish_tracker = PublishTracker()
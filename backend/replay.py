@@ -0,0 +1,249 @@
+"""
+replay.py
+Backfill and replay engine: rebuilds price history, hourly rollups and sell-through data
+from a directory of archived auction snapshots (see snapshot_archive.py).
+Snapshots are decoded and filtered in a process pool, then grouped into the runs of the live
+ingestion, diffed and committed run by run in publish order by the main process through the
+same code path as the live ingestion (ingestion.py). With --source only the history of the
+given auction houses is regenerated.
+Tracked items get history even for snapshots taken before they were tracked; items that are
+not tracked are not replayed.
+
+Usage:
+    python replay.py ARCHIVE_DIR --items 124101,124102 [--since 2026-09-01] [--until 2026-10-01]
+    python replay.py ARCHIVE_DIR --all-tracked --workers 8
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from itertools import repeat
+
+from sqlalchemy import and_, or_
+
+from database import SessionLocal, engine
+import models
+import rollups
+import seasonality
+from indicators import indicator_engine, item_series, epoch
+import snapshot_archive
+from auction_diff import SellThroughTracker
+from config import config
+from ingestion import record_market_state, record_realm_prices, record_region_prices
+from market_index import MarketSnapshot, build_views, realm_source, source_realm, source_region
+
+# Snapshots of different sources published this close together belong to one ingestion run
+RUN_WINDOW = 30 * 60
+
+
+def load_filtered_frame(path, item_ids):
+    """ Worker: decodes one archive and keeps only the auctions of the replayed items. """
+    with snapshot_archive.open_archive(path) as archive:
+        frame = archive.to_frame()
+        source = archive.source
+    return source, frame.filter_items(item_ids)
+
+
+def load_tracked_items(db, item_ids):
+    """ Returns the TrackedItem rows of the ids, or None (after listing them) if some are not tracked. """
+    existing = {t.item_id: t for t in db.query(models.TrackedItem).filter(models.TrackedItem.item_id.in_(item_ids)).all()}
+    missing = [item_id for item_id in item_ids if item_id not in existing]
+    if missing:
+        # Tracking them here would put them on the live watchlist; that is up to the user
+        print(f"Not tracked: {', '.join(map(str, missing))}. Track the items first, then replay them.")
+        return None
+    return [existing[item_id] for item_id in item_ids]
+
+
+def home_sources():
+    return ("commodities", realm_source(config.home_realm()))
+
+
+def price_scope(source):
+    """ Filter on ItemPriceHistory for the rows (all variants included) that `source` writes. """
+    realm_id, region = source_realm(source), source_region(source)
+    if region is not None:
+        return models.ItemPriceHistory.region == region
+    if realm_id is not None:
+        return and_(models.ItemPriceHistory.realm_id == realm_id, models.ItemPriceHistory.region.is_(None))
+    return and_(models.ItemPriceHistory.realm_id.is_(None), models.ItemPriceHistory.region.is_(None))
+
+
+def clear_replayed_range(db, tracked_items, start, end, sources):
+    """
+    Deletes the history that replaying `sources` regenerates, so it can be re-run safely: their
+    price rows and, for the sources of the home realm, the sell-through, rollups and indicators.
+    Returns the tracked items whose derived data was cleared.
+    """
+    pks = [t.id for t in tracked_items]
+    in_range = and_(models.ItemPriceHistory.item_id.in_(pks),
+                    models.ItemPriceHistory.timestamp >= start, models.ItemPriceHistory.timestamp <= end)
+    replayed_home = [source for source in home_sources() if source in sources]
+    if len(replayed_home) == len(home_sources()):
+        derived_items = tracked_items
+    elif replayed_home:
+        # The derived data of an item follows the home source that lists it; keep that of the other one
+        listed = {pk for (pk,) in db.query(models.ItemPriceHistory.item_id).filter(in_range, price_scope(replayed_home[0])).distinct()}
+        derived_items = [t for t in tracked_items if t.id in listed]
+    else:
+        derived_items = []
+
+    deleted = db.query(models.ItemPriceHistory)\
+        .filter(in_range, or_(*(price_scope(source) for source in sources)))\
+        .delete(synchronize_session=False)
+    if derived_items:
+        derived_pks = [t.id for t in derived_items]
+        db.query(models.ItemSellThrough)\
+            .filter(models.ItemSellThrough.item_id.in_(derived_pks))\
+            .filter(models.ItemSellThrough.interval_end >= start, models.ItemSellThrough.interval_end <= end)\
+            .delete(synchronize_session=False)
+        db.query(models.ItemPriceRollup)\
+            .filter(models.ItemPriceRollup.item_id.in_(derived_pks))\
+            .filter(models.ItemPriceRollup.bucket_start >= rollups.bucket_start(start), models.ItemPriceRollup.bucket_start <= end)\
+            .delete(synchronize_session=False)
+        series = [item_series(t.item_id) for t in derived_items]
+        db.query(models.SeriesIndicator)\
+            .filter(models.SeriesIndicator.series.in_(series))\
+            .filter(models.SeriesIndicator.timestamp >= epoch(start), models.SeriesIndicator.timestamp <= epoch(end))\
+            .delete(synchronize_session=False)
+        indicator_engine.forget(series)
+    db.commit()
+    print(f"Cleared {deleted} price history rows of {', '.join(sorted(sources))} between {start} and {end}.")
+    return derived_items
+
+
+def select_archives(directory, since=None, until=None):
+    """ Returns (path, published_at, source) of the archives in the range, in publish order. """
+    selected = []
+    for path in snapshot_archive.list_archives(directory):
+        prefix, published_at = snapshot_archive.parse_archive_filename(path)
+        if since and published_at < since.timestamp():
+            continue
+        if until and published_at >= until.timestamp() + 86400:
+            continue
+        selected.append((path, published_at, prefix.replace('-', ':')))
+    return selected
+
+
+def group_runs(archives, sources=None):
+    """
+    Splits the archives (in publish order) into ingestion runs: snapshots of different sources
+    published within RUN_WINDOW of the first one, like one poll of the live ingestion. Returns
+    [(timestamp, archives of `sources`)]; runs are grouped over all sources, so a run gets the
+    same timestamp (its first publish) whichever sources are replayed.
+    """
+    runs = []
+    for path, published_at, source in archives:
+        if not runs or published_at - runs[-1][0][1] > RUN_WINDOW or source in {s for _, _, s in runs[-1]}:
+            runs.append([])
+        runs[-1].append((path, published_at, source))
+    selected = []
+    for run in runs:
+        entries = [entry for entry in run if not sources or entry[2] in sources]
+        if entries:
+            selected.append((datetime.utcfromtimestamp(run[0][1]), entries))
+    return selected
+
+
+def replay(directory, item_ids=None, since=None, until=None, sources=None, workers=None, replace=True):
+    models.Base.metadata.create_all(bind=engine)
+    runs = group_runs(select_archives(directory, since, until), set(sources or ()))
+    if not runs:
+        print("No archived snapshots found for the requested range.")
+        return 0
+    archives = [entry for _, run in runs for entry in run]
+
+    db = SessionLocal()
+    try:
+        if item_ids is None:
+            tracked_items = db.query(models.TrackedItem).all()
+        else:
+            tracked_items = load_tracked_items(db, item_ids)
+            if tracked_items is None:
+                return 0
+        if not tracked_items:
+            print("No items to replay.")
+            return 0
+        ids = [t.item_id for t in tracked_items]
+
+        start = runs[0][0]
+        end = datetime.utcfromtimestamp(archives[-1][1])
+        derived_items = tracked_items
+        if replace:
+            derived_items = clear_replayed_range(db, tracked_items, start, end, {source for _, _, source in archives})
+
+        print(f"Replaying {len(archives)} snapshots ({len(runs)} runs) for {len(ids)} items with {workers or os.cpu_count()} workers...")
+        started = time.perf_counter()
+        tracker = SellThroughTracker()
+        home_realm_id = config.home_realm()
+        latest = {} # source -> latest MarketSnapshot, like latest_snapshots of the live ingestion
+        paths = [path for path, _, _ in archives]
+
+        # map() yields in submission order, so runs are committed in publish order while
+        # later snapshots are already being decoded in the pool
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pool_frames = pool.map(load_filtered_frame, paths, repeat(ids), chunksize=4)
+            count = 0
+            for timestamp, run in runs:
+                frames = dict(next(pool_frames) for _ in run)
+                count += len(run)
+                for source, frame in frames.items():
+                    latest[source] = MarketSnapshot.from_frame(frame)
+                diffs = {source: tracker.observe(source, frame) for source, frame in frames.items()}
+
+                # Further realms and regions only have price history, like in the live ingestion
+                other_realms = {source_realm(source): latest[source] for source in frames
+                                if source_realm(source) is not None and source_realm(source) != home_realm_id}
+                if other_realms:
+                    record_realm_prices(db, other_realms, tracked_items, timestamp)
+                regions = {source_region(source): latest[source] for source in frames if source_region(source) is not None}
+                if regions:
+                    record_region_prices(db, regions, tracked_items, timestamp)
+
+                fresh = [latest[source] for source in home_sources() if source in frames]
+                if fresh:
+                    view = build_views(latest, [home_realm_id])[home_realm_id]
+                    home_diffs = [diffs[source] for source in home_sources() if source in frames]
+                    record_market_state(db, view, home_diffs, tracked_items, timestamp, verbose=False, realm_id=home_realm_id,
+                                        commodities=latest.get("commodities"), fresh=fresh)
+                db.commit()
+                if count % 50 < len(run) or count == len(paths):
+                    print(f"  {count}/{len(paths)} snapshots replayed ({timestamp:%Y-%m-%d %H:%M})")
+
+        # The first and last hour also hold samples from outside the replayed range, which were
+        # cleared with them; refold those two hours from the history
+        if replace and derived_items:
+            rollups.rebuild_buckets(db, [t.id for t in derived_items], [rollups.bucket_start(start), rollups.bucket_start(end)])
+            db.commit()
+        # The replay folded its samples into the hour-of-week profiles out of order; recompute them
+        seasonality.rebuild_series(db, [item_series(t.item_id) for t in derived_items])
+        print(f"Replay complete in {time.perf_counter() - started:.1f}s.")
+        return len(paths)
+    finally:
+        db.close()
+
+
+def _parse_date(value):
+    return datetime.strptime(value, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild price history from archived auction snapshots.")
+    parser.add_argument("archive_dir", help="Directory written by the snapshot archive (SNAPSHOT_ARCHIVE_DIR)")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--items", help="Comma separated Blizzard item ids to regenerate (must be tracked)")
+    group.add_argument("--all-tracked", action="store_true", help="Regenerate all currently tracked items")
+    parser.add_argument("--since", type=_parse_date, help="First day to replay (YYYY-MM-DD, UTC)")
+    parser.add_argument("--until", type=_parse_date, help="Last day to replay (YYYY-MM-DD, UTC)")
+    parser.add_argument("--source", action="append", help="Only replay this auction house (e.g. commodities, realm:1618)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--keep-existing", action="store_true", help="Do not delete existing history in the replayed range")
+    args = parser.parse_args()
+
+    item_ids = None if args.all_tracked else [int(i) for i in args.items.split(",") if i.strip()]
+    replay(args.archive_dir, item_ids, args.since, args.until, args.source, args.workers, not args.keep_existing)
+
+
+if __name__ == "__main__":
+    main()
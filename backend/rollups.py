@@ -0,0 +1,149 @@
+"""
+rollups.py
+Hourly per-item rollups of the price history.
+Every sample written to item_price_history is also folded into the rollup row of its hour
+(min/max/avg/open/close price, closing quantity, estimated sales and price changes), so
+long-range analytics can read a few rows per day instead of scanning the raw history.
+"""
+from datetime import timedelta
+from sqlalchemy import func
+import models
+from analytics import realm_filter
+
+
+def bucket_start(timestamp):
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def latest_rollups(db, item_pks, before):
+    """ Returns the most recent rollup row per item with a bucket starting at or before `before`. """
+    if not item_pks:
+        return {}
+    latest = db.query(
+        models.ItemPriceRollup.item_id,
+        func.max(models.ItemPriceRollup.bucket_start).label("bucket_start")
+    ).filter(models.ItemPriceRollup.item_id.in_(item_pks))\
+     .filter(models.ItemPriceRollup.bucket_start <= before)\
+     .group_by(models.ItemPriceRollup.item_id).subquery()
+
+    rows = db.query(models.ItemPriceRollup).join(
+        latest,
+        (models.ItemPriceRollup.item_id == latest.c.item_id) & (models.ItemPriceRollup.bucket_start == latest.c.bucket_start)
+    ).all()
+    return {row.item_id: row for row in rows}
+
+
+def record_samples(db, timestamp, prices, measured_sold=None):
+    """
+    Folds one ingestion run into the hourly rollups.
+    `prices` maps the tracked item's internal id to (buyout, quantity); `measured_sold` optionally
+    maps it to the auction-level sold units of the interval ending at `timestamp`.
+    Samples must be recorded in time order per item.
+    """
+    bucket = bucket_start(timestamp)
+    measured_sold = measured_sold or {}
+    previous = latest_rollups(db, list(prices), bucket)
+
+    rows = []
+    for item_pk, (buyout, quantity) in prices.items():
+        prev = previous.get(item_pk)
+        if prev is not None and prev.bucket_start == bucket:
+            row = prev
+        else:
+            row = models.ItemPriceRollup(
+                item_id=item_pk,
+                bucket_start=bucket,
+                samples=0,
+                min_buyout=buyout,
+                max_buyout=buyout,
+                sum_buyout=0,
+                open_buyout=buyout,
+                close_buyout=buyout,
+                close_quantity=quantity,
+                sold_units=0,
+                price_changes=0
+            )
+            db.add(row)
+
+        # Same sell-through heuristic as analytics: a quantity drop at an unchanged price is a sale
+        if prev is not None:
+            if buyout == prev.close_buyout and quantity < prev.close_quantity:
+                row.sold_units = (row.sold_units or 0) + prev.close_quantity - quantity
+            elif buyout != prev.close_buyout:
+                row.price_changes = (row.price_changes or 0) + 1
+
+        row.samples = (row.samples or 0) + 1
+        row.min_buyout = min(row.min_buyout, buyout)
+        row.max_buyout = max(row.max_buyout, buyout)
+        row.sum_buyout = (row.sum_buyout or 0) + buyout
+        row.close_buyout = buyout
+        row.close_quantity = quantity
+        if item_pk in measured_sold:
+            row.measured_sold_units = (row.measured_sold_units or 0) + measured_sold[item_pk]
+        rows.append(row)
+
+    # Make the rows visible to the next call before the caller commits (sessions do not autoflush)
+    db.flush()
+    return rows
+
+
+def fold_history(db, history):
+    """ Folds the item_price_history rows of `history` (a query) into the rollups in time order. """
+    # Group the samples by timestamp so each ingestion run is folded in as one batch
+    batch, batch_time = {}, None
+    for entry in history.order_by(models.ItemPriceHistory.timestamp.asc(), models.ItemPriceHistory.id.asc()).yield_per(5000):
+        if entry.timestamp != batch_time and batch:
+            record_samples(db, batch_time, batch)
+            batch = {}
+        batch_time = entry.timestamp
+        batch[entry.item_id] = (entry.buyout, entry.quantity)
+    if batch:
+        record_samples(db, batch_time, batch)
+
+
+def rebuild_from_history(db, item_pks=None):
+    """ Recomputes the rollups from the raw item_price_history, e.g. for data recorded before rollups existed. """
+    query = db.query(models.ItemPriceRollup)
+    history = db.query(models.ItemPriceHistory).filter(realm_filter()) # The home realm's series
+    if item_pks is not None:
+        query = query.filter(models.ItemPriceRollup.item_id.in_(item_pks))
+        history = history.filter(models.ItemPriceHistory.item_id.in_(item_pks))
+    query.delete(synchronize_session=False)
+    fold_history(db, history)
+    db.commit()
+
+
+def rebuild_buckets(db, item_pks, buckets):
+    """
+    Recomputes the rollup rows of the hours starting at `buckets` from item_price_history and
+    item_sell_through, e.g. the hours a replay only covered in part. The caller commits.
+    """
+    for bucket in sorted(set(buckets)):
+        end = bucket + timedelta(hours=1)
+        db.query(models.ItemPriceRollup)\
+            .filter(models.ItemPriceRollup.item_id.in_(item_pks), models.ItemPriceRollup.bucket_start == bucket)\
+            .delete(synchronize_session=False)
+        fold_history(db, db.query(models.ItemPriceHistory).filter(
+            realm_filter(), models.ItemPriceHistory.item_id.in_(item_pks),
+            models.ItemPriceHistory.timestamp >= bucket, models.ItemPriceHistory.timestamp < end
+        ))
+        measured = dict(db.query(models.ItemSellThrough.item_id, func.sum(models.ItemSellThrough.sold_units))
+                        .filter(models.ItemSellThrough.item_id.in_(item_pks),
+                                models.ItemSellThrough.interval_end >= bucket, models.ItemSellThrough.interval_end < end)
+                        .group_by(models.ItemSellThrough.item_id).all())
+        for row in db.query(models.ItemPriceRollup).filter(models.ItemPriceRollup.item_id.in_(list(measured)),
+                                                           models.ItemPriceRollup.bucket_start == bucket):
+            row.measured_sold_units = measured[row.item_id]
+    db.flush()
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        print("Rebuilding hourly rollups from item_price_history...")
+        rebuild_from_history(session)
+        print(f"Done. {session.query(models.ItemPriceRollup).count()} rollup rows.")
+    finally:
+        session.close()
@@ -0,0 +1,294 @@
+"""
+scheduler.py
+Background job scheduler.
+Every job runs in its own asyncio task on its own schedule: a fixed interval (optionally
+aligned to wall-clock multiples of the interval) or a cron expression in server local time,
+plus random jitter. A job never overlaps with itself, runs with a timeout, and its last run
+and next due time are stored in scheduler_jobs, so runs missed while the server was down are
+either caught up once on startup or skipped, per job.
+
+Blocking (def) jobs run in a worker thread; a thread cannot be killed, so after a timeout the
+job stays marked as running until the thread returns and due runs are skipped meanwhile.
+The scheduler runs in the worker process (worker.py); other processes read the stored state.
+"""
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from database import SessionLocal
+import models
+
+CATCH_UP_POLICIES = ("once", "skip")
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6)) # minute hour day-of-month month day-of-week (0 = Sunday)
+
+
+class CronSchedule:
+    """ Five-field cron expression supporting '*', lists, ranges and steps (e.g. '*/15 4-6 * * 1,3'). """
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.fields = [self._parse(part, low, high) for part, (low, high) in zip(parts, CRON_FIELDS)]
+        # Like cron: if both day fields are restricted, a day matching either of them runs
+        self.dom_any = parts[2] == "*"
+        self.dow_any = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part, low, high):
+        values = set()
+        for item in part.split(","):
+            step = 1
+            if "/" in item:
+                item, step = item.split("/")
+                step = int(step)
+            if item == "*":
+                start, end = low, high
+            elif "-" in item:
+                start, end = (int(v) for v in item.split("-"))
+            else:
+                start = end = int(item)
+            if high == 6: # Day of week: 7 is Sunday as well
+                values.update(v % 7 for v in range(start, end + 1, step))
+            else:
+                values.update(range(start, end + 1, step))
+        if not values or min(values) < low or max(values) > high:
+            raise ValueError(f"Cron field {part!r} out of range {low}-{high}")
+        return sorted(values)
+
+    def _day_matches(self, day):
+        minutes, hours, doms, months, dows = self.fields
+        if day.month not in months:
+            return False
+        dom = day.day in doms
+        dow = (day.weekday() + 1) % 7 in dows
+        if self.dom_any:
+            return dow
+        if self.dow_any:
+            return dom
+        return dom or dow
+
+    def next_after(self, ts):
+        """ Epoch seconds of the first matching minute after `ts` (server local time). """
+        minutes, hours = self.fields[0], self.fields[1]
+        start = datetime.fromtimestamp(ts).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.replace(hour=0, minute=0)
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in hours:
+                    for minute in minutes:
+                        candidate = day.replace(hour=hour, minute=minute)
+                        if candidate >= start:
+                            return candidate.timestamp()
+            day += timedelta(days=1)
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+    def __str__(self):
+        return f"cron {self.expression}"
+
+
+class IntervalSchedule:
+    """ Every `seconds`; with align=True at wall-clock multiples of the interval plus `offset`. """
+
+    def __init__(self, seconds, align=False, offset=0):
+        self.seconds = seconds
+        self.align = align
+        self.offset = offset
+
+    def next_after(self, ts):
+        if self.align:
+            return ((ts - self.offset) // self.seconds + 1) * self.seconds + self.offset
+        return ts + self.seconds
+
+    def __str__(self):
+        if not self.align:
+            return f"every {self.seconds}s"
+        return f"every {self.seconds}s aligned" + (f" (+{self.offset}s)" if self.offset else "")
+
+
+class Job:
+    def __init__(self, name, func, interval=None, cron=None, schedule=None, align=False, offset=0, jitter=0, timeout=None,
+                 catch_up="once", run_at_startup=False):
+        if sum(option is not None for option in (interval, cron, schedule)) != 1:
+            raise ValueError(f"Job {name} needs exactly one of interval, cron or schedule")
+        if catch_up not in CATCH_UP_POLICIES:
+            raise ValueError(f"Unknown catch-up policy {catch_up!r}")
+        self.name = name
+        self.func = func
+        # A custom schedule only needs next_after(ts); with after_run = True the next run is
+        # planned from the end of the previous one instead of its start
+        self.schedule = schedule or (CronSchedule(cron) if cron else IntervalSchedule(interval, align, offset))
+        self.jitter = jitter
+        self.timeout = timeout
+        self.catch_up = catch_up
+        self.run_at_startup = run_at_startup
+        self.running = False
+        self.next_run = None # Epoch seconds, including jitter; None while an after_run job runs
+        self.wakeup = None # asyncio.Event set when next_run moves
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs = {}
+        self._tasks = []
+
+    def add_job(self, name, func, **options):
+        """ Registers a job; see Job for the options. Jobs added after start() are not run. """
+        job = Job(name, func, **options)
+        self.jobs[name] = job
+        return job
+
+    # --- Persistence ---
+
+    def _load_state(self, db, name):
+        state = db.query(models.SchedulerJob).filter(models.SchedulerJob.name == name).first()
+        if state is None:
+            state = models.SchedulerJob(name=name, run_count=0, failure_count=0, skipped_count=0)
+            db.add(state)
+        return state
+
+    def _save(self, name, **fields):
+        db = SessionLocal()
+        try:
+            state = self._load_state(db, name)
+            for key, value in fields.items():
+                if key.endswith("_count") and value == "+1":
+                    value = (getattr(state, key) or 0) + 1
+                setattr(state, key, value)
+            db.commit()
+        except Exception as e:
+            print(f"Scheduler: could not store the state of {name}: {e}")
+        finally:
+            db.close()
+
+    # --- Scheduling ---
+
+    def _first_run(self, job, now):
+        db = SessionLocal()
+        try:
+            state = db.query(models.SchedulerJob).filter(models.SchedulerJob.name == job.name).first()
+            due = None
+            if state is not None and state.next_run_at is not None:
+                due = _epoch(state.next_run_at)
+        finally:
+            db.close()
+        if due is not None and due > now:
+            # Resume the schedule of the previous server run, unless the job now runs more often
+            return min(due, self._with_jitter(job, job.schedule.next_after(now)))
+        if due is not None and job.catch_up == "once":
+            print(f"Scheduler: {job.name} missed its run at {datetime.fromtimestamp(due):%Y-%m-%d %H:%M}, catching up.")
+            return now
+        if due is None and job.run_at_startup:
+            return now
+        return self._with_jitter(job, job.schedule.next_after(now))
+
+    def _with_jitter(self, job, ts):
+        return ts + random.uniform(0, job.jitter) if job.jitter else ts
+
+    async def _loop(self, job):
+        job.wakeup = asyncio.Event()
+        job.next_run = self._first_run(job, time.time())
+        self._save(job.name, schedule=str(job.schedule), next_run_at=_utc(job.next_run))
+        while True:
+            delay = job.next_run - time.time() if job.next_run is not None else None
+            if delay is None or delay > 0:
+                try:
+                    await asyncio.wait_for(job.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                job.wakeup.clear()
+                continue # A finished after_run job may have moved next_run
+            started = time.time()
+            if getattr(job.schedule, "after_run", False):
+                job.next_run = None
+            else:
+                # Planned from the start, not the end of the run, so slow runs do not shift the schedule
+                job.next_run = self._with_jitter(job, job.schedule.next_after(started))
+            if job.running:
+                print(f"Scheduler: {job.name} is still running, skipping this run.")
+                self._save(job.name, skipped_count="+1", next_run_at=_utc(job.next_run))
+                continue
+            asyncio.create_task(self._run(job, started))
+
+    async def _run(self, job, started):
+        """ Runs a job with its timeout and records the outcome; returns (status, error). """
+        job.running = True
+        self._save(job.name, last_run_at=_utc(started), last_status="running", next_run_at=_utc(job.next_run))
+        status, error = "ok", None
+        worker = None
+        try:
+            if asyncio.iscoroutinefunction(job.func):
+                await asyncio.wait_for(job.func(), job.timeout)
+            else:
+                worker = asyncio.ensure_future(asyncio.to_thread(job.func))
+                await asyncio.wait_for(asyncio.shield(worker), job.timeout)
+        except asyncio.TimeoutError:
+            status, error = "timeout", f"Did not finish within {job.timeout}s"
+            print(f"Scheduler: {job.name} timed out after {job.timeout}s.")
+        except Exception as e:
+            status, error = "failed", str(e)
+            print(f"Scheduler: {job.name} failed: {e}")
+        duration = time.time() - started
+        self._save(job.name, last_finished_at=_utc(time.time()), last_duration=duration, last_status=status,
+                   last_error=error, run_count="+1", **({"failure_count": "+1"} if status != "ok" else {}))
+        if worker is not None and not worker.done():
+            # The thread keeps going; the job counts as running until it returns
+            try:
+                await worker
+            except Exception:
+                pass
+        job.running = False
+        if getattr(job.schedule, "after_run", False) and job.wakeup is not None:
+            job.next_run = self._with_jitter(job, job.schedule.next_after(time.time()))
+            self._save(job.name, next_run_at=_utc(job.next_run))
+            job.wakeup.set()
+        return status, error
+
+    def start(self):
+        """ Starts one task per registered job on the running event loop. """
+        for job in self.jobs.values():
+            print(f"Scheduler: {job.name} {job.schedule}")
+            self._tasks.append(asyncio.create_task(self._loop(job)))
+
+    def stop(self):
+        """ Cancels the job loops (runs in progress finish on their own). """
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def execute(self, name):
+        """ Runs a job now, outside its schedule (queued runs). Returns (status, error); "skipped" if it is already running. """
+        job = self.jobs[name]
+        if job.running:
+            return "skipped", "Already running"
+        return await self._run(job, time.time())
+
+
+def status(db):
+    """ Job states as stored by the worker, so any process can report them. """
+    return [{
+        "name": state.name,
+        "schedule": state.schedule,
+        "running": state.last_status == "running",
+        "last_run_at": state.last_run_at,
+        "last_finished_at": state.last_finished_at,
+        "last_duration": round(state.last_duration, 3) if state.last_duration is not None else None,
+        "last_status": state.last_status,
+        "last_error": state.last_error,
+        "next_run_at": state.next_run_at,
+        "run_count": state.run_count or 0,
+        "failure_count": state.failure_count or 0,
+        "skipped_count": state.skipped_count or 0
+    } for state in db.query(models.SchedulerJob).order_by(models.SchedulerJob.id.asc()).all()]
+
+
+def _utc(ts):
+    return datetime.utcfromtimestamp(ts) if ts is not None else None
+
+
+def _epoch(utc_datetime):
+    return (utc_datetime - datetime(1970, 1, 1)).total_seconds()
+
+
+scheduler = Scheduler()
@@ -0,0 +1,171 @@
+"""
+seasonality.py
+Hour-of-week seasonality of the tracked item prices and the WoW token.
+Every series keeps 168 accumulators (Monday 00:00 UTC = bucket 0) with the mean and variance
+of the price and the average units sold per hour, folded in on each ingestion with weighted
+Welford updates. Older weeks fade out with a half-life, so the profile follows patch cycles
+instead of averaging over the whole history. Reading a profile is a lookup of 168 rows.
+
+Series keys are the same as for the indicators: 'item:<blizzard item id>' and 'token:<region>'.
+Run this module directly to (re)compute all profiles from the existing history.
+"""
+import math
+from datetime import datetime
+import models
+from analytics import realm_filter
+from indicators import epoch, item_series, token_series
+
+HOURS_PER_WEEK = 168
+HALF_LIFE_WEEKS = 8 # None disables the decay
+
+
+def hour_of_week(timestamp):
+    """ Bucket of a naive UTC datetime or epoch seconds. """
+    if isinstance(timestamp, int):
+        timestamp = datetime.utcfromtimestamp(timestamp)
+    return timestamp.weekday() * 24 + timestamp.hour
+
+
+def decay_factor(elapsed):
+    """ Weight left to the existing observations of a bucket after `elapsed` seconds. """
+    if not HALF_LIFE_WEEKS or elapsed <= 0:
+        return 1.0
+    return 0.5 ** (elapsed / (HALF_LIFE_WEEKS * 7 * 86400))
+
+
+def fold(row, ts, price=None, sold_per_hour=None):
+    """ Folds one observation into a SeriesSeasonality row (weighted Welford update). """
+    decay = decay_factor(ts - row.last_updated) if row.last_updated else 1.0
+    if decay < 1:
+        row.price_weight *= decay
+        row.price_m2 *= decay
+        row.sold_weight *= decay
+    if price is not None:
+        row.price_weight += 1
+        delta = price - row.price_mean
+        row.price_mean += delta / row.price_weight
+        row.price_m2 += delta * (price - row.price_mean)
+    if sold_per_hour is not None:
+        row.sold_weight += 1
+        row.sold_mean += (sold_per_hour - row.sold_mean) / row.sold_weight
+    row.last_updated = max(ts, row.last_updated or 0)
+
+
+def new_row(series, bucket):
+    return models.SeriesSeasonality(series=series, hour_of_week=bucket, price_weight=0, price_mean=0, price_m2=0,
+                                    sold_weight=0, sold_mean=0, last_updated=0)
+
+
+def record(db, timestamp, samples):
+    """
+    Folds one ingestion run into the profiles. `samples` maps a series key to
+    (price or None, sold units per hour or None). The caller commits.
+    """
+    if not samples:
+        return
+    ts = epoch(timestamp)
+    bucket = hour_of_week(ts)
+    rows = {
+        row.series: row for row in db.query(models.SeriesSeasonality)
+        .filter(models.SeriesSeasonality.hour_of_week == bucket, models.SeriesSeasonality.series.in_(list(samples)))
+    }
+    for series, (price, sold_per_hour) in samples.items():
+        row = rows.get(series)
+        if row is None:
+            row = new_row(series, bucket)
+            db.add(row)
+        fold(row, ts, price, sold_per_hour)
+    # Flush so a later run in the same transaction finds the new rows
+    db.flush()
+
+
+def sold_per_hour(sell_through_row):
+    """ Units sold per hour over a sell-through interval. """
+    hours = (sell_through_row.interval_end - sell_through_row.interval_start).total_seconds() / 3600
+    return sell_through_row.sold_units / hours if hours > 0 else None
+
+
+def profile(db, series):
+    """ Returns the 168 buckets of a series as dicts; buckets without data have None values. """
+    rows = {row.hour_of_week: row for row in db.query(models.SeriesSeasonality).filter(models.SeriesSeasonality.series == series)}
+    buckets = []
+    for bucket in range(HOURS_PER_WEEK):
+        row = rows.get(bucket)
+        has_price = row is not None and row.price_weight > 0
+        buckets.append({
+            "hour_of_week": bucket,
+            "weekday": bucket // 24,
+            "hour": bucket % 24,
+            "weight": round(row.price_weight, 3) if has_price else 0,
+            "mean": row.price_mean if has_price else None,
+            "std": math.sqrt(max(row.price_m2, 0) / row.price_weight) if has_price else None,
+            "sold_per_hour": row.sold_mean if row is not None and row.sold_weight > 0 else None
+        })
+    priced = [b for b in buckets if b["mean"] is not None]
+    return {
+        "half_life_weeks": HALF_LIFE_WEEKS,
+        "cheapest_hour": min(priced, key=lambda b: b["mean"])["hour_of_week"] if priced else None,
+        "most_expensive_hour": max(priced, key=lambda b: b["mean"])["hour_of_week"] if priced else None,
+        "buckets": buckets
+    }
+
+
+def rebuild_series(db, series_keys=None):
+    """
+    Recomputes the profiles of `series_keys` (all if None) from the raw history in time order.
+    Needed after a replay, since folded observations cannot be taken out again.
+    """
+    query = db.query(models.SeriesSeasonality)
+    if series_keys is not None:
+        query = query.filter(models.SeriesSeasonality.series.in_(list(series_keys)))
+    query.delete(synchronize_session=False)
+    wanted = set(series_keys) if series_keys is not None else None
+    item_ids = dict(db.query(models.TrackedItem.id, models.TrackedItem.item_id).all())
+    rows = {}
+
+    def observe(series, timestamp, price=None, sold=None):
+        if wanted is not None and series not in wanted:
+            return
+        ts = epoch(timestamp)
+        key = (series, hour_of_week(ts))
+        row = rows.get(key)
+        if row is None:
+            row = rows[key] = new_row(*key)
+        fold(row, ts, price, sold)
+
+    # Prices and sales of an item are merged in time order, since the decay depends on it
+    events = []
+    history = db.query(models.ItemPriceHistory.item_id, models.ItemPriceHistory.timestamp, models.ItemPriceHistory.buyout).filter(realm_filter())
+    for pk, timestamp, buyout in history.yield_per(5000):
+        if pk in item_ids:
+            events.append((timestamp, 0, item_series(item_ids[pk]), buyout))
+    for sale in db.query(models.ItemSellThrough).yield_per(5000):
+        if sale.item_id in item_ids:
+            events.append((sale.interval_end, 1, item_series(item_ids[sale.item_id]), sold_per_hour(sale)))
+    events.sort(key=lambda e: (e[0], e[1]))
+    for timestamp, kind, series, value in events:
+        if kind == 0:
+            observe(series, timestamp, price=value)
+        elif value is not None:
+            observe(series, timestamp, sold=value)
+
+    tokens = db.query(models.WowTokenHistory.region, models.WowTokenHistory.last_updated_timestamp, models.WowTokenHistory.price)\
+        .order_by(models.WowTokenHistory.last_updated_timestamp.asc())
+    for region, ts, price in tokens.yield_per(5000):
+        observe(token_series(region or "eu"), ts, price=price)
+
+    db.add_all(rows.values())
+    db.commit()
+    return len(rows)
+
+
+if __name__ == "__main__":
+    from database import SessionLocal, engine
+    models.Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        print("Recomputing hour-of-week profiles from the price history...")
+        count = rebuild_series(session)
+        print(f"Done. {count} seasonality buckets.")
+    finally:
+        session.close()
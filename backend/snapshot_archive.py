@@ -0,0 +1,217 @@
+"""
+snapshot_archive.py
+Compressed, columnar archive of raw auction snapshots.
+Each snapshot is written to one file per auction house and publish time, holding the
+auction id, item id, unit price, quantity, time_left and variant key columns of an AuctionFrame;
+the header describes each variant key (archives written before variants have none).
+Archives can be read back column by column straight from a memory map without building
+any per-auction Python objects, so history can be recomputed when analytics logic changes.
+
+File layout:
+    8 bytes   magic "RGSNAP01"
+    4 bytes   header length (little endian)
+    N bytes   JSON header (source, timestamps, codec, column directory)
+    ...       column payloads, each compressed on its own
+"""
+import json
+import mmap
+import os
+import struct
+import zlib
+from datetime import datetime, timezone
+import numpy as np
+from market_index import AuctionFrame
+
+try:
+    import zstandard
+except ImportError: # zlib is always available as a fallback codec
+    zstandard = None
+
+MAGIC = b"RGSNAP01"
+FILE_SUFFIX = ".rgsnap"
+
+# (AuctionFrame attribute, stored dtype, delta encoded)
+COLUMNS = [
+    ("auction_ids", "<i8", True),
+    ("item_ids", "<i4", False),
+    ("prices", "<i8", False),
+    ("quantities", "<i4", False),
+    ("time_left", "<i1", False),
+    ("variants", "<i8", False),
+]
+
+
+def default_codec():
+    return "zstd" if zstandard else "zlib"
+
+
+def _compress(codec, data):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=9).compress(data)
+    if codec == "zlib":
+        return zlib.compress(data, 6)
+    return data
+
+
+def _decompress(codec, data, raw_length):
+    if codec == "zstd":
+        if not zstandard:
+            raise RuntimeError("Archive is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_length)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    return data
+
+
+def _encode_column(values, dtype, delta, codec):
+    values = values.astype(dtype)
+    if codec == "none":
+        return values.tobytes()
+    if delta and len(values):
+        values = np.diff(values, prepend=values.dtype.type(0))
+    # Byte shuffle: group the n-th byte of every value together, which makes
+    # slowly varying integers compress far better.
+    shuffled = values.view(np.uint8).reshape(-1, values.dtype.itemsize).T
+    return _compress(codec, shuffled.tobytes())
+
+
+def _decode_column(buffer, dtype, delta, codec, rows):
+    dtype = np.dtype(dtype)
+    if codec == "none":
+        return np.frombuffer(buffer, dtype=dtype, count=rows)
+    raw = _decompress(codec, buffer, rows * dtype.itemsize)
+    values = np.frombuffer(raw, dtype=np.uint8).reshape(dtype.itemsize, rows).T.copy().view(dtype).reshape(rows)
+    if delta:
+        values = np.cumsum(values, dtype=dtype)
+    return values
+
+
+def archive_filename(source, published_at):
+    stamp = datetime.fromtimestamp(published_at, tz=timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    return f"{source.replace(':', '-')}_{stamp}{FILE_SUFFIX}"
+
+
+def write_archive(directory, source, frame, published_at=None, codec=None):
+    """
+    Writes `frame` to `directory` and returns the file path.
+    A snapshot that is already archived (same source and publish time) is not written again.
+    """
+    codec = codec or default_codec()
+    published_at = int(published_at if published_at is not None else frame.captured_at)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, archive_filename(source, published_at))
+    if os.path.exists(path):
+        return path
+
+    payloads = []
+    directory_entries = []
+    offset = 0
+    for name, dtype, delta in COLUMNS:
+        payload = _encode_column(getattr(frame, name), dtype, delta, codec)
+        directory_entries.append({"name": name, "dtype": dtype, "delta": delta, "offset": offset, "length": len(payload)})
+        payloads.append(payload)
+        offset += len(payload)
+
+    header = json.dumps({
+        "source": source,
+        "published_at": published_at,
+        "captured_at": frame.captured_at,
+        "rows": len(frame),
+        "codec": codec,
+        "columns": directory_entries,
+        "variants": {str(key): info for key, info in frame.variant_info.items()}
+    }).encode("utf-8")
+
+    # Write to a temporary name first so readers never see a half-written archive
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for payload in payloads:
+            f.write(payload)
+    os.replace(tmp_path, path)
+    return path
+
+
+class ArchivedSnapshot:
+    """
+    Read-only view of one archive file. The file is memory-mapped and columns are only
+    decoded when they are accessed; uncompressed archives are served without any copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIC)] != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"{path} is not a snapshot archive")
+        header_length = struct.unpack_from("<I", self._mmap, len(MAGIC))[0]
+        header_start = len(MAGIC) + 4
+        self.header = json.loads(self._mmap[header_start:header_start + header_length])
+        self._data_start = header_start + header_length
+        self._columns = {c["name"]: c for c in self.header["columns"]}
+
+    @property
+    def source(self):
+        return self.header["source"]
+
+    @property
+    def published_at(self):
+        return self.header["published_at"]
+
+    @property
+    def rows(self):
+        return self.header["rows"]
+
+    def column(self, name):
+        entry = self._columns[name]
+        start = self._data_start + entry["offset"]
+        buffer = memoryview(self._mmap)[start:start + entry["length"]]
+        return _decode_column(buffer, entry["dtype"], entry["delta"], self.header["codec"], self.rows)
+
+    def to_frame(self):
+        """ Rebuilds the AuctionFrame, using the publish time as its capture time. """
+        return AuctionFrame(
+            self.column("auction_ids").astype(np.int64),
+            self.column("item_ids").astype(np.int64),
+            self.column("prices").astype(np.int64),
+            self.column("quantities").astype(np.int64),
+            self.column("time_left").astype(np.int8),
+            captured_at=self.published_at,
+            variants=self.column("variants").astype(np.int64) if "variants" in self._columns else None,
+            variant_info={int(key): tuple(info) for key, info in self.header.get("variants", {}).items()}
+        )
+
+    def close(self):
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_archive(path):
+    return ArchivedSnapshot(path)
+
+
+def parse_archive_filename(path):
+    """ Returns (file source prefix, publish time in epoch seconds) encoded in an archive file name. """
+    name = os.path.basename(path)[:-len(FILE_SUFFIX)]
+    prefix, stamp = name.rsplit("_", 1)
+    published = datetime.strptime(stamp, "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+    return prefix, int(published.timestamp())
+
+
+def list_archives(directory, source=None):
+    """ Returns the archive paths in `directory`, oldest publish time first. """
+    if not os.path.isdir(directory):
+        return []
+    prefix = source.replace(':', '-') + "_" if source else ""
+    files = [f for f in os.listdir(directory) if f.endswith(FILE_SUFFIX) and f.startswith(prefix)]
+    # File names end in a sortable UTC timestamp
+    files.sort(key=lambda f: (f.rsplit("_", 1)[-1], f))
+    return [os.path.join(directory, f) for f in files]
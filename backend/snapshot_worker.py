@@ -0,0 +1,64 @@
+"""
+snapshot_worker.py
+Parses downloaded auction snapshots in a worker process.
+Decoding a commodities snapshot (JSON with hundreds of thousands of auctions) and turning it
+into arrays is pure Python CPU work; done in the API process it holds the GIL for seconds and
+every request waits. The main process spools the download to a file, the worker parses it and
+returns only the columnar AuctionFrame (a few numpy arrays), which is cheap to send back.
+With several tracked realms their snapshots are parsed side by side in a small pool.
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from market_index import AuctionFrame
+
+PARSE_WORKERS = min(4, os.cpu_count() or 1)
+
+_pool = None
+_lock = threading.Lock()
+
+
+def parse_snapshot_file(path, captured_at=None):
+    """ Worker: parses a spooled snapshot into an AuctionFrame (None if it holds no auctions). """
+    with open(path, "rb") as f:
+        data = json.loads(f.read())
+    if not isinstance(data, dict) or "auctions" not in data:
+        return None
+    return AuctionFrame.from_auctions(data["auctions"], captured_at)
+
+
+def get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+        return _pool
+
+
+def shutdown():
+    global _pool
+    with _lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+async def parse_snapshot(path, captured_at=None):
+    """ Parses a spooled snapshot in the worker process and deletes the file afterwards. """
+    global _pool
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(get_pool(), parse_snapshot_file, path, captured_at)
+    except BrokenProcessPool:
+        # The worker died (e.g. out of memory); start a fresh one for the next snapshot
+        with _lock:
+            _pool = None
+        raise
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
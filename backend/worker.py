@@ -0,0 +1,204 @@
+"""
+worker.py
+Background worker process: owns all background jobs (prices, character sync, backups, ...).
+The API processes only serve requests and enqueue work ("sync now", "update prices now") in
+the job_queue table, so uvicorn can run with --reload or several workers without starting a
+scheduler per process and ingesting the same data twice.
+
+Only one worker is active at a time: it holds the "scheduler" lease and renews it every
+HEARTBEAT_SECONDS. It runs the scheduled jobs and claims queued jobs, renewing the lease of
+each queued job while it runs. A second worker stands by and takes over once the lease of the
+first one runs out; jobs the lost worker had claimed are queued again (see job_queue.py).
+
+New auction snapshots reach the API processes through MARKET_STATE_DIR (see market_state.py).
+With EMBEDDED_WORKER=true the API process runs the worker itself instead (single-process setups).
+
+Usage:
+    python worker.py
+"""
+import asyncio
+import os
+import socket
+import time
+import job_queue
+import backup
+import correlation
+import character_sync
+from database import SessionLocal
+from config import config
+from scheduler import scheduler
+from publish_cadence import publish_tracker, AdaptiveSchedule
+from liquidity_tracker import liquidity_tracker
+from crafting_graph import crafting_graph
+import main
+
+LEADER_LEASE = "scheduler"
+POLL_SECONDS = 2 # How often the active worker looks for queued jobs
+
+
+async def run_token_update():
+    """ Fetches the token price of every tracked region concurrently, each with its own session. """
+    async def update(region):
+        db = SessionLocal()
+        try:
+            await main.update_token_price(db, region)
+        finally:
+            db.close()
+    await asyncio.gather(*(update(region) for region in config.regions()))
+
+async def run_commodity_update():
+    db = SessionLocal()
+    try:
+        # Recipes are edited through the API process; reload them for the margin alerts
+        liquidity_tracker.invalidate_recipes()
+        crafting_graph.invalidate()
+        await main.update_commodity_prices(db)
+        # Served by GET /api/market/polling in the API processes
+        job_queue.save_state(db, "publish_cadence", publish_tracker.metrics())
+    finally:
+        db.close()
+
+def run_task_reset():
+    db = SessionLocal()
+    try:
+        main.check_and_reset_tasks(db)
+    finally:
+        db.close()
+
+def run_character_sync():
+    """ Syncs the characters of every account with a stored, unexpired token (see character_sync.py). """
+    print("Running automatic background character sync...")
+    character_sync.sync_accounts(main.get_client())
+
+def run_backup():
+    # Copying a small DB is fast enough to run synchronously in the job thread
+    print("Starting daily backup...")
+    if not backup.create_backup():
+        raise RuntimeError("Backup failed")
+
+def run_correlations():
+    db = SessionLocal()
+    try:
+        correlation.ensure_computed(db)
+    finally:
+        db.close()
+
+def register_jobs():
+    """
+    Registers the background jobs. Each job runs on its own schedule, so a slow stage does not
+    delay the others (see scheduler.py). The names are the job kinds the API can enqueue.
+    """
+    if scheduler.jobs:
+        return
+    scheduler.add_job("task_reset", run_task_reset, interval=900, run_at_startup=True, timeout=60)
+    scheduler.add_job("token_price", run_token_update, interval=1800, align=True, jitter=30, timeout=120, run_at_startup=True)
+    # Polled around Blizzard's predicted snapshot publish times (see publish_cadence.py)
+    scheduler.add_job("commodity_prices", run_commodity_update, schedule=AdaptiveSchedule(), timeout=900, run_at_startup=True)
+    scheduler.add_job("character_sync", run_character_sync, interval=1800, jitter=120, timeout=1200, run_at_startup=True)
+    # 4 AM server time; a backup missed while the worker was down runs once on the next start
+    scheduler.add_job("backup", run_backup, cron="0 4 * * *", catch_up="once", timeout=600)
+    # Hourly, so the daily correlations are ready shortly after midnight UTC (a no-op once computed)
+    scheduler.add_job("correlations", run_correlations, interval=3600, align=True, offset=900, catch_up="skip", timeout=600)
+
+
+class Worker:
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.leader = False
+        self.tasks = {} # queued job id -> task
+
+    def _renew_leadership(self):
+        db = SessionLocal()
+        try:
+            return job_queue.acquire_lease(db, LEADER_LEASE, self.worker_id)
+        finally:
+            db.close()
+
+    def _claim(self):
+        """ Claims the queued jobs whose kind is not running at the moment. """
+        kinds = [name for name, job in scheduler.jobs.items() if not job.running]
+        claimed = []
+        db = SessionLocal()
+        try:
+            requeued = job_queue.recover_expired(db)
+            if requeued:
+                print(f"Worker: requeued {requeued} job(s) of a lost worker.")
+            while kinds:
+                job = job_queue.claim(db, self.worker_id, kinds)
+                if job is None:
+                    break
+                claimed.append((job.id, job.kind))
+                kinds.remove(job.kind)
+        finally:
+            db.close()
+        return claimed
+
+    async def _heartbeat(self, job_id):
+        while True:
+            await asyncio.sleep(job_queue.HEARTBEAT_SECONDS)
+            db = SessionLocal()
+            try:
+                if not job_queue.heartbeat(db, job_id, self.worker_id):
+                    print(f"Worker: lost the lease of job {job_id}.")
+                    return
+            finally:
+                db.close()
+
+    async def _process(self, job_id, kind):
+        print(f"Worker: running queued job {job_id} ({kind}).")
+        heartbeat = asyncio.create_task(self._heartbeat(job_id))
+        try:
+            status, error = await scheduler.execute(kind)
+        except Exception as e:
+            status, error = "failed", str(e)
+        finally:
+            heartbeat.cancel()
+            self.tasks.pop(job_id, None)
+        db = SessionLocal()
+        try:
+            job_queue.finish(db, job_id, self.worker_id, {"ok": "done", "skipped": "skipped"}.get(status, "failed"), error)
+        finally:
+            db.close()
+
+    async def run(self):
+        register_jobs()
+        print(f"Worker {self.worker_id} started.")
+        renewed_at = float("-inf")
+        try:
+            while True:
+                try:
+                    if time.monotonic() - renewed_at >= job_queue.HEARTBEAT_SECONDS:
+                        renewed_at = time.monotonic()
+                        leader = self._renew_leadership()
+                        if leader and not self.leader:
+                            print("Worker: acquired the scheduler lease, starting the jobs.")
+                            scheduler.start()
+                        elif self.leader and not leader:
+                            print("Worker: lost the scheduler lease, standing by.")
+                            scheduler.stop()
+                        self.leader = leader
+                    if self.leader:
+                        for job_id, kind in self._claim():
+                            self.tasks[job_id] = asyncio.create_task(self._process(job_id, kind))
+                except Exception as e:
+                    # e.g. the database is locked by a long write; retried on the next poll
+                    print(f"Worker: {e}")
+                await asyncio.sleep(POLL_SECONDS)
+        finally:
+            scheduler.stop()
+            if self.leader:
+                db = SessionLocal()
+                try:
+                    job_queue.release_lease(db, LEADER_LEASE, self.worker_id)
+                finally:
+                    db.close()
+                self.leader = False
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(Worker().run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        main.snapshot_worker.shutdown()
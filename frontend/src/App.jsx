@@ -9,8 +9,8 @@
  * [2026-02-25T14:15:00] STATUS: WORKING (v.0.5.2)
  * - OAuth Redirect logic verified
  * - Polling waits correctly up to 90s for character background sync to finish
- * - CharacterList properly parses and renders equipment JSON and item level
- * - CharacterList properly parses and renders profession JSON and skill points
+ * - CharacterList loads and renders equipment and item level on expand
+ * - CharacterList loads and renders professions and skill points on expand
  * - Removed deprecated playtime rendering
  * DO NOT BREAK THIS BASE FUNCTIONALITY.
  */
@@ -36,6 +36,9 @@ function App() {
   const [characterData, setCharacterData] = useState(null);
   const [accountGoldHistory, setAccountGoldHistory] = useState([]);
   const [charLoading, setCharLoading] = useState(false);
+  const [accounts, setAccounts] = useState([]);
+  // Battle.net account of the per-account views; '' shows all accounts together
+  const [selectedAccount, setSelectedAccount] = useState('');
   const [activeTab, setActiveTab] = useState('dashboard');
   const [isSyncing, setIsSyncing] = useState(false);
 
@@ -73,7 +76,8 @@ function App() {
     setCharLoading(true);
     try {
       const apiUrl = getApiUrl();
-      const res = await fetch(`${apiUrl}/api/user/characters`);
+      const query = selectedAccount ? `?account=${selectedAccount}` : '';
+      const res = await fetch(`${apiUrl}/api/user/characters${query}`);
       if (res.ok) {
         const json = await res.json();
         setCharacterData(json);
@@ -86,12 +90,13 @@ function App() {
     } finally {
       setCharLoading(false);
     }
-  }, []);
+  }, [selectedAccount]);
 
   const fetchAccountGoldHistory = React.useCallback(async () => {
     try {
       const apiUrl = getApiUrl();
-      const res = await fetch(`${apiUrl}/api/user/gold-history`);
+      const query = selectedAccount ? `?account=${selectedAccount}` : '';
+      const res = await fetch(`${apiUrl}/api/user/gold-history${query}`);
       if (res.ok) {
         const json = await res.json();
         setAccountGoldHistory(json.history || []);
@@ -99,8 +104,31 @@ function App() {
     } catch (e) {
       console.error("Failed to fetch gold history", e);
     }
+  }, [selectedAccount]);
+
+  const fetchAccounts = React.useCallback(async () => {
+    try {
+      const apiUrl = getApiUrl();
+      const res = await fetch(`${apiUrl}/api/user/accounts`);
+      if (res.ok) {
+        const json = await res.json();
+        setAccounts(json.accounts || []);
+      }
+    } catch (e) {
+      console.error("Failed to fetch accounts", e);
+    }
   }, []);
 
+  const handleAccountSync = async (accountId) => {
+    try {
+      await fetch(`${getApiUrl()}/api/user/accounts/${accountId}/sync`, { method: 'POST' });
+      setIsSyncing(true);
+      fetchAccounts();
+    } catch (e) {
+      console.error("Failed to request account sync", e);
+    }
+  };
+
   const handleLogin = () => {
     console.log("LOGIN BUTTON CLICKED. Redirecting...", activeTab);
     // Force absolute URL to ensure we hit the backend and not the frontend router
@@ -112,7 +140,8 @@ function App() {
     fetchTokenData();
     fetchCharacterData();
     fetchAccountGoldHistory();
-  }, [fetchTokenData, fetchCharacterData, fetchAccountGoldHistory]);
+    fetchAccounts();
+  }, [fetchTokenData, fetchCharacterData, fetchAccountGoldHistory, fetchAccounts]);
 
   useEffect(() => {
     const interval = setInterval(fetchTokenData, 60000);
@@ -144,6 +173,7 @@ function App() {
       pollInterval = setInterval(() => {
         fetchCharacterData();
         fetchAccountGoldHistory();
+        fetchAccounts();
       }, 3000);
 
       // Stop polling after 90 seconds to ensure all characters are fetched
@@ -156,12 +186,25 @@ function App() {
       clearInterval(pollInterval);
       clearTimeout(timeoutId);
     };
-  }, [isSyncing, fetchCharacterData, fetchAccountGoldHistory]);
+  }, [isSyncing, fetchCharacterData, fetchAccountGoldHistory, fetchAccounts]);
 
   // Sync state will stop naturally after 90s, no early bailout.
 
   const characters = characterData?.characters || [];
 
+  const accountSelector = accounts.length > 1 && (
+    <select
+      value={selectedAccount}
+      onChange={(e) => setSelectedAccount(e.target.value)}
+      className="bg-surface border border-white/5 rounded-lg px-2 py-1 text-xs text-secondary"
+    >
+      <option value="">Alle Accounts</option>
+      {accounts.map(a => (
+        <option key={a.account_id} value={a.account_id}>{a.battletag || `Account ${a.account_id}`}</option>
+      ))}
+    </select>
+  );
+
   return (
     <Layout activeTab={activeTab} onTabChange={setActiveTab} theme={theme} setTheme={setTheme}>
       {error && (
@@ -173,7 +216,8 @@ function App() {
       {activeTab === 'dashboard' && (
         <div className="space-y-6">
           {/* Last Sync Info */}
-          <div className="flex justify-end items-center text-xs text-secondary/50 px-2">
+          <div className="flex justify-end items-center gap-4 text-xs text-secondary/50 px-2">
+            {accountSelector}
             Zuletzt synchronisiert: {
               characters.length > 0
                 ? new Date(Math.max(...characters.map(c => new Date(c.last_updated).getTime()))).toLocaleString('de-DE')
@@ -212,9 +256,14 @@ function App() {
         </div>
       )}
 
+      {activeTab === 'characters' && accountSelector && (
+        <div className="flex justify-end px-2 mb-4">{accountSelector}</div>
+      )}
+
       {activeTab === 'characters' && (
         <CharacterList
           characters={characters}
+          apiUrl={getApiUrl()}
           loading={charLoading}
           onLogin={handleLogin}
         />
@@ -228,6 +277,8 @@ function App() {
         <Settings
           onLogin={handleLogin}
           characters={characters}
+          accounts={accounts}
+          onAccountSync={handleAccountSync}
           loading={charLoading || isSyncing}
           theme={theme}
           setTheme={setTheme}
@@ -3,8 +3,9 @@
  * 
  * Displays a formatted, scrollable grid of synced World of Warcraft characters.
  * Includes character-specific details such as realm, level, gold, and total playtime.
+ * Equipment and professions are loaded when a character is expanded.
  */
-import React, { useState } from 'react';
+import React, { useState, useEffect } from 'react';
 import { RefreshCw, Shield, ChevronDown, ChevronUp, AlertTriangle, Award } from 'lucide-react';
 
 const classHexColors = {
@@ -23,12 +24,38 @@ const classHexColors = {
     'Warrior': '#C69B6D', 'Krieger': '#C69B6D',
 };
 
-const CharacterList = ({ characters, loading, onSync, onLogin }) => {
+const CharacterList = ({ characters, loading, onSync, onLogin, apiUrl = '' }) => {
 
     const [expandedCharId, setExpandedCharId] = useState(null);
+    // Character id -> details (equipment and professions), fetched on first expand
+    const [details, setDetails] = useState({});
+
+    const loadDetails = async (id) => {
+        try {
+            const res = await fetch(`${apiUrl}/api/user/characters/${id}`);
+            if (res.ok) {
+                const json = await res.json();
+                setDetails(prev => ({ ...prev, [id]: json }));
+            }
+        } catch (e) {
+            console.error("Failed to fetch character details", e);
+        }
+    };
+
+    // A refreshed character list (e.g. after a sync) invalidates the loaded details
+    useEffect(() => {
+        setDetails({});
+        if (expandedCharId) {
+            loadDetails(expandedCharId);
+        }
+    }, [characters]);
 
     const toggleExpand = (id) => {
-        setExpandedCharId(expandedCharId === id ? null : id);
+        const expanding = expandedCharId !== id;
+        setExpandedCharId(expanding ? id : null);
+        if (expanding && !details[id]) {
+            loadDetails(id);
+        }
     };
 
     const getClassColor = (className) => {
@@ -204,24 +231,10 @@ const CharacterList = ({ characters, loading, onSync, onLogin }) => {
                         </thead>
                         <tbody className="divide-y divide-white/5">
                             {sortedCharacters.map((char) => {
-                                let equipment = [];
-                                try {
-                                    if (char.equipment) {
-                                        equipment = JSON.parse(char.equipment);
-                                    }
-                                } catch (e) {
-                                    console.error("Failed to parse equipment JSON", e);
-                                }
                                 const isExpanded = expandedCharId === char.id;
-
-                                let professions = [];
-                                try {
-                                    if (char.professions) {
-                                        professions = JSON.parse(char.professions);
-                                    }
-                                } catch (e) {
-                                    console.error("Failed to parse professions JSON", e);
-                                }
+                                const charDetails = details[char.id];
+                                const equipment = charDetails?.equipment || [];
+                                const professions = charDetails?.professions || [];
 
                                 const renderSlot = (slotType, slotLabel) => {
                                     const item = equipment.find(i => i.slot === slotType);
@@ -310,7 +323,13 @@ const CharacterList = ({ characters, loading, onSync, onLogin }) => {
                                         {isExpanded && (
                                             <tr className="bg-black/20">
                                                 <td colSpan="6" className="py-4 px-6 border-l-4 border-[#148eff]/50 text-left">
-
+                                                    {!charDetails ? (
+                                                        <div className="flex items-center gap-2 text-sm text-secondary/50 py-2">
+                                                            <RefreshCw size={14} className="animate-spin" />
+                                                            Lade Details...
+                                                        </div>
+                                                    ) : (
+                                                    <>
                                                     {/* Professions Section */}
                                                     <div className="mb-4">
                                                         <div className="mb-2 text-xs uppercase tracking-wider text-secondary font-medium">Berufe</div>
@@ -390,7 +409,8 @@ const CharacterList = ({ characters, loading, onSync, onLogin }) => {
                                                             </div>
                                                         )}
                                                     </div>
-
+                                                    </>
+                                                    )}
                                                 </td>
                                             </tr>
                                         )}
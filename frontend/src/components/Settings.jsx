@@ -7,7 +7,7 @@
 import React from 'react';
 import { Shield, RefreshCw, LogOut } from 'lucide-react';
 
-const Settings = ({ onLogin, characters, loading, theme = 'dark', setTheme = () => {} }) => {
+const Settings = ({ onLogin, characters, accounts = [], onAccountSync = () => {}, loading, theme = 'dark', setTheme = () => {} }) => {
     return (
         <div className="max-w-2xl mx-auto space-y-6">
             <div className="bg-surface border border-white/5 rounded-2xl p-6">
@@ -30,6 +30,41 @@ const Settings = ({ onLogin, characters, loading, theme = 'dark', setTheme = ()
                     </div>
                 </div>
 
+                {accounts.length > 0 && (
+                    <div className="space-y-2 mb-6">
+                        {accounts.map(a => (
+                            <div key={a.account_id} className="flex justify-between items-center p-3 bg-black/20 rounded-xl border border-white/5">
+                                <div>
+                                    <span className="text-white text-sm block">{a.battletag || `Account ${a.account_id}`}</span>
+                                    <span className="text-[10px] text-secondary/50">
+                                        {a.characters} Charaktere · {a.token_valid
+                                            ? (a.last_synced_at ? `Synchronisiert: ${new Date(a.last_synced_at + 'Z').toLocaleString('de-DE')}` : 'Noch nicht synchronisiert')
+                                            : 'Anmeldung abgelaufen'}
+                                    </span>
+                                </div>
+                                {a.token_valid ? (
+                                    <button
+                                        onClick={() => onAccountSync(a.account_id)}
+                                        disabled={a.sync_requested}
+                                        className="text-secondary hover:text-white disabled:opacity-30 disabled:cursor-not-allowed"
+                                        title="Jetzt synchronisieren"
+                                    >
+                                        <RefreshCw size={16} className={a.sync_requested ? "animate-spin" : ""} />
+                                    </button>
+                                ) : (
+                                    <button
+                                        onClick={onLogin}
+                                        className="text-xs text-accent hover:text-white"
+                                        title="Mit diesem Battle.net-Konto erneut anmelden"
+                                    >
+                                        Erneut anmelden
+                                    </button>
+                                )}
+                            </div>
+                        ))}
+                    </div>
+                )}
+
                 <div className="flex flex-col gap-3">
                     <button
                         onClick={onLogin}
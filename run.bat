@@ -9,6 +9,9 @@ set "PATH=C:\Program Files\Python311;C:\Program Files\Python311\Scripts;C:\Progr
 :: Start Backend
 start "RG Backend" cmd /k "cd backend && venv\Scripts\activate && uvicorn main:app --reload --host 0.0.0.0 --port 8000"
 
+:: Start Worker (background jobs: prices, character sync, backups)
+start "RG Worker" cmd /k "cd backend && venv\Scripts\activate && python worker.py"
+
 :: Start Frontend
 start "RG Frontend" cmd /k "cd frontend && npm run dev"
 